@@ -0,0 +1,96 @@
+# agent_core/bootstrap.py
+
+"""
+Khởi tạo agent graph cho app.
+
+Module này chỉ dùng thư viện chuẩn ở mức import: LangGraph, Chroma, mô hình embedding,
+google-genai... được import và nạp trong get_agent_graph(). app.py gọi
+start_background_warmup() ngay khi khởi động để việc nạp chạy ở thread nền song song
+với lần render đầu tiên; lượt hỏi đầu tiên chỉ phải chờ phần còn lại (nếu có).
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+_GRAPH = None
+_ERROR: Optional[BaseException] = None
+_LOCK = threading.Lock()
+_START_LOCK = threading.Lock()
+_THREAD: Optional[threading.Thread] = None
+_TIMINGS: Dict[str, float] = {}
+
+
+def _build_graph():
+    t0 = time.perf_counter()
+    from agent_core.prompt_registry import REGISTRY
+    from connect_SQL.connect_SQL import SQL_ENGINE
+    from tools.rag import warmup as warmup_retrieval
+    from agent_core.graph import MultiRoleAgentGraph
+    _TIMINGS["imports_ms"] = (time.perf_counter() - t0) * 1000
+
+    # Tạo engine SQL + mở sẵn kết nối ở thread nền riêng
+    SQL_ENGINE.warmup_in_background()
+    t1 = time.perf_counter()
+    # Parse sẵn prompt/tool một lần khi khởi động
+    REGISTRY.warmup()
+    # Nạp sẵn mô hình embedding, Chroma/chỉ mục vector, BM25 và reranker
+    warmup_retrieval()
+    _TIMINGS["warmup_ms"] = (time.perf_counter() - t1) * 1000
+
+    t2 = time.perf_counter()
+    graph = MultiRoleAgentGraph()
+    _TIMINGS["graph_ms"] = (time.perf_counter() - t2) * 1000
+    _TIMINGS["total_ms"] = (time.perf_counter() - t0) * 1000
+    print(f"Agent graph sẵn sàng sau {_TIMINGS['total_ms']:.0f}ms "
+          f"(import {_TIMINGS['imports_ms']:.0f}ms, warmup {_TIMINGS['warmup_ms']:.0f}ms, "
+          f"graph {_TIMINGS['graph_ms']:.0f}ms)")
+    return graph
+
+
+def get_agent_graph():
+    """
+    MultiRoleAgentGraph dùng chung cho process; chờ nếu đang được nạp ở thread nền.
+    """
+    global _GRAPH, _ERROR
+    if _GRAPH is not None:
+        return _GRAPH
+    with _LOCK:
+        if _GRAPH is None:
+            try:
+                _GRAPH = _build_graph()
+                _ERROR = None
+            except BaseException as e:
+                _ERROR = e
+                raise
+    return _GRAPH
+
+
+def _background() -> None:
+    try:
+        get_agent_graph()
+    except Exception as e:
+        # Lượt hỏi đầu tiên sẽ thử nạp lại và báo lỗi
+        print(f"⚠️ Khởi tạo nền agent graph thất bại: {e}")
+
+
+def start_background_warmup() -> None:
+    """
+    Bắt đầu nạp agent graph ở thread nền (gọi nhiều lần cũng chỉ chạy một lần).
+    """
+    global _THREAD
+    if _GRAPH is not None or (_THREAD is not None and _THREAD.is_alive()):
+        return
+    with _START_LOCK:
+        if _GRAPH is None and (_THREAD is None or not _THREAD.is_alive()):
+            _THREAD = threading.Thread(target=_background, name="agent-warmup", daemon=True)
+            _THREAD.start()
+
+
+def warmup_status() -> Dict[str, Any]:
+    return {
+        "ready": _GRAPH is not None,
+        "running": _THREAD is not None and _THREAD.is_alive(),
+        "error": repr(_ERROR) if _ERROR else None,
+        **_TIMINGS,
+    }
@@ -0,0 +1,196 @@
+# agent_core/checkpoint.py
+
+"""
+Các chế độ checkpoint cho MultiRoleAgentGraph.
+
+- "memory": BoundedMemorySaver — giữ trong RAM, mỗi session một thread,
+  giới hạn số thread (LRU) + thời gian sống (TTL), chỉ giữ checkpoint mới nhất.
+- "sqlite": SessionSqliteSaver — lưu ra file SQLite theo session_id
+  (cần gói tuỳ chọn langgraph-checkpoint-sqlite).
+- "none": không checkpoint.
+
+Chọn bằng biến môi trường AGENT_CHECKPOINT_MODE.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Sequence
+
+from langgraph.checkpoint.memory import MemorySaver
+
+CHECKPOINT_MODE = os.getenv("AGENT_CHECKPOINT_MODE", "memory")
+CHECKPOINT_MAX_THREADS = int(os.getenv("AGENT_CHECKPOINT_MAX_THREADS", "500"))
+CHECKPOINT_TTL_SECONDS = float(os.getenv("AGENT_CHECKPOINT_TTL_SECONDS", str(4 * 3600)))
+CHECKPOINT_SQLITE_PATH = os.getenv("AGENT_CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite")
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver có giới hạn: tối đa `max_threads` thread (LRU), thread không được
+    dùng quá `ttl_seconds` sẽ bị xoá. prune(..., "keep_latest") xoá các checkpoint cũ
+    của một thread để bộ nhớ không tăng theo số lượt hỏi.
+    """
+    def __init__(self, max_threads: int = CHECKPOINT_MAX_THREADS, ttl_seconds: float = CHECKPOINT_TTL_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self._access: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------
+    # 🧹 LRU / TTL
+    # ------------------------------------------
+    def _touch(self, config) -> None:
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._access[thread_id] = now
+            self._access.move_to_end(thread_id)
+            self._evict(now, keep=thread_id)
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        expired = [tid for tid, ts in self._access.items() if tid != keep and now - ts > self.ttl_seconds]
+        for tid in expired:
+            self.delete_thread(tid)
+        while len(self._access) > self.max_threads:
+            oldest = next(iter(self._access))
+            if oldest == keep:
+                break
+            self.delete_thread(oldest)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._access.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def get_tuple(self, config):
+        result = super().get_tuple(config)
+        if result is not None:
+            self._touch(config)
+        return result
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        """
+        keep_latest: chỉ giữ checkpoint mới nhất của mỗi namespace, cùng các blob
+        mà checkpoint đó tham chiếu. delete: xoá toàn bộ thread.
+        (Graph không dùng DeltaChannel nên cắt chuỗi cha là an toàn.)
+        """
+        with self._lock:
+            for thread_id in thread_ids:
+                if strategy == "delete":
+                    self.delete_thread(thread_id)
+                    continue
+                namespaces = self.storage.get(thread_id)
+                if not namespaces:
+                    continue
+                keep_blobs = set()
+                keep_checkpoints = set()
+                for ns, checkpoints in namespaces.items():
+                    if not checkpoints:
+                        continue
+                    latest_id = max(checkpoints)
+                    latest = checkpoints[latest_id]
+                    namespaces[ns] = {latest_id: (latest[0], latest[1], None)}
+                    keep_checkpoints.add((ns, latest_id))
+                    saved = self.serde.loads_typed(latest[0])
+                    for channel, version in saved.get("channel_versions", {}).items():
+                        keep_blobs.add((thread_id, ns, channel, version))
+                for key in list(self.blobs.keys()):
+                    if key[0] == thread_id and key not in keep_blobs:
+                        del self.blobs[key]
+                for key in list(self.writes.keys()):
+                    if key[0] == thread_id and (key[1], key[2]) not in keep_checkpoints:
+                        del self.writes[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self._access),
+                "checkpoints": sum(len(c) for ns in self.storage.values() for c in ns.values()),
+                "blobs": len(self.blobs),
+            }
+
+
+def _build_sqlite_saver(path: str):
+    """
+    SqliteSaver theo session_id. Các hàm async chạy bản sync trong thread
+    để dùng chung được cho cả run và arun.
+    """
+    import sqlite3
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            "❌ AGENT_CHECKPOINT_MODE=sqlite cần gói 'langgraph-checkpoint-sqlite'."
+        ) from e
+
+    class SessionSqliteSaver(SqliteSaver):
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+            )
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        def prune(self, thread_ids: Iterable[str], *, strategy: str = "keep_latest") -> None:
+            # checkpoint_id (uuid6) tăng dần theo thời gian -> MAX là mới nhất
+            with self.cursor() as cur:
+                for thread_id in thread_ids:
+                    if strategy == "delete":
+                        cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+                        cur.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+                        continue
+                    for table in ("writes", "checkpoints"):
+                        cur.execute(
+                            f"""
+                            DELETE FROM {table}
+                            WHERE thread_id = ?
+                              AND checkpoint_id < (
+                                  SELECT MAX(c.checkpoint_id) FROM checkpoints c
+                                  WHERE c.thread_id = {table}.thread_id
+                                    AND c.checkpoint_ns = {table}.checkpoint_ns
+                              )
+                            """,
+                            (str(thread_id),),
+                        )
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SessionSqliteSaver(conn)
+
+
+def build_checkpointer(mode: Optional[str] = None) -> Any:
+    """
+    Tạo checkpointer theo chế độ: "memory" | "sqlite" | "none".
+    """
+    mode = (mode or CHECKPOINT_MODE).strip().lower()
+    if mode in ("none", "off", ""):
+        return None
+    if mode == "sqlite":
+        return _build_sqlite_saver(CHECKPOINT_SQLITE_PATH)
+    if mode == "memory":
+        return BoundedMemorySaver()
+    raise ValueError(f"❌ AGENT_CHECKPOINT_MODE không hợp lệ: {mode}")
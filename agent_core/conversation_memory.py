@@ -0,0 +1,217 @@
+# agent_core/conversation_memory.py
+
+"""
+Bộ nhớ hội thoại dạng tóm tắt cuốn chiếu (rolling summary).
+
+- Mỗi session có một bản tóm tắt đã lưu (SQLite) kèm id của lượt hội thoại
+  cuối cùng mà bản tóm tắt đã bao gồm (last_exchange_id).
+- Khi trả lời, memory_loader chỉ đọc bản tóm tắt + các lượt mới chưa tóm tắt
+  (nguyên văn) — không gọi LLM trên đường trả lời.
+- Sau khi câu trả lời đã gửi và ghi log, schedule_summary_update() chạy nền:
+  chỉ tóm tắt các lượt mới, và chỉ khi phần chưa tóm tắt vượt ngưỡng
+  (SUMMARY_MIN_EXCHANGES lượt hoặc SUMMARY_MIN_CHARS ký tự).
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from connect_SQL.store import get_conversation_store
+from utils.llm_wrapper import GeminiChatParagraphSummarizer
+from utils.metrics import METRICS
+
+SUMMARY_STORE_PATH = os.getenv("SUMMARY_STORE_PATH", "summaries.sqlite")
+# Số lượt chưa tóm tắt tối đa đưa nguyên văn vào prompt (giữ như _load_memory cũ: TOP 3)
+MEMORY_MAX_EXCHANGES = int(os.getenv("MEMORY_MAX_EXCHANGES", "3"))
+# Chỉ dùng lịch sử trong khoảng thời gian này (giống DATEADD(HOUR, -4, ...) cũ)
+MEMORY_WINDOW_HOURS = int(os.getenv("MEMORY_WINDOW_HOURS", "4"))
+SUMMARY_MIN_EXCHANGES = int(os.getenv("SUMMARY_MIN_EXCHANGES", "3"))
+SUMMARY_MIN_CHARS = int(os.getenv("SUMMARY_MIN_CHARS", "2000"))
+# Bản tóm tắt giữ tối đa N đoạn gần nhất (mỗi lượt hội thoại một đoạn)
+SUMMARY_MAX_PARAGRAPHS = int(os.getenv("SUMMARY_MAX_PARAGRAPHS", "6"))
+SUMMARY_FETCH_LIMIT = 50
+
+
+class SummaryStore:
+    """
+    Lưu {session_id: (summary, last_exchange_id, updated_at)} trong SQLite. Thread-safe.
+    """
+    def __init__(self, path: str = SUMMARY_STORE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_summary (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    last_exchange_id INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, last_exchange_id, updated_at FROM session_summary WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"summary": row[0], "last_exchange_id": row[1], "updated_at": row[2]}
+
+    def put(self, session_id: str, summary: str, last_exchange_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO session_summary (session_id, summary, last_exchange_id, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    summary = excluded.summary,
+                    last_exchange_id = excluded.last_exchange_id,
+                    updated_at = excluded.updated_at
+                """,
+                (session_id, summary, int(last_exchange_id), time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM session_summary WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+_STORE: Optional[SummaryStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_summary_store() -> SummaryStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = SummaryStore()
+    return _STORE
+
+
+# ------------------------------------------
+# 📜 Đọc lịch sử từ kho hội thoại
+# ------------------------------------------
+def load_exchanges(session_id: str, after_id: int = 0, limit: int = MEMORY_MAX_EXCHANGES) -> List[Dict[str, Any]]:
+    """
+    Các lượt hội thoại có id > after_id trong cửa sổ thời gian, tối đa `limit`
+    lượt gần nhất, theo thứ tự cũ -> mới.
+    """
+    if not session_id:
+        return []
+
+    try:
+        return get_conversation_store().recent_exchanges(
+            session_id, after_id=after_id, limit=limit, window_hours=MEMORY_WINDOW_HOURS,
+        )
+    except Exception as e:
+        print(f"ERROR: Không thể tải memory. Lỗi: {e}")
+        return []
+
+
+def format_exchanges(exchanges: List[Dict[str, Any]]) -> str:
+    formatted_history = []
+    for exchange in exchanges:
+        formatted_history.append(f"User: {exchange['user']}")
+        formatted_history.append(f"Assistant: {exchange['chatbot']}")
+    return "\n".join(formatted_history)
+
+
+def _fresh_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    record = get_summary_store().get(session_id)
+    if record and time.time() - record["updated_at"] > MEMORY_WINDOW_HOURS * 3600:
+        return None
+    return record
+
+
+def build_conversation_context(session_id: str) -> str:
+    """
+    Chuỗi lịch sử chèn vào prompt: bản tóm tắt đã lưu + các lượt mới nguyên văn.
+    Không gọi LLM.
+    """
+    if not session_id:
+        return ""
+    record = _fresh_summary(session_id)
+    last_id = record["last_exchange_id"] if record else 0
+    pending = load_exchanges(session_id, after_id=last_id)
+
+    parts = []
+    if record and record["summary"]:
+        parts.append(record["summary"])
+    if pending:
+        parts.append(format_exchanges(pending))
+    METRICS.increment("memory.summary_hit" if record else "memory.summary_miss")
+    return "\n".join(parts)
+
+
+# ------------------------------------------
+# 🔁 Cập nhật tóm tắt (chạy nền)
+# ------------------------------------------
+def update_summary(session_id: str, summarizer: Optional[GeminiChatParagraphSummarizer] = None) -> bool:
+    """
+    Tóm tắt các lượt mới (id > last_exchange_id) và nối vào bản tóm tắt đã lưu.
+    Trả về True nếu đã gọi LLM và lưu bản mới.
+    """
+    record = _fresh_summary(session_id)
+    last_id = record["last_exchange_id"] if record else 0
+    pending = load_exchanges(session_id, after_id=last_id, limit=SUMMARY_FETCH_LIMIT)
+    if not pending:
+        return False
+
+    pending_chars = sum(len(e["user"]) + len(e["chatbot"]) for e in pending)
+    if len(pending) < SUMMARY_MIN_EXCHANGES and pending_chars < SUMMARY_MIN_CHARS:
+        METRICS.increment("memory.summary_skipped")
+        return False
+
+    summarizer = summarizer or GeminiChatParagraphSummarizer()
+    new_paragraphs = summarizer.summarize_each_exchange(
+        chat_json=[{"user": e["user"], "chatbot": e["chatbot"]} for e in pending]
+    )
+    if not new_paragraphs or new_paragraphs.startswith("[Gemini"):
+        return False
+
+    paragraphs = (record["summary"].splitlines() if record else []) + new_paragraphs.splitlines()
+    paragraphs = [p for p in paragraphs if p.strip()][-SUMMARY_MAX_PARAGRAPHS:]
+    get_summary_store().put(session_id, "\n".join(paragraphs), pending[-1]["id"])
+    METRICS.increment("memory.summary_updated")
+    return True
+
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+_PENDING: set = set()
+_PENDING_LOCK = threading.Lock()
+
+
+def _run_update(session_id: str) -> bool:
+    try:
+        with METRICS.span("summary_update", kind="background", session_id=session_id):
+            return update_summary(session_id)
+    except Exception as e:
+        print(f"⚠️ Không thể cập nhật tóm tắt cho session {session_id}: {e}")
+        return False
+    finally:
+        with _PENDING_LOCK:
+            _PENDING.discard(session_id)
+
+
+def schedule_summary_update(session_id: str) -> Optional[Future]:
+    """
+    Gọi sau khi lượt hội thoại đã được ghi vào conversation_history.
+    Mỗi session chỉ có tối đa một lần cập nhật đang chờ.
+    """
+    if not session_id:
+        return None
+    with _PENDING_LOCK:
+        if session_id in _PENDING:
+            return None
+        _PENDING.add(session_id)
+    return _EXECUTOR.submit(_run_update, session_id)
@@ -0,0 +1,75 @@
+# agent_core/faq_shortcut.py
+
+"""
+Trả lời thẳng từ FAQ khi kết quả truy xuất gần như trùng khớp.
+
+Sau tool_executor, nếu lượt hỏi chỉ gọi một tool tìm FAQ và kết quả đứng đầu có
+similarity >= FAQ_SHORTCUT_THRESHOLD (và cách kết quả thứ hai ít nhất
+FAQ_SHORTCUT_MARGIN), answer_text đã lưu được trả về qua một template đơn giản
+(kèm source_url) thay vì gọi GeminiSynthesizerLLM để diễn đạt lại.
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from utils.metrics import METRICS
+
+FAQ_SHORTCUT_ENABLED = os.getenv("FAQ_SHORTCUT_ENABLED", "1") == "1"
+FAQ_SHORTCUT_THRESHOLD = float(os.getenv("FAQ_SHORTCUT_THRESHOLD", "0.92"))
+FAQ_SHORTCUT_MARGIN = float(os.getenv("FAQ_SHORTCUT_MARGIN", "0.02"))
+FAQ_SHORTCUT_TOOLS = {
+    name.strip() for name in os.getenv("FAQ_SHORTCUT_TOOLS", "search_project_documents").split(",") if name.strip()
+}
+# {answer}, {title}, {source_url}; "\n" trong biến môi trường được hiểu là xuống dòng
+FAQ_SHORTCUT_TEMPLATE = os.getenv("FAQ_SHORTCUT_TEMPLATE", "{answer}\\n\\nNguồn tham khảo: {source_url}").replace("\\n", "\n")
+FAQ_SHORTCUT_TEMPLATE_NO_SOURCE = os.getenv("FAQ_SHORTCUT_TEMPLATE_NO_SOURCE", "{answer}").replace("\\n", "\n")
+
+
+def pick_faq_answer(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Kết quả FAQ đủ tin cậy để trả lời thẳng, hoặc None.
+    """
+    if not FAQ_SHORTCUT_ENABLED:
+        return None
+    tool_results = state.get("tool_results") or []
+    if len(tool_results) != 1:
+        return None
+    result = tool_results[0]
+    if result.get("tool_name") not in FAQ_SHORTCUT_TOOLS or result.get("status", "ok") != "ok":
+        return None
+    hits = result.get("result")
+    if not isinstance(hits, list) or not hits or not isinstance(hits[0], dict):
+        return None
+
+    top = hits[0]
+    similarity = top.get("similarity")
+    if similarity is None or similarity < FAQ_SHORTCUT_THRESHOLD or not top.get("answer_text"):
+        return None
+    if len(hits) > 1 and isinstance(hits[1], dict) and hits[1].get("similarity") is not None:
+        # Hai FAQ gần như ngang nhau -> để LLM tổng hợp
+        if similarity - hits[1]["similarity"] < FAQ_SHORTCUT_MARGIN:
+            return None
+    return top
+
+
+# create_faq_db.py điền 'N/A' cho source_url bị thiếu (metadata Chroma không nhận None)
+_MISSING_SOURCE_VALUES = {"", "n/a", "none", "null"}
+
+
+def _source_url(hit: Dict[str, Any]) -> str:
+    source_url = str(hit.get("source_url") or "").strip()
+    return "" if source_url.lower() in _MISSING_SOURCE_VALUES else source_url
+
+
+def render_faq_answer(hit: Dict[str, Any]) -> str:
+    source_url = _source_url(hit)
+    template = FAQ_SHORTCUT_TEMPLATE if source_url else FAQ_SHORTCUT_TEMPLATE_NO_SOURCE
+    return template.format(
+        answer=(hit.get("answer_text") or "").strip(),
+        title=hit.get("title") or "",
+        source_url=source_url,
+    ).strip()
+
+
+def record_shortcut(taken: bool) -> None:
+    METRICS.increment("faq_shortcut.hit" if taken else "faq_shortcut.miss")
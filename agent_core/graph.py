@@ -1,64 +1,165 @@
+import time
 import uuid
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, Iterator, AsyncIterator, Optional, Tuple
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableConfig
 from agent_core.state import MultiRoleAgentState
+from agent_core.checkpoint import build_checkpointer
+from agent_core.semantic_cache import get_answer_cache, is_cacheable, should_bypass
 from agent_core.node import (
     user_input,
+    prompt_loader,
+    memory_loader,
     role_manager,
+    route_context_loaders,
+    intent_router,
+    route_after_context,
+    route_after_tools,
     task_analyzer,
     tool_executor,
     llm_response,
+    faq_answer,
+    aprompt_loader,
+    amemory_loader,
+    aintent_router,
+    atask_analyzer,
+    atool_executor,
+    allm_response,
+    stream_llm_response,
+    astream_llm_response,
 )
+from utils.metrics import METRICS
+
+def _changed_keys(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    So sánh state trước/sau khi node chạy, trả về các key được gán giá trị mới.
+    """
+    return {k: v for k, v in after.items() if k not in before or before[k] is not v}
+
 
 class MultiRoleAgentGraph:
-    def __init__(self):
-   
-        self.graph = StateGraph(MultiRoleAgentState)
-        self.memory = MemorySaver()
+    def __init__(self, checkpoint_mode: Optional[str] = None):
+
+        # "memory" (LRU/TTL, mặc định) | "sqlite" | "none" — xem agent_core/checkpoint.py
+        self.memory = build_checkpointer(checkpoint_mode)
+
+        # Cache câu trả lời theo ngữ nghĩa (None nếu ANSWER_CACHE_ENABLED=0) — xem agent_core/semantic_cache.py
+        self.answer_cache = get_answer_cache()
+
         # ------------------------------------------
-        # 🧩 Thêm các node
+        # 🧩 Các node: tên -> (bản sync, bản async)
         # ------------------------------------------
-        self.graph.add_node("user_input", self._wrap_node(user_input))
-        self.graph.add_node("role_manager", self._wrap_node(role_manager))
-        self.graph.add_node("task_analyzer", self._wrap_node(task_analyzer))
-        self.graph.add_node("tool_executor", self._wrap_node(tool_executor))
-        self.graph.add_node("llm_response", self._wrap_node(llm_response))
+        self.nodes = {
+            "user_input": (user_input, None),
+            "prompt_loader": (prompt_loader, aprompt_loader),
+            "memory_loader": (memory_loader, amemory_loader),
+            "intent_router": (intent_router, aintent_router),
+            "role_manager": (role_manager, None),
+            "task_analyzer": (task_analyzer, atask_analyzer),
+            "tool_executor": (tool_executor, atool_executor),
+            "llm_response": (llm_response, allm_response),
+            "faq_answer": (faq_answer, None),
+        }
 
         # ------------------------------------------
-        # 🔗 Định nghĩa luồng chuyển tiếp
+        # 🚀 Biên dịch đồ thị (sync cho run, async cho arun)
         # ------------------------------------------
-        self.graph.set_entry_point("user_input")
-        self.graph.add_edge("user_input", "role_manager")
-        self.graph.add_edge("role_manager", "task_analyzer")
-        self.graph.add_edge("task_analyzer", "tool_executor")
-        self.graph.add_edge("tool_executor", "llm_response")
-        self.graph.add_edge("llm_response", END)
+        self.graph = self._build_graph(use_async=False)
+        self.app = self.graph.compile(checkpointer=self.memory)
+
+        self.async_graph = self._build_graph(use_async=True)
+        self.async_app = self.async_graph.compile(checkpointer=self.memory)
+
+        # Bản dừng sau tool_executor (hoặc faq_answer), dùng cho stream: câu trả lời được sinh ngoài graph
+        self.prepare_app = self._build_graph(use_async=False, include_response=False).compile(checkpointer=self.memory)
+        self.async_prepare_app = self._build_graph(use_async=True, include_response=False).compile(checkpointer=self.memory)
+
+    def _build_graph(self, use_async: bool, include_response: bool = True) -> StateGraph:
+        graph = StateGraph(MultiRoleAgentState)
 
         # ------------------------------------------
-        # 🚀 Biên dịch đồ thị
+        # 🧩 Thêm các node
         # ------------------------------------------
-        self.app = self.graph.compile(checkpointer=self.memory)
+        for name, (sync_func, async_func) in self.nodes.items():
+            if name == "llm_response" and not include_response:
+                continue
+            if use_async and async_func is not None:
+                graph.add_node(name, self._wrap_async_node(async_func, name))
+            else:
+                graph.add_node(name, self._wrap_node(sync_func, name))
+
+        # ------------------------------------------
+        # 🔗 Định nghĩa luồng chuyển tiếp
+        # ------------------------------------------
+        graph.set_entry_point("user_input")
+        # Fan-out: prompt/tool (tĩnh), memory (SQL + tóm tắt) và intent_router chạy song song,
+        # session mới bỏ qua nhánh memory.
+        graph.add_conditional_edges(
+            "user_input",
+            route_context_loaders,
+            ["prompt_loader", "memory_loader", "intent_router"],
+        )
+        # Fan-in: role_manager chạy một lần sau khi các nhánh của cùng bước kết thúc
+        graph.add_edge("prompt_loader", "role_manager")
+        graph.add_edge("memory_loader", "role_manager")
+        graph.add_edge("intent_router", "role_manager")
+        # Router đủ tự tin -> bỏ qua task_analyzer
+        graph.add_conditional_edges(
+            "role_manager",
+            route_after_context,
+            ["task_analyzer", "tool_executor"],
+        )
+        graph.add_edge("task_analyzer", "tool_executor")
+        # Kết quả FAQ gần như trùng khớp -> faq_answer, bỏ qua llm_response
+        graph.add_conditional_edges(
+            "tool_executor",
+            route_after_tools,
+            {"faq_answer": "faq_answer", "llm_response": "llm_response" if include_response else END},
+        )
+        graph.add_edge("faq_answer", END)
+        if include_response:
+            graph.add_edge("llm_response", END)
+        return graph
 
     # ------------------------------------------
     # 📦 Gói node để LangGraph có thể xử lý được
     # ------------------------------------------
-    def _wrap_node(self, func):
+    def _wrap_node(self, func, name: str):
         """
         LangGraph yêu cầu node nhận state và trả về state.
         Trong khi node của ta chỉ cập nhật state trực tiếp (in-place),
-        nên cần bọc lại để trả về state sau khi cập nhật.
+        nên cần bọc lại để trả về phần state đã thay đổi.
+        Chỉ trả các key bị thay đổi để các nhánh song song không ghi đè lên nhau
+        (và reducer như `add` của tool_results không bị cộng lặp).
+        Đồng thời mở một span METRICS cho node (thời gian, số lần gọi LLM, lỗi).
+        """
+        def wrapped(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+            run_id = (config or {}).get("configurable", {}).get("run_id")
+            before = dict(state)
+            with METRICS.span(name, kind="node", run_id=run_id):
+                func(state)
+            return _changed_keys(before, state)
+        return wrapped
+
+    def _wrap_async_node(self, func, name: str):
+        """
+        Giống _wrap_node nhưng cho node async (dùng với ainvoke).
         """
-        def wrapped(state: Dict[str, Any]) -> Dict[str, Any]:
-            func(state)
-            return state
+        async def wrapped(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+            run_id = (config or {}).get("configurable", {}).get("run_id")
+            before = dict(state)
+            with METRICS.span(name, kind="node", run_id=run_id):
+                await func(state)
+            return _changed_keys(before, state)
         return wrapped
 
 
     def create_new_state(self, user_question: str,session_id: str) -> MultiRoleAgentState:
         """
         Mỗi lần người dùng hỏi, tạo một state hoàn toàn mới,
-        tránh dùng lại dữ liệu cũ trong bộ nhớ LangGraph.
+        tránh dùng lại dữ liệu cũ trong bộ nhớ LangGraph
+        (tool_results=None để xoá kết quả tool của lượt trước trong cùng thread).
         """
         return {
             "user_input": user_question,
@@ -67,24 +168,276 @@ class MultiRoleAgentGraph:
             "base_prompt": None,
             "tools": None,
             "llm_analysis": None,
+            "route": None,
             "required_tools": [],
-            "tool_results": [],
+            "tool_results": None,
+            "faq_hit": None,
             "final_answer": None,
         }
 
     # ------------------------------------------
     # 🚀 Chạy đồ thị
     # ------------------------------------------
+    def _run_config(self, state: MultiRoleAgentState) -> Dict[str, Any]:
+        """
+        thread_id theo session_id để checkpoint của session được dùng lại giữa các lượt;
+        session chưa có id dùng thread ngẫu nhiên. run_id luôn riêng cho mỗi lượt (metrics).
+        """
+        run_id = str(uuid.uuid4())
+        thread_id = state.get("session_id") or f"anon-{run_id}"
+        return {"configurable": {"thread_id": thread_id, "run_id": run_id}}
+
+    def _after_run(self, config: Dict[str, Any]) -> None:
+        """
+        Chỉ giữ checkpoint mới nhất của thread; thread ẩn danh xoá luôn vì không ai đọc lại.
+        """
+        if self.memory is None:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        try:
+            if thread_id.startswith("anon-"):
+                self.memory.delete_thread(thread_id)
+            else:
+                self.memory.prune([thread_id], strategy="keep_latest")
+        except NotImplementedError:
+            pass
+
+    # ------------------------------------------
+    # 💾 Cache câu trả lời
+    # ------------------------------------------
+    def _cache_lookup(self, state: MultiRoleAgentState) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """
+        Trả về (state cuối cùng dựng từ cache nếu trúng, embedding câu hỏi để lưu sau).
+        Cache chỉ để tăng tốc: lỗi (nạp mô hình, hàng đợi embedding đầy...) thì bỏ qua cache.
+        """
+        if self.answer_cache is None or should_bypass(state) or not state.get("user_input"):
+            return None, None
+        try:
+            hit, embedding = self.answer_cache.lookup(state["user_input"])
+        except Exception as e:
+            METRICS.increment("semantic_cache.error")
+            print(f"⚠️ Tra cache câu trả lời lỗi, chạy graph bình thường: {e}")
+            return None, None
+        if hit is None:
+            return None, embedding
+        print(f"Trúng cache câu trả lời (similarity={hit['similarity']}): {hit['question']}")
+        final_state = dict(state)
+        final_state["final_answer"] = hit["final_answer"]
+        final_state["llm_analysis"] = hit["llm_analysis"]
+        final_state["route"] = "cache"
+        return final_state, embedding
+
+    def _cache_store(self, state: MultiRoleAgentState, final_state: Dict[str, Any], embedding: Any) -> None:
+        if self.answer_cache is None or should_bypass(state) or not is_cacheable(state, final_state):
+            return
+        try:
+            self.answer_cache.store(
+                state["user_input"],
+                final_state["final_answer"],
+                llm_analysis=final_state.get("llm_analysis"),
+                embedding=embedding,
+            )
+        except Exception as e:
+            METRICS.increment("semantic_cache.error")
+            print(f"⚠️ Lưu cache câu trả lời lỗi: {e}")
+
+    def _save_streamed_answer(self, config: Dict[str, Any], state: Dict[str, Any]) -> None:
+        """
+        Câu trả lời stream được sinh ngoài graph (prepare_app dừng trước llm_response):
+        ghi final_answer vào checkpoint của thread để get_session_state thấy được.
+        """
+        if self.memory is None or config["configurable"]["thread_id"].startswith("anon-"):
+            return
+        try:
+            self.prepare_app.update_state(config, {"final_answer": state.get("final_answer", "")}, as_node="tool_executor")
+        except Exception as e:
+            METRICS.increment("checkpoint.save_error")
+            print(f"⚠️ Không ghi được câu trả lời stream vào checkpoint: {e}")
+
+    def get_session_state(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        State cuối cùng của session (từ checkpoint), None nếu không có/đã bị xoá.
+        """
+        if self.memory is None or not session_id:
+            return None
+        snapshot = self.app.get_state({"configurable": {"thread_id": session_id}})
+        return snapshot.values or None
+
     def run(self, state: MultiRoleAgentState) -> Dict[str, Any]:
         """
         Nhận vào 1 state (dict) và trả ra state cuối cùng sau khi chạy qua graph.
+        Câu hỏi đã có trong cache câu trả lời thì trả về ngay, không chạy graph.
         """
-        # Dùng thread_id ngẫu nhiên để tránh lưu checkpoint cũ
-        thread_id = str(uuid.uuid4())
+        cached, embedding = self._cache_lookup(state)
+        if cached is not None:
+            return cached
 
-        final_state = self.app.invoke(
-            state,
-            config={"configurable": {"thread_id": thread_id}},
-        )
+        config = self._run_config(state)
+        run_id = config["configurable"]["run_id"]
 
+        with METRICS.span("graph", kind="run", run_id=run_id, session_id=state.get("session_id", "")):
+            final_state = self.app.invoke(state, config=config)
+
+        self._after_run(config)
+        self._cache_store(state, final_state, embedding)
         return final_state
+
+    async def arun(self, state: MultiRoleAgentState) -> Dict[str, Any]:
+        """
+        Bản async của run: các lời gọi Gemini dùng generate_content_async,
+        SQL và embedding chạy trong thread pool, nên một event loop có thể
+        phục vụ nhiều hội thoại cùng lúc.
+        """
+        cached, embedding = await asyncio.to_thread(self._cache_lookup, state)
+        if cached is not None:
+            return cached
+
+        config = self._run_config(state)
+        run_id = config["configurable"]["run_id"]
+
+        with METRICS.span("graph", kind="run", run_id=run_id, session_id=state.get("session_id", "")):
+            final_state = await self.async_app.ainvoke(state, config=config)
+
+        await asyncio.to_thread(self._after_run, config)
+        self._cache_store(state, final_state, embedding)
+        return final_state
+
+    # Tên quen thuộc theo API của LangGraph
+    ainvoke = arun
+
+    def stream(self, state: MultiRoleAgentState) -> "AnswerStream":
+        """
+        Chạy graph tới tool_executor rồi stream câu trả lời từ GeminiSynthesizerLLM.
+        Duyệt (for / async for) đối tượng trả về để nhận từng đoạn; khi duyệt xong,
+        `final_state` chứa state cuối cùng (có final_answer) để ghi log.
+        """
+        return AnswerStream(self, state)
+
+
+class AnswerStream:
+    """
+    Câu trả lời dạng stream của một lượt hỏi.
+
+    - prepare()/aprepare(): chạy phần graph trước llm_response (có thể gọi trước
+      trong spinner); nếu không gọi, lần duyệt đầu tiên sẽ tự chạy.
+      Câu hỏi trúng cache câu trả lời thì không chạy graph, stream trả về cả câu một lần;
+      câu trả lời thẳng từ FAQ (route="faq") cũng được trả về một lần, không gọi LLM.
+    - Duyệt bằng for (sync) hoặc async for (async) để nhận từng đoạn text.
+    - final_state: state cuối cùng, chỉ có sau khi stream kết thúc.
+    """
+    def __init__(self, agent_graph: MultiRoleAgentGraph, state: MultiRoleAgentState):
+        self.agent_graph = agent_graph
+        self.initial_state = state
+        self.config = agent_graph._run_config(state)
+        self.run_id = self.config["configurable"]["run_id"]
+        self.final_state: Optional[Dict[str, Any]] = None
+        self._prepared_state: Optional[Dict[str, Any]] = None
+        self._cached_state: Optional[Dict[str, Any]] = None
+        self._query_embedding = None
+        self._run_span = None
+        self._t_start: Optional[float] = None
+
+    def _start_run(self) -> None:
+        if self._run_span is None:
+            self._run_span = METRICS.start_span(
+                "graph", kind="run", run_id=self.run_id,
+                session_id=self.initial_state.get("session_id", ""), streaming=True,
+            )
+
+    def _finish_run(self, error: Optional[BaseException] = None) -> None:
+        if self._run_span is not None:
+            METRICS.finish_span(self._run_span, error)
+            self._run_span = None
+            self.agent_graph._after_run(self.config)
+
+    def prepare(self) -> Dict[str, Any]:
+        if self._prepared_state is None:
+            self._t_start = time.perf_counter()
+            self._cached_state, self._query_embedding = self.agent_graph._cache_lookup(self.initial_state)
+            if self._cached_state is not None:
+                self._prepared_state = self._cached_state
+                return self._prepared_state
+            self._start_run()
+            try:
+                self._prepared_state = self.agent_graph.prepare_app.invoke(self.initial_state, config=self.config)
+            except BaseException as e:
+                self._finish_run(e)
+                raise
+        return self._prepared_state
+
+    async def aprepare(self) -> Dict[str, Any]:
+        if self._prepared_state is None:
+            self._t_start = time.perf_counter()
+            self._cached_state, self._query_embedding = await asyncio.to_thread(
+                self.agent_graph._cache_lookup, self.initial_state
+            )
+            if self._cached_state is not None:
+                self._prepared_state = self._cached_state
+                return self._prepared_state
+            self._start_run()
+            try:
+                self._prepared_state = await self.agent_graph.async_prepare_app.ainvoke(self.initial_state, config=self.config)
+            except BaseException as e:
+                self._finish_run(e)
+                raise
+        return self._prepared_state
+
+    def _first_chunk(self) -> None:
+        # Tính từ lúc bắt đầu chạy graph, gồm cả phần prepare
+        METRICS.observe("stream.time_to_first_token", (time.perf_counter() - self._t_start) * 1000)
+
+    def __iter__(self) -> Iterator[str]:
+        state = dict(self.prepare())
+        if self._cached_state is not None:
+            self._first_chunk()
+            yield state["final_answer"]
+            self.final_state = state
+            return
+        error = None
+        try:
+            if state.get("route") == "faq":
+                self._first_chunk()
+                yield state["final_answer"]
+            else:
+                with METRICS.span("llm_response", kind="node", run_id=self.run_id, streaming=True):
+                    for i, chunk in enumerate(stream_llm_response(state)):
+                        if i == 0:
+                            self._first_chunk()
+                        yield chunk
+                self.agent_graph._save_streamed_answer(self.config, state)
+            self.final_state = state
+            self.agent_graph._cache_store(self.initial_state, state, self._query_embedding)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish_run(error)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        state = dict(await self.aprepare())
+        if self._cached_state is not None:
+            self._first_chunk()
+            yield state["final_answer"]
+            self.final_state = state
+            return
+        error = None
+        try:
+            if state.get("route") == "faq":
+                self._first_chunk()
+                yield state["final_answer"]
+            else:
+                with METRICS.span("llm_response", kind="node", run_id=self.run_id, streaming=True):
+                    i = 0
+                    async for chunk in astream_llm_response(state):
+                        if i == 0:
+                            self._first_chunk()
+                        i += 1
+                        yield chunk
+                await asyncio.to_thread(self.agent_graph._save_streamed_answer, self.config, state)
+            self.final_state = state
+            self.agent_graph._cache_store(self.initial_state, state, self._query_embedding)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish_run(error)
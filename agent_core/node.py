@@ -1,13 +1,15 @@
 from agent_core.state import MultiRoleAgentState
-from docx import Document
-from typing import List, Dict, Any
-from utils.llm_wrapper import GeminiSynthesizerLLM, GeminiAnalyzerLLM, GeminiChatParagraphSummarizer
+from typing import List, Dict, Any, Iterator, AsyncIterator
+from utils.llm_wrapper import GeminiSynthesizerLLM, GeminiAnalyzerLLM
+from agent_core.tool_runner import run_tool_calls, arun_tool_calls
+from agent_core.router import ROUTER_ENABLED, ROUTER_REQUIRE_NO_HISTORY, get_router, local_analysis, record_route
 from tools.tool_registry import TOOL_REGISTRY
-import yaml
+from agent_core.prompt_registry import REGISTRY, normalize_role_tools as _normalize_role_tools
+from agent_core.conversation_memory import build_conversation_context
+from agent_core.faq_shortcut import pick_faq_answer, render_faq_answer, record_shortcut
 import re
 import json
-from connect_SQL.connect_SQL import connect_sql
-from sqlalchemy import text
+import asyncio
 
 
 def user_input(state: MultiRoleAgentState ) -> str:
@@ -15,99 +17,19 @@ def user_input(state: MultiRoleAgentState ) -> str:
 
 
 def _load_base_prompt(state: MultiRoleAgentState ) -> str:
-    path = f"D:/Chatbot_Data4Life/v1/prompt/General_Prompt.docx"
-    doc = Document(path)
-    prompt_text = "/n".join([p.text for p in doc.paragraphs if p.text.strip()])
-    return prompt_text
+    # Prompt đã parse sẵn trong registry, tự nạp lại khi file .docx thay đổi
+    return REGISTRY.base_prompt()
 
 def _load_tool_for_role() -> List[Dict[str, Any]]:
     """
-    File YAML có dạng:
-    tools:
-      - name: search_project_documents
-        description: "Tìm kiếm dữ liệu nội bộ theo từ khóa."
-        parameters:
-          query:
-            type: string
-            required: true
-            description: "Chuỗi truy vấn hoặc từ khóa mô tả thông tin cần tìm"
-            example: "doanh thu Q2 2025 khu vực VN"
-        returns: "Danh sách bản ghi phù hợp"
+    Danh sách tool đã chuẩn hoá từ tool.yaml (xem agent_core/prompt_registry.py).
     """
+    return REGISTRY.tools()
 
-    path = f"D:/Chatbot_Data4Life/v1/prompt/tool.yaml"
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f) or {}
-
-        tools = data.get("tools", [])
-        if not isinstance(tools, list):
-            raise ValueError(f"⚠️ File YAML của role '{tool}' không đúng định dạng (tools phải là list).")
-
-        # Chuẩn hóa thông tin
-        normalized_tools = []
-        for tool in tools:
-            normalized_tools.append({
-                "name": tool.get("name"),
-                "description": tool.get("description", ""),
-                "parameters": tool.get("parameters", {}),
-                "returns": tool.get("returns", "")
-            })
-        return normalized_tools
-
-    except FileNotFoundError:
-        raise FileNotFoundError(f"❌ Không tìm thấy file YAML cho role")
-    except Exception as e:
-        raise RuntimeError(f"❌ Lỗi khi load tool cho role ")
-
-def _load_memory(session_id: str ) -> list:
-    if not session_id:
-        return ""
-  
-    query = text(f"""
-        SELECT TOP 3 user_message, bot_response
-        FROM dbo.conversation_history
-        WHERE session_id = :session_id
-          AND timestamp >= DATEADD(HOUR, -4, GETDATE())   
-        ORDER BY timestamp DESC;
-    """)
-
-    try:
-        engine = connect_sql()
-        with engine.connect() as conn:
-            result = conn.execute(
-                query,
-                {"session_id": session_id}
-            )
-            rows = result.fetchall()
-
-        print(rows)
-
-        # Đảo ngược 
-        history_records = reversed(rows)
-        formatted_history = []
-        for user_msg, bot_msg in history_records:
-            formatted_history.append(f"User: {user_msg}")
-            formatted_history.append(f"Assistant: {bot_msg}")
-        return "\n".join(formatted_history)
-
-    except Exception as e:
-        print(f"ERROR: Không thể tải memory. Lỗi: {e}")
-        return ""  
-
-def role_manager(state: MultiRoleAgentState) -> None:
-    state["tools"] = _load_tool_for_role()
-    base_prompt = _load_base_prompt(state)
-    state["base_prompt"] =  base_prompt
-
-    conversation_history = _load_memory(session_id=state.get("session_id", ""))
-    summarizer = GeminiChatParagraphSummarizer()
-    summarise_conversation_history = summarizer.summarize_each_exchange(chat_json=conversation_history)
-    state["conversation_history"] = summarise_conversation_history  
-
-    # 3. Xây dựng template để chèn memory vào prompt
+def _build_full_prompt(base_prompt: str, summarise_conversation_history: str) -> str:
+    # Xây dựng template để chèn memory vào prompt
     # Đây là cách bạn "chèn vào prompt"
-    final_prompt_template = (f"""
+    return (f"""
         {base_prompt} 
         ---
         ### LỊCH SỬ HỘI THOẠI GẦN ĐÂY:
@@ -115,29 +37,87 @@ def role_manager(state: MultiRoleAgentState) -> None:
         ---
             """)
 
-    # 4. Cập nhật state với prompt cuối cùng đã được bổ sung memory
-    state["full_prompt"] = final_prompt_template
+def prompt_loader(state: MultiRoleAgentState) -> None:
+    """
+    Nhánh tĩnh: tải danh sách tool và prompt gốc (chỉ phụ thuộc file cấu hình).
+    Chạy song song với memory_loader.
+    """
+    state["tools"] = _load_tool_for_role()
+    state["base_prompt"] = _load_base_prompt(state)
+
+async def aprompt_loader(state: MultiRoleAgentState) -> None:
+    state["tools"] = await asyncio.to_thread(_load_tool_for_role)
+    state["base_prompt"] = await asyncio.to_thread(_load_base_prompt, state)
+
+def memory_loader(state: MultiRoleAgentState) -> None:
+    """
+    Nhánh memory: bản tóm tắt đã lưu của session + các lượt mới chưa tóm tắt.
+    Không gọi LLM — bản tóm tắt được cập nhật nền sau khi trả lời
+    (xem agent_core/conversation_memory.py).
+    """
+    state["conversation_history"] = build_conversation_context(state.get("session_id", ""))
+
+async def amemory_loader(state: MultiRoleAgentState) -> None:
+    state["conversation_history"] = await asyncio.to_thread(build_conversation_context, state.get("session_id", ""))
+
+def role_manager(state: MultiRoleAgentState) -> None:
+    """
+    Điểm hợp nhất của prompt_loader và memory_loader:
+    chèn memory (nếu có) vào prompt gốc.
+    """
+    base_prompt = state.get("base_prompt") or ""
+    summarise_conversation_history = state.get("conversation_history") or ""
+
+    # Cập nhật state với prompt cuối cùng đã được bổ sung memory
+    state["full_prompt"] = _build_full_prompt(base_prompt, summarise_conversation_history)
     print("Đã tải và kết hợp memory vào prompt thành công.")
 
+def route_context_loaders(state: MultiRoleAgentState) -> List[str]:
+    """
+    Chọn các nhánh tải ngữ cảnh chạy song song sau user_input.
+    Session mới (chưa có session_id) không có lịch sử -> chỉ tải prompt/tool.
+    intent_router luôn chạy song song vì chỉ cần câu hỏi.
+    """
+    branches = ["prompt_loader", "intent_router"] if ROUTER_ENABLED else ["prompt_loader"]
+    if state.get("session_id"):
+        branches.append("memory_loader")
+    return branches
 
-def _normalize_role_tools(role_tools_raw: List[Any]) -> List[Dict[str, Any]]:
+def intent_router(state: MultiRoleAgentState) -> None:
     """
-    Chuẩn hoá role_tools: nếu item là str -> đổi thành {'name': str}
-    Nếu item là dict và có 'name' giữ nguyên.
+    Định tuyến cục bộ bằng embedding: nếu đủ tự tin, ghi sẵn required_tools
+    để bỏ qua lời gọi GeminiAnalyzerLLM (xem agent_core/router.py).
     """
-    normalized = []
-    for item in role_tools_raw or []:
-        if isinstance(item, str):
-            normalized.append({"name": item})
-        elif isinstance(item, dict):
-            if "name" in item:
-                normalized.append(item)
-            elif "tool_name" in item:
-                item["name"] = item.pop("tool_name")
-                normalized.append(item)
-            else:
-                continue
-    return normalized
+    try:
+        decision = get_router().route(state.get("user_input", ""))
+    except Exception as e:
+        print(f"⚠️ intent_router lỗi, chuyển sang task_analyzer: {e}")
+        state["route"] = "llm"
+        return
+
+    if not decision["confident"]:
+        state["route"] = "llm"
+        return
+
+    available_tools = [{"name": name} for name in TOOL_REGISTRY]
+    state["route"] = "local"
+    state["llm_analysis"] = local_analysis(decision)
+    state["required_tools"] = _validate_and_format_required_tools(decision["plan"], available_tools)
+
+async def aintent_router(state: MultiRoleAgentState) -> None:
+    await asyncio.to_thread(intent_router, state)
+
+def route_after_context(state: MultiRoleAgentState) -> str:
+    """
+    Sau role_manager: dùng plan cục bộ nếu router tự tin, ngược lại gọi task_analyzer.
+    Câu hỏi trong session đã có lịch sử luôn qua task_analyzer (nếu ROUTER_REQUIRE_NO_HISTORY).
+    """
+    use_local = state.get("route") == "local"
+    if use_local and ROUTER_REQUIRE_NO_HISTORY and state.get("conversation_history"):
+        use_local = False
+    record_route("local" if use_local else "llm")
+    return "tool_executor" if use_local else "task_analyzer"
+
 
 def _extract_json_from_text(text: str) -> Any:
     """
@@ -207,12 +187,7 @@ def _validate_and_format_required_tools(parsed_required: Any, normalized_role_to
     return result
 
 
-def task_analyzer(state: MultiRoleAgentState) -> None:
-    """
-    Node task_analyzer (in-place update).
-    - Reads: state['user_question'], state['base_prompt'], state['role_tools']
-    - Updates: state['llm_analysis'] (raw text) and state['required_tools'] (List[Dict])
-    """
+def _prepare_analysis(state: MultiRoleAgentState):
     user_question = state.get("user_input")
     base_prompt = state.get("full_prompt")
     role_tools_raw = state.get("tools", [])
@@ -223,11 +198,9 @@ def task_analyzer(state: MultiRoleAgentState) -> None:
 
     # chuẩn hoá role_tools thành list of dicts
     normalized_role_tools = _normalize_role_tools(role_tools_raw)
+    return user_question, base_prompt, normalized_role_tools
 
-    # gọi LLM
-    analyzer = GeminiAnalyzerLLM()
-    raw_response = analyzer.analyze_task(base_prompt=base_prompt, user_question=user_question, role_tools=normalized_role_tools)
-
+def _apply_analysis(state: MultiRoleAgentState, raw_response: str, normalized_role_tools: List[Dict[str, Any]]) -> None:
     state["llm_analysis"] = raw_response
     parsed = _extract_json_from_text(raw_response)
     required_raw = []
@@ -244,51 +217,85 @@ def task_analyzer(state: MultiRoleAgentState) -> None:
 
     state["required_tools"] = required_tools_normalized
 
+def task_analyzer(state: MultiRoleAgentState) -> None:
+    """
+    Node task_analyzer (in-place update).
+    - Reads: state['user_question'], state['base_prompt'], state['role_tools']
+    - Updates: state['llm_analysis'] (raw text) and state['required_tools'] (List[Dict])
+    """
+    user_question, base_prompt, normalized_role_tools = _prepare_analysis(state)
 
+    # gọi LLM
+    analyzer = GeminiAnalyzerLLM()
+    raw_response = analyzer.analyze_task(
+        base_prompt=base_prompt,
+        user_question=user_question,
+        role_tools=normalized_role_tools,
+        tool_descriptions=REGISTRY.tool_descriptions(normalized_role_tools),
+    )
+    _apply_analysis(state, raw_response, normalized_role_tools)
+
+async def atask_analyzer(state: MultiRoleAgentState) -> None:
+    """
+    Bản async của task_analyzer.
+    """
+    user_question, base_prompt, normalized_role_tools = _prepare_analysis(state)
 
-def tool_executor(state: MultiRoleAgentState) -> None:
-
-    required_tools = state.get("required_tools", [])
-    tool_results = []
-
-    for tool_info in required_tools:
-        tool_name = tool_info.get("tool_name") or tool_info.get("name")
-        params = tool_info.get("params", {})
-
-        if not tool_name:
-            continue
-        tool_func = TOOL_REGISTRY.get(tool_name)
-
-        if not tool_func:
-            tool_results.append({
-                "tool_name": tool_name,
-                "params": params,
-                "result": None
-            })
-            continue
+    analyzer = GeminiAnalyzerLLM()
+    raw_response = await analyzer.analyze_task_async(
+        base_prompt=base_prompt,
+        user_question=user_question,
+        role_tools=normalized_role_tools,
+        tool_descriptions=REGISTRY.tool_descriptions(normalized_role_tools),
+    )
+    _apply_analysis(state, raw_response, normalized_role_tools)
 
-        try:
-            result = tool_func(**params)
 
-        except Exception as e:
-            result = f"❌ Lỗi khi thực thi {tool_name}: {str(e)}"
 
-        # Lưu lại kết quả vào danh sách tool_results
-        tool_results.append({
-            "tool_name": tool_name,
-            "params": params,
-            "result": result
-        })
+def tool_executor(state: MultiRoleAgentState) -> None:
+    """
+    Chạy các tool trong required_tools song song (xem agent_core/tool_runner.py),
+    kết quả giữ nguyên thứ tự; tool lỗi/timeout được ghi lại trong từng kết quả.
+    """
+    required_tools = state.get("required_tools", [])
+    tool_results = run_tool_calls(required_tools, tool_specs=state.get("tools"))
 
     # Cập nhật state
     state["tool_results"] = tool_results
+    state["faq_hit"] = pick_faq_answer(state)
 
-def llm_response(state: MultiRoleAgentState) -> None:
+async def atool_executor(state: MultiRoleAgentState) -> None:
     """
-    Node tổng hợp kết quả cuối cùng.
-    - Dùng GeminiSynthesizerLLM để sinh câu trả lời hoàn chỉnh.
+    Bản async của tool_executor: tool (embedding + Chroma) là code đồng bộ,
+    chạy trên thread pool của tool_runner, còn event loop chỉ chờ kết quả.
+    """
+    required_tools = state.get("required_tools", [])
+    state["tool_results"] = await arun_tool_calls(required_tools, tool_specs=state.get("tools"))
+    state["faq_hit"] = pick_faq_answer(state)
+
+def route_after_tools(state: MultiRoleAgentState) -> str:
+    """
+    Sau tool_executor: kết quả FAQ gần như trùng khớp -> faq_answer (không gọi LLM),
+    ngược lại llm_response (xem agent_core/faq_shortcut.py).
+    Kết quả FAQ đã được tool_executor chọn sẵn vào state["faq_hit"] (hàm định tuyến
+    không ghi được state).
     """
+    taken = state.get("faq_hit") is not None
+    record_shortcut(taken)
+    return "faq_answer" if taken else "llm_response"
 
+def faq_answer(state: MultiRoleAgentState) -> None:
+    """
+    Trả về answer_text đã lưu của FAQ (kèm source_url) qua template, không gọi Gemini.
+    """
+    hit = state.get("faq_hit")
+    if hit is None:
+        raise ValueError("❌ faq_answer: thiếu faq_hit trong state.")
+    print(f"Trả lời thẳng từ FAQ (similarity={hit.get('similarity')}): {hit.get('title')}")
+    state["final_answer"] = render_faq_answer(hit)
+    state["route"] = "faq"
+
+def _build_synthesis_prompt(state: MultiRoleAgentState) -> str:
     base_prompt = state.get("full_prompt", "")
     user_question = state.get("user_input", "")
     tool_results = state.get("tool_results", [])
@@ -329,10 +336,58 @@ Nhiệm vụ của bạn:
 - Nếu trả về link, vẫn cần phải tóm tắt nội dung chính trong câu trả lời.
 - Nếu không có dữ liệu hoặc dữ liệu mâu thuẫn, hãy trả lời một cách trung lập.
 """
+    return system_prompt
+
+def llm_response(state: MultiRoleAgentState) -> None:
+    """
+    Node tổng hợp kết quả cuối cùng.
+    - Dùng GeminiSynthesizerLLM để sinh câu trả lời hoàn chỉnh.
+    """
+    system_prompt = _build_synthesis_prompt(state)
 
     # --- Gọi LLM tổng hợp ---
     synthesizer = GeminiSynthesizerLLM()
     final_answer = synthesizer.run(system_prompt)
 
     # --- Cập nhật vào state ---
-    state["final_answer"] = final_answer.strip()
\ No newline at end of file
+    state["final_answer"] = final_answer.strip()
+
+async def allm_response(state: MultiRoleAgentState) -> None:
+    """
+    Bản async của llm_response.
+    """
+    system_prompt = _build_synthesis_prompt(state)
+
+    synthesizer = GeminiSynthesizerLLM()
+    final_answer = await synthesizer.run_async(system_prompt)
+
+    state["final_answer"] = final_answer.strip()
+
+def stream_llm_response(state: MultiRoleAgentState) -> Iterator[str]:
+    """
+    Bản streaming của llm_response: trả từng đoạn câu trả lời,
+    ghi final_answer vào state khi stream kết thúc.
+    """
+    system_prompt = _build_synthesis_prompt(state)
+
+    synthesizer = GeminiSynthesizerLLM()
+    parts = []
+    for chunk in synthesizer.stream(system_prompt):
+        parts.append(chunk)
+        yield chunk
+
+    state["final_answer"] = "".join(parts).strip()
+
+async def astream_llm_response(state: MultiRoleAgentState) -> AsyncIterator[str]:
+    """
+    Bản async của stream_llm_response.
+    """
+    system_prompt = _build_synthesis_prompt(state)
+
+    synthesizer = GeminiSynthesizerLLM()
+    parts = []
+    async for chunk in synthesizer.astream(system_prompt):
+        parts.append(chunk)
+        yield chunk
+
+    state["final_answer"] = "".join(parts).strip()
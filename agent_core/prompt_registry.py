@@ -0,0 +1,171 @@
+# agent_core/prompt_registry.py
+
+"""
+Registry cho prompt gốc (General_Prompt.docx) và danh sách tool (tool.yaml).
+
+Mỗi file chỉ được parse một lần; kết quả đã chuẩn hoá (tool, role_tools,
+khối mô tả tool cho GeminiAnalyzerLLM) được giữ trong bộ nhớ và tự nạp lại
+khi mtime của file thay đổi. Đường dẫn lấy từ utils/paths.py.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from utils.paths import BASE_PROMPT_PATH, TOOL_MANIFEST_PATH
+from utils.llm_wrapper import render_tool_descriptions
+
+# Khoảng thời gian (giây) tối thiểu giữa 2 lần kiểm tra mtime của cùng một file
+CHECK_INTERVAL = float(os.getenv("PROMPT_REGISTRY_CHECK_INTERVAL", "2"))
+
+
+class _CachedFile:
+    """
+    Giữ kết quả parse của một file, parse lại khi mtime thay đổi.
+    """
+    def __init__(self, path: str, loader: Callable[[str], Any], check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self._value: Any = None
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return self._value
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._mtime:
+                self._value = self.loader(self.path)
+                self._mtime = mtime
+                print(f"Đã nạp lại {self.path}")
+            self._checked_at = now
+            return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._mtime = None
+
+
+def parse_base_prompt(path: str) -> str:
+    from docx import Document
+
+    doc = Document(path)
+    prompt_text = "/n".join([p.text for p in doc.paragraphs if p.text.strip()])
+    return prompt_text
+
+
+def parse_tool_manifest(path: str) -> Dict[str, Any]:
+    """
+    File YAML có dạng:
+    tools:
+      - name: search_project_documents
+        description: "Tìm kiếm dữ liệu nội bộ theo từ khóa."
+        parameters:
+          query:
+            type: string
+            required: true
+            description: "Chuỗi truy vấn hoặc từ khóa mô tả thông tin cần tìm"
+            example: "doanh thu Q2 2025 khu vực VN"
+        returns: "Danh sách bản ghi phù hợp"
+        timeout: 10            # giây, tuỳ chọn
+        max_concurrency: 4     # số lời gọi đồng thời tối đa, tuỳ chọn
+
+    Trả về {"tools", "role_tools", "tool_descriptions"} đã chuẩn hoá sẵn.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+
+        tools = data.get("tools", [])
+        if not isinstance(tools, list):
+            raise ValueError(f"⚠️ File YAML '{path}' không đúng định dạng (tools phải là list).")
+
+        # Chuẩn hóa thông tin
+        normalized_tools = []
+        for tool in tools:
+            normalized_tools.append({
+                "name": tool.get("name"),
+                "description": tool.get("description", ""),
+                "parameters": tool.get("parameters", {}),
+                "returns": tool.get("returns", ""),
+                "timeout": tool.get("timeout"),
+                "max_concurrency": tool.get("max_concurrency"),
+            })
+
+    except FileNotFoundError:
+        raise FileNotFoundError(f"❌ Không tìm thấy file YAML cho role: {path}")
+    except Exception as e:
+        raise RuntimeError(f"❌ Lỗi khi load tool cho role: {e}")
+
+    role_tools = normalize_role_tools([dict(t) for t in normalized_tools])
+    return {
+        "tools": normalized_tools,
+        "role_tools": role_tools,
+        "tool_descriptions": render_tool_descriptions(role_tools),
+    }
+
+
+def normalize_role_tools(role_tools_raw: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Chuẩn hoá role_tools: nếu item là str -> đổi thành {'name': str}
+    Nếu item là dict và có 'name' giữ nguyên.
+    """
+    normalized = []
+    for item in role_tools_raw or []:
+        if isinstance(item, str):
+            normalized.append({"name": item})
+        elif isinstance(item, dict):
+            if "name" in item:
+                normalized.append(item)
+            elif "tool_name" in item:
+                item["name"] = item.pop("tool_name")
+                normalized.append(item)
+            else:
+                continue
+    return normalized
+
+
+class PromptRegistry:
+    """
+    Truy cập prompt/tool đã parse. Các object trả về được dùng chung giữa các
+    request — chỉ đọc, không sửa tại chỗ.
+    """
+    def __init__(self, base_prompt_path: str = BASE_PROMPT_PATH, tool_manifest_path: str = TOOL_MANIFEST_PATH):
+        self._prompt = _CachedFile(base_prompt_path, parse_base_prompt)
+        self._tools = _CachedFile(tool_manifest_path, parse_tool_manifest)
+
+    def base_prompt(self) -> str:
+        return self._prompt.get()
+
+    def tools(self) -> List[Dict[str, Any]]:
+        return self._tools.get()["tools"]
+
+    def role_tools(self) -> List[Dict[str, Any]]:
+        return self._tools.get()["role_tools"]
+
+    def tool_descriptions(self, role_tools: Optional[List[Dict[str, Any]]] = None) -> str:
+        """
+        Khối mô tả tool đã render sẵn; nếu role_tools khác bộ tool trong manifest thì render mới.
+        """
+        manifest = self._tools.get()
+        if role_tools is None or role_tools is manifest["role_tools"] or role_tools == manifest["role_tools"]:
+            return manifest["tool_descriptions"]
+        return render_tool_descriptions(role_tools)
+
+    def warmup(self) -> None:
+        self.base_prompt()
+        self.tools()
+
+    def invalidate(self) -> None:
+        self._prompt.invalidate()
+        self._tools.invalidate()
+
+
+REGISTRY = PromptRegistry()
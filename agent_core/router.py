@@ -0,0 +1,138 @@
+# agent_core/router.py
+
+"""
+Bộ định tuyến ý định cục bộ, chạy trước task_analyzer.
+
+Dùng mô hình embedding tiếng Việt đã nạp trong tools/rag.py để so câu hỏi với
+các prototype có gán nhãn (prompt/intents.yaml). Nếu đủ tự tin, plan tool được
+chọn ngay mà không cần gọi GeminiAnalyzerLLM; nếu không, để task_analyzer quyết định.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+from tools.rag import get_embedding, get_embeddings
+from utils.metrics import METRICS
+from utils.paths import INTENTS_PATH
+
+# Không dùng plan cục bộ khi session đã có lịch sử (câu hỏi nối tiếp cần ngữ cảnh)
+ROUTER_REQUIRE_NO_HISTORY = os.getenv("ROUTER_REQUIRE_NO_HISTORY", "1") == "1"
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+
+
+class IntentRouter:
+    """
+    So khớp câu hỏi với prototype của từng ý định (cosine similarity, lấy prototype gần nhất).
+    """
+    def __init__(self, intents: List[Dict[str, Any]], threshold: float = 0.6, margin: float = 0.05):
+        self.threshold = threshold
+        self.margin = margin
+        self.intents = [i for i in intents if i.get("examples")]
+        self._labels: List[int] = []
+        examples: List[str] = []
+        for idx, intent in enumerate(self.intents):
+            for example in intent["examples"]:
+                examples.append(example)
+                self._labels.append(idx)
+        self._labels = np.asarray(self._labels)
+        self._matrix = _normalize(np.asarray(get_embeddings(examples), dtype=np.float32))
+
+    @classmethod
+    def from_yaml(cls, path: str) -> "IntentRouter":
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return cls(
+            intents=data.get("intents", []),
+            threshold=float(os.getenv("ROUTER_THRESHOLD", data.get("threshold", 0.6))),
+            margin=float(os.getenv("ROUTER_MARGIN", data.get("margin", 0.05))),
+        )
+
+    def route(self, question: str) -> Dict[str, Any]:
+        """
+        Trả về {"confident": bool, "intent": str, "score": float, "margin": float, "plan": list}.
+        """
+        query = np.asarray(get_embedding(question), dtype=np.float32)
+        if query.size == 0 or not len(self.intents):
+            return {"confident": False, "intent": None, "score": 0.0, "margin": 0.0, "plan": []}
+
+        sims = self._matrix @ _normalize(query[None, :])[0]
+        # Điểm của mỗi ý định = prototype gần nhất
+        scores = np.full(len(self.intents), -1.0, dtype=np.float32)
+        np.maximum.at(scores, self._labels, sims)
+        order = np.argsort(scores)[::-1]
+        best = int(order[0])
+        best_score = float(scores[best])
+        second_score = float(scores[order[1]]) if len(order) > 1 else -1.0
+        margin = best_score - second_score
+
+        intent = self.intents[best]
+        return {
+            "confident": best_score >= self.threshold and margin >= self.margin,
+            "intent": intent.get("name"),
+            "score": round(best_score, 4),
+            "margin": round(margin, 4),
+            "plan": _fill_plan(intent.get("plan") or [], question),
+        }
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _fill_plan(plan: List[Dict[str, Any]], question: str) -> List[Dict[str, Any]]:
+    filled = []
+    for step in plan:
+        params = {
+            k: (v.replace("{question}", question) if isinstance(v, str) else v)
+            for k, v in (step.get("params") or {}).items()
+        }
+        filled.append({"tool_name": step.get("tool_name"), "params": params})
+    return filled
+
+
+_ROUTER: Optional[IntentRouter] = None
+_ROUTER_LOCK = threading.Lock()
+
+
+def get_router() -> IntentRouter:
+    """
+    Khởi tạo router một lần (embed toàn bộ prototype), dùng chung cho mọi request.
+    """
+    global _ROUTER
+    if _ROUTER is None:
+        with _ROUTER_LOCK:
+            if _ROUTER is None:
+                _ROUTER = IntentRouter.from_yaml(INTENTS_PATH)
+    return _ROUTER
+
+
+def local_analysis(decision: Dict[str, Any]) -> str:
+    """
+    Dựng chuỗi llm_analysis giống schema của GeminiAnalyzerLLM để log thống nhất.
+    """
+    return json.dumps({
+        "analysis": f"local_router:{decision['intent']} (score={decision['score']}, margin={decision['margin']})",
+        "required_tools": decision["plan"],
+    }, ensure_ascii=False)
+
+
+def record_route(route: str) -> None:
+    METRICS.increment(f"router.{route}")
+
+
+def router_stats() -> Dict[str, Any]:
+    """
+    Số lần mỗi nhánh được chọn và tỉ lệ câu hỏi được định tuyến cục bộ.
+    """
+    counters = METRICS.snapshot()["counters"]
+    local = counters.get("router.local", 0)
+    llm = counters.get("router.llm", 0)
+    total = local + llm
+    return {"local": local, "llm": llm, "local_ratio": round(local / total, 4) if total else 0.0}
@@ -0,0 +1,251 @@
+# agent_core/semantic_cache.py
+
+"""
+Cache câu trả lời theo ngữ nghĩa, đặt trước toàn bộ MultiRoleAgentGraph.
+
+Câu hỏi được embed bằng mô hình trong tools/rag.py; nếu đã có câu hỏi cũ đủ giống
+(cosine >= ANSWER_CACHE_THRESHOLD) thì trả lại final_answer đã lưu, không gọi
+Gemini hay truy xuất lại. Mục cache hết hạn theo TTL, số mục giới hạn theo LRU,
+và toàn bộ cache bị xoá khi FAQ collection được build lại (faq_index_version đổi).
+
+Câu hỏi trong session đã có lịch sử vẫn dùng cache, trừ khi câu hỏi có vẻ phụ thuộc
+ngữ cảnh (ngắn, hoặc có từ chỉ trỏ như "đó", "kia", "còn ... thì sao") và session
+thật sự có ngữ cảnh hội thoại (ANSWER_CACHE_CONTEXT_BYPASS, xem should_bypass).
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent_core.conversation_memory import build_conversation_context
+from tools.lexical_index import tokenize
+from tools.rag import get_embedding, faq_index_version
+from utils.metrics import METRICS
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Khoảng thời gian (giây) tối thiểu giữa 2 lần kiểm tra phiên bản FAQ index
+VERSION_CHECK_INTERVAL = float(os.getenv("ANSWER_CACHE_VERSION_CHECK_INTERVAL", "5"))
+# Bỏ qua cache cho câu hỏi phụ thuộc ngữ cảnh hội thoại:
+#   "context" (mặc định): chỉ khi session có ngữ cảnh và câu hỏi ngắn / có từ chỉ trỏ
+#   "session": mọi lượt có session_id (cache chỉ phục vụ lượt đầu)
+#   "off": không bao giờ bỏ qua
+ANSWER_CACHE_CONTEXT_BYPASS = os.getenv("ANSWER_CACHE_CONTEXT_BYPASS", "context").strip().lower()
+# Câu hỏi ít hơn số âm tiết này được coi là phụ thuộc ngữ cảnh ("còn hộ khẩu?")
+ANSWER_CACHE_MIN_SYLLABLES = int(os.getenv("ANSWER_CACHE_MIN_SYLLABLES", "5"))
+
+# Từ / cụm từ chỉ trỏ về lượt trước (so khớp theo âm tiết sau tokenize)
+_ANAPHORA_WORDS = {"đó", "đấy", "kia", "ấy", "nó", "họ", "vừa", "nữa", "tiếp"}
+_ANAPHORA_PHRASES = (
+    "thì sao", "thế thì", "vậy thì", "như vậy", "như thế", "như trên", "ở trên",
+    "nêu trên", "vừa rồi", "trường hợp này", "thủ tục này", "cái này", "câu trên",
+)
+
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL trên các cặp (embedding câu hỏi, câu trả lời). Thread-safe.
+    """
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        # Ma trận embedding (đã chuẩn hoá) của các mục, dựng lại khi cache thay đổi
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------
+    # 🔎 Tra cứu / lưu
+    # ------------------------------------------
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        vector = np.asarray(get_embedding(question), dtype=np.float32)
+        if vector.size == 0:
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question: str) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Trả về (mục cache hoặc None, embedding của câu hỏi). Embedding được trả lại
+        để store() sau lượt chạy không phải embed lần nữa.
+        """
+        t0 = time.perf_counter()
+        query = self.embed(question)
+        if query is None:
+            return None, None
+
+        now = time.monotonic()
+        self._check_version(now)
+        with self._lock:
+            self._evict_expired(now)
+            hit = None
+            similarity = 0.0
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_ids = list(self._entries.keys())
+                    self._matrix = np.stack([self._entries[i]["embedding"] for i in self._matrix_ids])
+                sims = self._matrix @ query
+                best = int(np.argmax(sims))
+                similarity = float(sims[best])
+                if similarity >= self.threshold:
+                    entry_id = self._matrix_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    entry = self._entries[entry_id]
+                    entry["hits"] += 1
+                    hit = {
+                        "question": entry["question"],
+                        "final_answer": entry["final_answer"],
+                        "llm_analysis": entry["llm_analysis"],
+                        "similarity": round(similarity, 4),
+                    }
+
+        METRICS.observe("semantic_cache.lookup", (time.perf_counter() - t0) * 1000)
+        METRICS.increment("semantic_cache.hit" if hit else "semantic_cache.miss")
+        return hit, query
+
+    def store(self, question: str, final_answer: str, llm_analysis: Any = None, embedding: Optional[np.ndarray] = None) -> None:
+        if not final_answer:
+            return
+        if embedding is None:
+            embedding = self.embed(question)
+            if embedding is None:
+                return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "question": question,
+                "embedding": embedding,
+                "final_answer": final_answer,
+                "llm_analysis": llm_analysis,
+                "created": time.monotonic(),
+                "hits": 0,
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    # ------------------------------------------
+    # 🧹 Hết hạn / vô hiệu hoá
+    # ------------------------------------------
+    def _evict_expired(self, now: float) -> None:
+        expired = [i for i, e in self._entries.items() if now - e["created"] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def _check_version(self, now: float) -> None:
+        if self._version is not None and now - self._version_checked_at < VERSION_CHECK_INTERVAL:
+            return
+        version = faq_index_version()
+        with self._lock:
+            self._version_checked_at = now
+            if self._version is not None and version != self._version:
+                print(f"FAQ index đã đổi phiên bản ({self._version} -> {version}), xoá cache câu trả lời.")
+                METRICS.increment("semantic_cache.invalidated")
+                self._entries.clear()
+                self._matrix = None
+            self._version = version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        counters = METRICS.snapshot()["counters"]
+        hits = counters.get("semantic_cache.hit", 0)
+        misses = counters.get("semantic_cache.miss", 0)
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "index_version": self._version,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            }
+
+
+def is_cacheable(state: Dict[str, Any], final_state: Dict[str, Any]) -> bool:
+    """
+    Chỉ lưu câu trả lời thành công: có final_answer, không phải chuỗi lỗi của
+    wrapper, và mọi tool đều chạy xong (không lưu kết quả timeout/lỗi).
+    """
+    answer = final_state.get("final_answer")
+    if not answer or not isinstance(answer, str) or answer.startswith("[Gemini"):
+        return False
+    for result in final_state.get("tool_results") or []:
+        if result.get("status", "ok") != "ok":
+            return False
+    return True
+
+
+def looks_context_dependent(question: str) -> bool:
+    """
+    Câu hỏi ngắn hoặc có từ chỉ trỏ về lượt trước ("còn thủ tục kia thì sao?").
+    """
+    tokens = tokenize(question)
+    if len(tokens) < ANSWER_CACHE_MIN_SYLLABLES:
+        return True
+    if _ANAPHORA_WORDS.intersection(tokens):
+        return True
+    text = " ".join(tokens)
+    return any(phrase in text for phrase in _ANAPHORA_PHRASES)
+
+
+def should_bypass(state: Dict[str, Any]) -> bool:
+    """
+    Không dùng/ghi cache khi lịch sử hội thoại có thể đổi nghĩa câu hỏi: session có
+    ngữ cảnh (tóm tắt / lượt trước) và câu hỏi có vẻ phụ thuộc ngữ cảnh. Kiểm tra câu
+    hỏi trước để câu hỏi độc lập không phải đọc lịch sử từ CSDL.
+    """
+    session_id = state.get("session_id")
+    if not session_id or ANSWER_CACHE_CONTEXT_BYPASS == "off":
+        return False
+    if ANSWER_CACHE_CONTEXT_BYPASS == "session":
+        return True
+    if not looks_context_dependent(state.get("user_input") or ""):
+        return False
+    try:
+        has_context = bool((state.get("conversation_history") or build_conversation_context(session_id)).strip())
+    except Exception as e:
+        print(f"⚠️ Không đọc được ngữ cảnh hội thoại, bỏ qua cache: {e}")
+        return True
+    if has_context:
+        METRICS.increment("semantic_cache.context_bypass")
+    return has_context
+
+
+_CACHE: Optional[SemanticAnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """
+    Cache dùng chung cho toàn process; None nếu ANSWER_CACHE_ENABLED=0.
+    """
+    global _CACHE
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = SemanticAnswerCache()
+    return _CACHE
@@ -1,8 +1,20 @@
 from typing import TypedDict, List, Dict, Any, Optional
-from operator import add
 from typing_extensions import Annotated
 
+
+def add_or_reset(left: Optional[List[Any]], right: Optional[List[Any]]) -> List[Any]:
+    """
+    Giống operator.add nhưng `None` xoá danh sách cũ.
+    Cần khi thread checkpoint được dùng lại giữa các lượt hỏi của cùng session:
+    state mới gửi tool_results=None để không cộng dồn kết quả của lượt trước.
+    """
+    if right is None:
+        return []
+    return (left or []) + right
+
 class MultiRoleAgentState(TypedDict):
+    # prompt_loader (tools, base_prompt) và memory_loader (conversation_history)
+    # chạy song song và ghi vào các key khác nhau; node chỉ trả về key đã thay đổi.
 
     user_input: str          
     session_id: str
@@ -13,12 +25,18 @@ class MultiRoleAgentState(TypedDict):
     tools: Optional[List[str]] 
     full_prompt: str
 
+    # "local" nếu intent_router đã chọn plan tool, "llm" nếu cần task_analyzer;
+    # "faq" nếu câu trả lời lấy thẳng từ FAQ, "cache" nếu trúng cache câu trả lời
+    route: Optional[str]
+
     # Phân tích của LLM
     llm_analysis: Optional[str]      
     required_tools: Optional[List[Dict[str, Any]]] 
     
     # Kết quả tool
-    tool_results: Annotated[List[Dict[str, Any]], add]  
+    tool_results: Annotated[List[Dict[str, Any]], add_or_reset]  
+    # Kết quả FAQ đủ tin cậy để trả lời thẳng (tool_executor chọn, faq_answer dùng)
+    faq_hit: Optional[Dict[str, Any]]
 
     # Câu trả lời cuối cùng
     final_answer: Optional[str]  
\ No newline at end of file
@@ -0,0 +1,254 @@
+# agent_core/tool_runner.py
+
+"""
+Thực thi song song các lời gọi tool mà task_analyzer yêu cầu.
+
+- Dùng chung một ThreadPoolExecutor có giới hạn cho toàn process.
+- Mỗi tool có timeout và giới hạn số lời gọi đồng thời riêng
+  (khai báo cạnh tool trong prompt/tool.yaml: `timeout`, `max_concurrency`).
+- Kết quả giữ đúng thứ tự của required_tools; lỗi/timeout của một tool
+  không làm hỏng kết quả của các tool khác.
+- Nhiều lời gọi cùng một tool có bản batch (BATCH_TOOL_REGISTRY) được gộp
+  thành một lần gọi (vd. một lần encode + một lần query Chroma cho mọi câu hỏi).
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tools.tool_registry import TOOL_REGISTRY, BATCH_TOOL_REGISTRY
+from utils.metrics import METRICS
+
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", "15"))
+DEFAULT_TOOL_CONCURRENCY = int(os.getenv("TOOL_DEFAULT_MAX_CONCURRENCY", "4"))
+TOOL_POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", "8"))
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=TOOL_POOL_SIZE, thread_name_prefix="tool")
+# tool_name -> (max_concurrency lúc tạo, semaphore)
+_SEMAPHORES: Dict[str, Tuple[int, threading.BoundedSemaphore]] = {}
+_SEMAPHORES_LOCK = threading.Lock()
+
+
+def _get_semaphore(tool_name: str, limit: int) -> threading.BoundedSemaphore:
+    """
+    Semaphore của tool; tạo lại khi max_concurrency đổi (tool.yaml được nạp lại lúc chạy).
+    Lời gọi đang giữ semaphore cũ vẫn trả về semaphore cũ khi xong.
+    """
+    limit = max(1, limit)
+    with _SEMAPHORES_LOCK:
+        entry = _SEMAPHORES.get(tool_name)
+        if entry is None or entry[0] != limit:
+            entry = (limit, threading.BoundedSemaphore(limit))
+            _SEMAPHORES[tool_name] = entry
+        return entry[1]
+
+
+def _tool_limits(tool_name: str, tool_specs: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    for spec in tool_specs or []:
+        if spec.get("name") == tool_name:
+            return {
+                "timeout": float(spec.get("timeout") or DEFAULT_TOOL_TIMEOUT),
+                "max_concurrency": int(spec.get("max_concurrency") or DEFAULT_TOOL_CONCURRENCY),
+            }
+    return {"timeout": DEFAULT_TOOL_TIMEOUT, "max_concurrency": DEFAULT_TOOL_CONCURRENCY}
+
+
+class _CallerGaveUp(Exception):
+    """
+    Hết hạn của bên gọi trước khi lấy được semaphore: không chạy tool nữa.
+    """
+
+
+def _acquire(tool_name: str, semaphore: threading.BoundedSemaphore, deadline: float) -> None:
+    """
+    Chờ semaphore tối đa tới deadline (time.monotonic) của bên gọi. Lời gọi chờ semaphore
+    đã nằm trong worker nên future.cancel() không dừng được: tự bỏ qua nếu bên gọi đã
+    timeout, thay vì chạy tool muộn và chiếm một slot của pool.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0 or not semaphore.acquire(timeout=remaining):
+        METRICS.increment(f"tool.{tool_name}.skipped")
+        raise _CallerGaveUp(f"{tool_name}: bên gọi đã hết thời gian chờ")
+
+
+def _invoke(tool_name: str, tool_func: Callable, params: Dict[str, Any], semaphore: threading.BoundedSemaphore,
+            deadline: float):
+    """
+    Chạy trong worker thread: giữ semaphore của tool trong lúc gọi.
+    """
+    _acquire(tool_name, semaphore, deadline)
+    t0 = time.perf_counter()
+    try:
+        return tool_func(**params)
+    finally:
+        METRICS.observe(f"tool.{tool_name}", (time.perf_counter() - t0) * 1000)
+        semaphore.release()
+
+
+def _invoke_batch(tool_name: str, batch_func: Callable, values: List[Any], semaphore: threading.BoundedSemaphore,
+                  deadline: float):
+    """
+    Giống _invoke nhưng cho bản batch: một lần gọi cho cả lô, trả về list kết quả cùng thứ tự.
+    """
+    _acquire(tool_name, semaphore, deadline)
+    t0 = time.perf_counter()
+    try:
+        results = batch_func(values)
+    finally:
+        METRICS.observe(f"tool.{tool_name}", (time.perf_counter() - t0) * 1000)
+        semaphore.release()
+    if len(results) != len(values):
+        raise RuntimeError(f"bản batch trả về {len(results)} kết quả cho {len(values)} lời gọi")
+    METRICS.increment(f"tool.{tool_name}.batched_calls", len(values))
+    return results
+
+
+def _error_result(tool_name: str, params: Dict[str, Any], status: str, message: str) -> Dict[str, Any]:
+    METRICS.increment(f"tool.{tool_name}.{status}")
+    print(f"⚠️ Tool {tool_name} ({status}): {message}")
+    return {
+        "tool_name": tool_name,
+        "params": params,
+        "result": f"❌ Lỗi khi thực thi {tool_name}: {message}",
+        "status": status,
+        "error": message,
+    }
+
+
+def _prepare_calls(required_tools: List[Dict[str, Any]], tool_specs: Optional[List[Dict[str, Any]]]):
+    """
+    Chuẩn hoá required_tools thành danh sách (index, tool_name, params, func, limits).
+    Tool không có trong TOOL_REGISTRY trả kết quả None ngay (giống hành vi cũ).
+    """
+    calls = []
+    immediate: Dict[int, Dict[str, Any]] = {}
+    for tool_info in required_tools or []:
+        tool_name = tool_info.get("tool_name") or tool_info.get("name")
+        params = tool_info.get("params", {})
+        if not tool_name:
+            continue
+        index = len(calls) + len(immediate)
+        tool_func = TOOL_REGISTRY.get(tool_name)
+        if not tool_func:
+            immediate[index] = {"tool_name": tool_name, "params": params, "result": None, "status": "unavailable"}
+            continue
+        calls.append((index, tool_name, params, tool_func, _tool_limits(tool_name, tool_specs)))
+    return calls, immediate
+
+
+def _coalesce(calls) -> List[Dict[str, Any]]:
+    """
+    Gộp các lời gọi cùng tool có bản batch (BATCH_TOOL_REGISTRY) và chỉ dùng đúng
+    tham số của bản batch thành một job; các lời gọi còn lại mỗi lời gọi một job.
+    Job: {"indices", "tool_name", "params_list", "limits", "func", "batch_param"}.
+    """
+    jobs = []
+    groups: Dict[str, List[Any]] = {}
+    for call in calls:
+        index, tool_name, params, tool_func, limits = call
+        batch_spec = BATCH_TOOL_REGISTRY.get(tool_name)
+        if batch_spec and set(params) == {batch_spec[1]}:
+            groups.setdefault(tool_name, []).append(call)
+        else:
+            jobs.append({"indices": [index], "tool_name": tool_name, "params_list": [params],
+                         "limits": limits, "func": tool_func, "batch_param": None})
+
+    for tool_name, group in groups.items():
+        if len(group) == 1:
+            index, _, params, tool_func, limits = group[0]
+            jobs.append({"indices": [index], "tool_name": tool_name, "params_list": [params],
+                         "limits": limits, "func": tool_func, "batch_param": None})
+            continue
+        batch_func, param = BATCH_TOOL_REGISTRY[tool_name]
+        jobs.append({
+            "indices": [c[0] for c in group],
+            "tool_name": tool_name,
+            "params_list": [c[2] for c in group],
+            "limits": group[0][4],
+            "func": batch_func,
+            "batch_param": param,
+        })
+    return jobs
+
+
+def _submit(job: Dict[str, Any], deadline: float):
+    semaphore = _get_semaphore(job["tool_name"], job["limits"]["max_concurrency"])
+    if job["batch_param"] is None:
+        return _EXECUTOR.submit(_invoke, job["tool_name"], job["func"], job["params_list"][0], semaphore, deadline)
+    values = [params[job["batch_param"]] for params in job["params_list"]]
+    return _EXECUTOR.submit(_invoke_batch, job["tool_name"], job["func"], values, semaphore, deadline)
+
+
+def _job_results(job: Dict[str, Any], result: Any = None, status: str = "ok", message: str = "") -> Dict[int, Dict[str, Any]]:
+    """
+    Tách kết quả của một job về từng index; lỗi/timeout của job áp dụng cho mọi lời gọi trong job.
+    """
+    results = [result] if job["batch_param"] is None else result
+    done = {}
+    for i, (index, params) in enumerate(zip(job["indices"], job["params_list"])):
+        if status == "ok":
+            done[index] = {"tool_name": job["tool_name"], "params": params, "result": results[i], "status": "ok"}
+        else:
+            done[index] = _error_result(job["tool_name"], params, status, message)
+    return done
+
+
+def _collect(total: int, immediate: Dict[int, Dict[str, Any]], done: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    results = {**immediate, **done}
+    return [results[i] for i in range(total)]
+
+
+def run_tool_calls(required_tools: List[Dict[str, Any]], tool_specs: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Chạy các tool song song trên pool chung, trả về kết quả theo đúng thứ tự yêu cầu.
+    Các lời gọi cùng tool có bản batch được gộp thành một lần gọi.
+    Mỗi kết quả: {"tool_name", "params", "result", "status"[, "error"]}.
+    """
+    calls, immediate = _prepare_calls(required_tools, tool_specs)
+    submitted = []
+    for job in _coalesce(calls):
+        timeout = job["limits"]["timeout"]
+        deadline = time.monotonic() + timeout
+        submitted.append((job, _submit(job, deadline), deadline, timeout))
+
+    done: Dict[int, Dict[str, Any]] = {}
+    for job, future, deadline, timeout in submitted:
+        try:
+            result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            done.update(_job_results(job, result))
+        except (FutureTimeoutError, _CallerGaveUp):
+            # Không thể dừng thread đang chạy; chỉ huỷ nếu chưa bắt đầu và bỏ qua kết quả
+            # (lời gọi còn đang chờ semaphore tự bỏ qua khi tới deadline, xem _acquire).
+            future.cancel()
+            done.update(_job_results(job, status="timeout", message=f"quá thời gian {timeout:.1f}s"))
+        except Exception as e:
+            done.update(_job_results(job, status="error", message=str(e)))
+
+    return _collect(len(calls) + len(immediate), immediate, done)
+
+
+async def arun_tool_calls(required_tools: List[Dict[str, Any]], tool_specs: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Bản async của run_tool_calls: chờ trên event loop thay vì chặn một thread.
+    """
+    calls, immediate = _prepare_calls(required_tools, tool_specs)
+
+    async def _one(job):
+        timeout = job["limits"]["timeout"]
+        future = _submit(job, time.monotonic() + timeout)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            return _job_results(job, result)
+        except (asyncio.TimeoutError, _CallerGaveUp):
+            future.cancel()
+            return _job_results(job, status="timeout", message=f"quá thời gian {timeout:.1f}s")
+        except Exception as e:
+            return _job_results(job, status="error", message=str(e))
+
+    done: Dict[int, Dict[str, Any]] = {}
+    for part in await asyncio.gather(*[_one(job) for job in _coalesce(calls)]):
+        done.update(part)
+    return _collect(len(calls) + len(immediate), immediate, done)
@@ -1,120 +1,60 @@
 # app.py
-import time, json
+import os, time, json
 import streamlit as st
-from agent_core.graph import MultiRoleAgentGraph
-from sqlalchemy import text
+# LangGraph, Chroma, mô hình embedding, google-genai... chỉ được import khi nạp agent graph
+# (thread nền, xem agent_core/bootstrap.py), không chặn lần render đầu tiên.
+from agent_core.bootstrap import get_agent_graph, start_background_warmup
+from agent_core.conversation_memory import schedule_summary_update
 import uuid
-from PIL import Image
-from pathlib import Path
-import unicodedata
-from datetime import datetime, timezone, timedelta
-from connect_SQL.connect_SQL import connect_sql
+from connect_SQL.log_writer import LOG_WRITER
+from connect_SQL.store import local_now
+from connect_SQL.chat_history import SESSION_CACHE, get_chat_sessions, get_messages_page
+from utils.metrics import METRICS
+from utils.paths import STYLE_CSS_PATH
 import re
 
+# In bảng tổng hợp METRICS sau mỗi lượt hỏi (chỉ để debug; số liệu vẫn ghi vào AGENT_METRICS_JSONL)
+PRINT_METRICS_SUMMARY = os.getenv("AGENT_METRICS_SUMMARY", "0") == "1"
 
-@st.cache_resource
 def load_agent_graph():
-    return MultiRoleAgentGraph()
+    # Nạp một lần cho cả process (prompt/tool, mô hình embedding, chỉ mục, engine SQL);
+    # nếu thread nền đang nạp thì chờ nó xong
+    return get_agent_graph()
 
 def log_to_database(session_id, user_query, ai_response, intermediate_steps):
-    engine = connect_sql()
-    VN_TZ = timezone(timedelta(hours=7))
-    timestamp = datetime.now(VN_TZ).replace(tzinfo=None)
+    """
+    Tạo session_id (đồng bộ, để giao diện dùng ngay) rồi đưa bản ghi vào
+    hàng đợi ghi nền (connect_SQL/log_writer.py); không chờ CSDL.
+    Sau khi bản ghi đã commit, tóm tắt hội thoại của session được cập nhật nền.
+    """
+    timestamp = local_now()
     print(session_id)
-    with engine.connect() as conn:
-        # Xu li bang ChatSessions
-        is_new_session = False
-        if not session_id:
-            session_id = f"st_session_{uuid.uuid4()}"
-            is_new_session = True
-
-        if is_new_session:
-            summary = user_query[:30] + ('...' if len(user_query) > 30 else '')
-            stmt_session = text("""
-                INSERT INTO ChatSessions (SessionId, FirstMessageSummary, CreatedAt) 
-                VALUES (:sid, :summary,:timestamp)
-            """)
-            conn.execute(stmt_session, {
-                "sid": session_id,
-                "summary": summary,
-                "timestamp": timestamp,
-            })
-            conn.commit()
-    
-        stmt_conv = text("""
-                INSERT INTO dbo.conversation_history (session_id, user_message, bot_response,timestamp)
-                OUTPUT INSERTED.id
-                VALUES (:sid, :user_msg, :bot_res, :timestamp)
-            """)
-        result = conn.execute(stmt_conv, {
-            "sid": session_id,
-            "user_msg": user_query,
-            "bot_res": ai_response,
-            "timestamp": timestamp,
-        })
-        conversation_id = result.scalar_one()
-
-        # 2. Chuẩn bị dữ liệu và ghi vào query_results
 
-        stmt_query = text("""
-                INSERT INTO dbo.query_results (conversation_id, query_text, response_text, retrieved_docs, model_name, timestamp)
-                VALUES (:conv_id, :q_text, :res_text, :r_docs, :model,:timestamp)
-            """)
-        conn.execute(stmt_query, {
-            "conv_id": conversation_id,
-            "q_text": user_query,
-            "res_text": ai_response,
-            "r_docs": intermediate_steps,
-            "model": "gemini-2.0-flash",
+    is_new_session = False
+    if not session_id:
+        session_id = f"st_session_{uuid.uuid4()}"
+        is_new_session = True
+
+    summary = user_query[:30] + ('...' if len(user_query) > 30 else '')
+    if is_new_session:
+        # Sidebar thấy session mới ngay, không cần đọc lại CSDL
+        SESSION_CACHE.add_local(session_id, summary)
+
+    LOG_WRITER.submit(
+        {
+            "session_id": session_id,
+            "is_new_session": is_new_session,
+            "summary": summary,
+            "user_query": user_query,
+            "ai_response": ai_response,
+            "intermediate_steps": intermediate_steps,
+            "model_name": "gemini-2.0-flash",
             "timestamp": timestamp,
-        })
-        conn.commit()
-
-    print(f"Đã ghi log thành công cho conversation_id: {conversation_id}")
+        },
+        on_written=schedule_summary_update,
+    )
     return session_id
 
-def get_chat_sessions(limit=5) -> list:
-    engine = connect_sql()
-    sessions = []
-    query = text(f"""
-        SELECT TOP (:limit) SessionId, FirstMessageSummary
-        FROM dbo.ChatSessions
-        ORDER BY CreatedAt DESC
-    """)
-    
-    with engine.connect() as conn:
-        try:
-            rows = conn.execute(query, {"limit": limit}).fetchall() 
-            sessions = [(row.SessionId, row.FirstMessageSummary) for row in rows]
-        except Exception as e:
-            print(f"Lỗi khi lấy danh sách session: {e}")
-        return sessions
-
-def get_messages_by_session(session_id: str) -> list:
-    """
-    Lấy toàn bộ tin nhắn của một SessionId cụ thể.
-    Trả về list of dictionaries, phù hợp với st.session_state.messages.
-    """
-    engine = connect_sql()
-    messages = []
-    query = text("""SELECT user_message, bot_response 
-            FROM [dbo].[conversation_history] 
-            WHERE session_id = :session_id 
-            ORDER BY timestamp ASC""")
-    with engine.connect() as conn:
-        try:
-            rows = conn.execute(query, {'session_id': session_id}).fetchall()
-            for row in rows:
-                if row.user_message:
-                    messages.append({"role": "user", "content": row.user_message})
-                
-                # 2. Tạo dictionary cho tin nhắn của bot
-                if row.bot_response:
-                    messages.append({"role": "assistant", "content": row.bot_response})
-        except Exception as e:
-            print(f"Lỗi khi lấy tin nhắn của session {session_id}: {e}")
-        return messages
-
 def truncate_text(text, max_length=10):
     """Cắt ngắn văn bản hiển thị trên sidebar"""
     if len(text) > max_length:
@@ -143,7 +83,9 @@ def clean_retrieved_docs(raw_text):
 
 
 st.set_page_config(page_title="Chatbot hỗ trợ", layout="wide")
-local_css("D:/Chatbot_Data4Life/v1/style.css")
+# Nạp agent graph ở thread nền trong lúc render giao diện
+start_background_warmup()
+local_css(STYLE_CSS_PATH)
 
 with st.sidebar:
     st.title("🤖 Chatbot hỗ trợ")
@@ -151,6 +93,7 @@ with st.sidebar:
     if st.button("➕ Cuộc trò chuyện mới", use_container_width=True):
         st.session_state.session_id = None
         st.session_state.messages = []
+        st.session_state.history_cursor = None
         st.rerun()
 
     st.markdown("### 🕒 Lịch sử gần đây")
@@ -166,7 +109,9 @@ with st.sidebar:
         # Dùng key unique để tránh lỗi duplicate widget ID
         if st.button(display_text, key=s_id, help=summary):
             st.session_state.session_id = s_id
-            st.session_state.messages = get_messages_by_session(s_id)
+            page = get_messages_page(s_id)
+            st.session_state.messages = page["messages"]
+            st.session_state.history_cursor = page["cursor"]
             st.rerun()
     
     st.markdown("---")
@@ -186,6 +131,15 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "session_id" not in st.session_state:
     st.session_state.session_id = None 
+if "history_cursor" not in st.session_state:
+    st.session_state.history_cursor = None
+
+# Lịch sử dài: chỉ tải trang mới nhất, tải thêm các lượt cũ hơn khi cần
+if st.session_state.history_cursor and st.button("⬆️ Tải tin nhắn cũ hơn"):
+    page = get_messages_page(st.session_state.session_id, cursor=st.session_state.history_cursor)
+    st.session_state.messages = page["messages"] + st.session_state.messages
+    st.session_state.history_cursor = page["cursor"]
+    st.rerun()
 
 # Hiển thị chat
 for message in st.session_state.messages:
@@ -199,36 +153,43 @@ if user_input := st.chat_input("Hãy đặt câu hỏi của bạn ở đây..."
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
+        t0 = time.time()
+        agent_graph = load_agent_graph()
+
+        new_state = agent_graph.create_new_state(
+            user_question=user_input,
+            session_id=st.session_state.session_id or "",
+        )
+
+        # Chạy phần phân tích + tool trong spinner, sau đó stream câu trả lời
+        answer_stream = agent_graph.stream(new_state)
         with st.spinner("AI đang suy nghĩ..."):
+            answer_stream.prepare()
 
-            t0 = time.time()
-            agent_graph = load_agent_graph()
+        streamed_output = st.write_stream(answer_stream)
 
-            new_state = agent_graph.create_new_state(
-                user_question=user_input,
-                session_id=st.session_state.session_id or "",
-            )
+        t1 = time.time()
+        result = answer_stream.final_state or {}
+        ai_output = result.get('final_answer') or streamed_output or 'Lỗi: Không có phản hồi.'
+        llm_analysis = result.get('llm_analysis', [])
 
-            result = agent_graph.run(new_state)
-            
-            t1 = time.time()
-            ai_output = result.get('final_answer', 'Lỗi: Không có phản hồi.')
-            llm_analysis = result.get('llm_analysis', [])
-            try:
-                new_sessions_id = log_to_database(
-                    session_id=st.session_state.session_id,
-                    user_query=user_input,
-                    ai_response=ai_output,
-                    intermediate_steps=clean_retrieved_docs(llm_analysis),
-                )
-                st.session_state.session_id = new_sessions_id
-            except Exception as e:
-                print(f"Lỗi khi ghi log vào CSDL: {e}")
-                st.error("Không thể ghi log vào CSDL!")
-
-            st.markdown(ai_output)
-            for key, value in result.items():
-               print(f"  - {key}: {value}")
-            print(f"⏱️ Total: {t1 - t0:.3f}s")
+        # Ghi log sau khi stream kết thúc (đưa vào hàng đợi, ghi nền theo lô)
+        try:
+            new_sessions_id = log_to_database(
+                session_id=st.session_state.session_id,
+                user_query=user_input,
+                ai_response=ai_output,
+                intermediate_steps=clean_retrieved_docs(llm_analysis),
+            )
+            st.session_state.session_id = new_sessions_id
+        except Exception as e:
+            print(f"Lỗi khi ghi log vào CSDL: {e}")
+            st.error("Không thể ghi log vào CSDL!")
+
+        for key, value in result.items():
+           print(f"  - {key}: {value}")
+        print(f"⏱️ Total: {t1 - t0:.3f}s")
+        if PRINT_METRICS_SUMMARY:
+            print(METRICS.format_summary())
 
     st.session_state.messages.append({"role": "assistant", "content": ai_output})
@@ -0,0 +1,83 @@
+# benchmarks/bench_embedding.py
+
+"""
+Độ trễ encode của các backend embedding (tools/embedding_backend.py) trên CPU.
+
+Với mỗi backend: thời gian nạp, lần encode đầu tiên (chưa warmup), độ trễ một câu
+sau warmup (p50/p95), thông lượng theo lô, và cosine so với SentenceTransformer gốc.
+
+    python benchmarks/bench_embedding.py --backends torch,torch_int8,onnx_fp32,onnx_int8 --threads 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ("torch", "torch_int8", "onnx_fp32", "onnx_int8")
+
+
+def _load(backend: str):
+    from tools.embedding_backend import OnnxEmbedder, load_embedding_model
+    from utils.paths import EMBEDDING_ONNX_PATH
+
+    if backend == "onnx_fp32":
+        return OnnxEmbedder(EMBEDDING_ONNX_PATH, quantized=False)
+    if backend == "onnx_int8":
+        return OnnxEmbedder(EMBEDDING_ONNX_PATH, quantized=True)
+    return load_embedding_model(backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend embedding")
+    parser.add_argument("--backends", default="torch,onnx_fp32,onnx_int8", help=f"danh sách, chọn trong {BACKENDS}")
+    parser.add_argument("--threads", type=int, default=0, help="EMBEDDING_THREADS (0 = mặc định thư viện)")
+    parser.add_argument("--repeat", type=int, default=50, help="số lần encode một câu để đo")
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    # Phải đặt trước khi import backend (đọc biến môi trường lúc import)
+    os.environ["EMBEDDING_THREADS"] = str(args.threads)
+    from tools.embedding_backend import SAMPLE_SENTENCES, warmup_model
+
+    sentences = SAMPLE_SENTENCES
+    batch = (sentences * (args.batch // len(sentences) + 1))[:args.batch]
+    reference = None
+
+    print(f"{'backend':11} {'nạp ms':>8} {'lần đầu ms':>11} {'p50 ms':>8} {'p95 ms':>8} {'lô câu/s':>9} {'cos min':>8}")
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        t0 = time.perf_counter()
+        model = _load(backend)
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        model.encode(sentences[:1])
+        first_ms = (time.perf_counter() - t0) * 1000
+        warmup_model(model)
+
+        latencies = []
+        for i in range(args.repeat):
+            t0 = time.perf_counter()
+            model.encode([sentences[i % len(sentences)]])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        model.encode(batch)
+        throughput = len(batch) / (time.perf_counter() - t0)
+
+        vectors = np.asarray(model.encode(sentences), dtype=np.float32)
+        if reference is None:
+            reference = vectors if backend == "torch" else np.asarray(_load("torch").encode(sentences), dtype=np.float32)
+        cosine = (vectors * reference).sum(axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+        )
+        print(f"{backend:11} {load_ms:>8.0f} {first_ms:>11.1f} {np.percentile(latencies, 50):>8.2f} "
+              f"{np.percentile(latencies, 95):>8.2f} {throughput:>9.1f} {cosine.min():>8.5f}")
+
+
+if __name__ == "__main__":
+    main()
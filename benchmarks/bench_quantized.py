@@ -0,0 +1,157 @@
+# benchmarks/bench_quantized.py
+
+"""
+Báo cáo bộ nhớ / tốc độ / độ chính xác của các định dạng chỉ mục FAQ:
+float32 + metadata trong RAM (tools/flat_index.py) so với int8 / float16 + kho văn
+bản SQLite (tools/quantized_index.py).
+
+- RSS: mỗi định dạng được nạp trong một process con riêng (giống một worker phục vụ),
+  chạy một truy vấn rồi đo RSS tăng thêm so với lúc chỉ import thư viện; sau đó nạp
+  thêm chỉ mục BM25 (tìm kiếm lai bật mặc định) và đo lại.
+- Tốc độ: độ trễ một truy vấn top-k (p50/p95), gồm cả đọc văn bản của top-k.
+- Độ chính xác: recall@k so với cosine float32 chính xác.
+
+Ví dụ:
+    # Dữ liệu thật: snapshot flat_index/ (hoặc collection Chroma) trong FAQ_DB_PATH
+    python benchmarks/bench_quantized.py --queries 200
+
+    # Dữ liệu giả lập (văn bản dài cỡ FAQ thật)
+    python benchmarks/bench_quantized.py --synthetic 20000 --dim 768
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import flat_index
+from tools.flat_index import FlatIndex
+from tools.lexical_index import INDEX_FILE_NAME, BM25Index
+from tools.quantized_index import QuantizedIndex
+
+FORMATS = ("float32", "float16", "int8")
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def _load(fmt: str, directory: str):
+    if fmt == "float32":
+        return FlatIndex.load(os.path.join(directory, fmt))
+    return QuantizedIndex.load(os.path.join(directory, fmt))
+
+
+def _probe(fmt: str, directory: str, dim: int) -> None:
+    """
+    Chạy trong process con: RSS trước/sau khi nạp chỉ mục và trả lời một truy vấn.
+    """
+    baseline = _rss_mb()
+    index = _load(fmt, directory)
+    index.query(np.ones((1, dim), dtype=np.float32), 5)
+    rss = _rss_mb()
+    lexical = BM25Index.load(os.path.join(directory, INDEX_FILE_NAME))
+    lexical.search("thủ tục hành chính", 20)
+    print(json.dumps({"baseline_mb": baseline, "rss_mb": rss, "hybrid_rss_mb": _rss_mb()}))
+
+
+def _dataset(args):
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        matrix = rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        # answer_html ~ gấp đôi answer_text, giống metadata lưu trong Chroma
+        metadatas = [{
+            "title": f"Thủ tục hành chính số {i}",
+            "answer_text": "Nội dung trả lời " * 80,
+            "answer_html": "<p>Nội dung trả lời</p>" * 80,
+            "source_url": f"https://dichvucong.gov.vn/faq/{i}",
+        } for i in range(args.synthetic)]
+        return [f"faq-{i}" for i in range(args.synthetic)], matrix, metadatas
+
+    from utils.paths import FAQ_DB_PATH
+    snapshot = flat_index.current_snapshot(flat_index.snapshot_dir(FAQ_DB_PATH))
+    if snapshot is not None:
+        flat = FlatIndex.load(snapshot, mmap=False)
+    else:
+        from tools.rag import connect_chroma_db
+        flat = FlatIndex.from_collection(connect_chroma_db())
+    return flat.ids, np.asarray(flat.matrix), flat.metadatas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS / tốc độ / recall của chỉ mục float32, float16, int8")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.3, help="nhiễu cộng vào vector tài liệu để tạo câu hỏi")
+    parser.add_argument("--synthetic", type=int, default=0, help="số vector giả lập (0 = dữ liệu thật)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--probe", nargs=3, metavar=("FORMAT", "DIR", "DIM"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(args.probe[0], args.probe[1], int(args.probe[2]))
+        return
+
+    ids, matrix, metadatas = _dataset(args)
+    print(f"Dữ liệu: {len(ids)} vector x {matrix.shape[1]} chiều")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Chỉ mục float32 giữ toàn bộ metadata (như collection Chroma hiện tại: mọi trường nằm trong RAM)
+        flat = FlatIndex.build(ids, matrix, metadatas)
+        flat.metadatas = [dict(m) for m in metadatas]
+        flat.save(os.path.join(directory, "float32"))
+        for fmt in ("float16", "int8"):
+            QuantizedIndex.build(ids, matrix, metadatas, os.path.join(directory, fmt), dtype=fmt).close()
+        BM25Index.build([{"id": doc_id, **(m or {})} for doc_id, m in zip(ids, metadatas)]).save(
+            os.path.join(directory, INDEX_FILE_NAME)
+        )
+
+        rng = np.random.default_rng(args.seed + 1)
+        picks = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+        queries = flat.matrix[picks] + args.noise * rng.standard_normal((len(picks), flat.dim)).astype(np.float32)
+        k = min(args.k, len(ids))
+        exact = flat.query(queries, k)["ids"]
+
+        print(f"{'định dạng':10} {'vector MB':>10} {'RSS MB':>8} {'+BM25 MB':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(k):>10}")
+        for fmt in FORMATS:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--probe", fmt, directory, str(flat.dim)],
+                capture_output=True, text=True, check=True,
+            )
+            probe = json.loads(out.stdout.strip().splitlines()[-1])
+
+            index = _load(fmt, directory)
+            index.query(queries[:1], k)
+            latencies, found = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                res = index.query(q[None, :], k)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                found.append(res["ids"][0])
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, exact) if b])
+            vector_mb = (index.matrix.nbytes if fmt == "float32" else index.nbytes) / 1e6
+            print(f"{fmt:10} {vector_mb:>10.1f} {probe['rss_mb'] - probe['baseline_mb']:>8.1f} "
+                  f"{probe['hybrid_rss_mb'] - probe['baseline_mb']:>9.1f} "
+                  f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 95):>8.3f} {recall:>10.4f}")
+            if fmt != "float32":
+                index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_retrieval.py
+
+"""
+So sánh engine truy xuất vector: Chroma (collection.query) và chỉ mục phẳng NumPy
+(tools/flat_index.py).
+
+Đo độ trễ từng câu và theo lô (p50/p95), và mức khớp thứ tự kết quả
+(recall@k so với cosine chính xác, tỉ lệ top-k trùng thứ tự giữa hai engine).
+
+Ví dụ:
+    # Dữ liệu thật (FAQ_DB_PATH / FAQ_COLLECTION_NAME), câu hỏi = tiêu đề FAQ được embed lại
+    python benchmarks/bench_retrieval.py --queries 200 --text
+
+    # Không cần dữ liệu/mô hình: collection Chroma tạm với vector ngẫu nhiên
+    python benchmarks/bench_retrieval.py --synthetic 5000 --dim 768
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.flat_index import FlatIndex
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return f"p50={np.percentile(arr, 50):.3f}ms p95={np.percentile(arr, 95):.3f}ms mean={arr.mean():.3f}ms"
+
+
+def _synthetic_collection(n_docs: int, dim: int, seed: int):
+    import chromadb
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n_docs, dim)).astype(np.float32)
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(f"bench_{time.time_ns()}", metadata={"hnsw:space": "cosine"})
+    ids = [f"faq-{i}" for i in range(n_docs)]
+    for start in range(0, n_docs, 5000):
+        end = min(start + 5000, n_docs)
+        collection.add(
+            ids=ids[start:end],
+            embeddings=vectors[start:end].tolist(),
+            metadatas=[{"title": f"Câu hỏi {i}", "answer_text": f"Trả lời {i}", "source_url": ""} for i in range(start, end)],
+        )
+    return collection
+
+
+def _query_vectors(flat: FlatIndex, n_queries: int, noise: float, use_text: bool, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(flat), size=min(n_queries, len(flat)), replace=False)
+    if use_text:
+        from tools.rag import get_embeddings
+        return np.asarray(get_embeddings([flat.metadatas[i]["title"] or "" for i in picks]), dtype=np.float32)
+    base = np.asarray(flat.matrix[picks], dtype=np.float32)
+    return base + noise * rng.standard_normal(base.shape).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs chỉ mục phẳng NumPy")
+    parser.add_argument("--queries", type=int, default=200, help="số câu hỏi")
+    parser.add_argument("--k", type=int, default=20, help="top-k mỗi câu")
+    parser.add_argument("--batch", type=int, default=8, help="kích thước lô khi đo theo lô")
+    parser.add_argument("--noise", type=float, default=0.3, help="nhiễu cộng vào vector khi không dùng --text")
+    parser.add_argument("--text", action="store_true", help="embed lại tiêu đề FAQ bằng mô hình thật")
+    parser.add_argument("--synthetic", type=int, default=0, help="số vector ngẫu nhiên (0 = dùng collection thật)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        collection = _synthetic_collection(args.synthetic, args.dim, args.seed)
+    else:
+        from tools.rag import connect_chroma_db
+        collection = connect_chroma_db()
+
+    t0 = time.perf_counter()
+    flat = FlatIndex.from_collection(collection)
+    print(f"Xuất {len(flat)} vector x {flat.dim} chiều từ Chroma: {(time.perf_counter() - t0) * 1000:.1f}ms "
+          f"({flat.matrix.nbytes / 1e6:.1f} MB)")
+
+    queries = _query_vectors(flat, args.queries, args.noise, args.text, args.seed)
+    k = min(args.k, len(flat))
+
+    # Khởi động (nạp HNSW, cache CPU) trước khi đo
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=k, include=["metadatas", "distances"])
+    flat.query(queries[:1], k)
+
+    engines = {
+        "chroma": lambda q: collection.query(query_embeddings=q.tolist(), n_results=k, include=["metadatas", "distances"]),
+        "flat": lambda q: flat.query(q, k),
+    }
+    results = {}
+    for name, run in engines.items():
+        single, ids = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            res = run(q[None, :])
+            single.append((time.perf_counter() - t0) * 1000)
+            ids.append(res["ids"][0])
+        batched = []
+        for start in range(0, len(queries), args.batch):
+            chunk = queries[start:start + args.batch]
+            t0 = time.perf_counter()
+            run(chunk)
+            batched.append((time.perf_counter() - t0) * 1000 / len(chunk))
+        results[name] = ids
+        print(f"[{name:6}] từng câu: {_percentiles(single)} | lô {args.batch}: {_percentiles(batched)} /câu")
+
+    # Chỉ mục phẳng là cosine chính xác (brute force), dùng làm chuẩn
+    exact = results["flat"]
+    for name, ids in results.items():
+        recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(ids, exact) if b])
+        print(f"[{name:6}] recall@{k} so với cosine chính xác: {recall:.4f}")
+    same_order = np.mean([a == b for a, b in zip(results["chroma"], results["flat"])])
+    same_top1 = np.mean([a[:1] == b[:1] for a, b in zip(results["chroma"], results["flat"])])
+    print(f"Top-{k} trùng thứ tự giữa hai engine: {same_order:.4f} | top-1 trùng: {same_top1:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/bench_startup.py
+
+"""
+Đo thời gian import của app.py tới lần render đầu tiên, có ngưỡng hồi quy.
+
+Lấy các câu lệnh import ở cấp module của app.py (đúng những gì Streamlit phải import
+trước khi vẽ giao diện), import chúng trong process Python mới, lặp nhiều lần và lấy
+trung vị. Đồng thời kiểm tra các thư viện nặng (chromadb, sentence_transformers/torch,
+langgraph, google.genai, docx, pandas, onnxruntime) KHÔNG bị import ở bước này — chúng
+chỉ được nạp trong thread nền (agent_core/bootstrap.py).
+
+    python benchmarks/bench_startup.py                     # so với ngưỡng STARTUP_IMPORT_BUDGET_MS
+    python benchmarks/bench_startup.py --update-baseline   # ghi benchmarks/startup_baseline.json
+    python benchmarks/bench_startup.py --top 15            # các module import chậm nhất (-X importtime)
+    python benchmarks/bench_startup.py --warmup            # thêm thời gian nạp agent graph nền
+
+Mã thoát 1 nếu vượt ngưỡng tuyệt đối, chậm hơn baseline quá --tolerance, hoặc có thư viện nặng bị import.
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+HEAVY_MODULES = (
+    "chromadb", "sentence_transformers", "torch", "transformers", "onnxruntime",
+    "langgraph", "langchain_core", "google.genai", "docx", "pandas",
+)
+
+
+def app_imports(path: str = APP_PATH):
+    """
+    Các câu lệnh import ở cấp module của app.py (dạng mã nguồn).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _child_code(statements, warmup: bool) -> str:
+    lines = [
+        "import sys, time, json",
+        "t0 = time.perf_counter()",
+        *statements,
+        "imports_ms = (time.perf_counter() - t0) * 1000",
+        f"heavy = sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)",
+        "warmup_ms = None",
+    ]
+    if warmup:
+        lines += [
+            "from agent_core.bootstrap import get_agent_graph",
+            "t1 = time.perf_counter()",
+            "get_agent_graph()",
+            "warmup_ms = (time.perf_counter() - t1) * 1000",
+        ]
+    lines.append("print(json.dumps({'imports_ms': imports_ms, 'heavy': heavy, 'warmup_ms': warmup_ms}))")
+    return "\n".join(lines)
+
+
+def run_once(statements, warmup: bool = False):
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", _child_code(statements, warmup)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if out.returncode != 0:
+        raise RuntimeError(f"Import app.py thất bại:\n{out.stderr.strip()}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["wall_ms"] = wall_ms
+    return result
+
+
+def top_imports(statements, top: int):
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(statements)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thời gian import app.py tới lần render đầu tiên")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS, help="ngưỡng tuyệt đối (trung vị)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="cho phép chậm hơn baseline bao nhiêu (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--top", type=int, default=0, help="in N module import chậm nhất")
+    parser.add_argument("--warmup", action="store_true", help="đo thêm thời gian nạp agent graph (cần dữ liệu/mô hình thật)")
+    args = parser.parse_args()
+
+    statements = app_imports()
+    results = [run_once(statements) for _ in range(args.runs)]
+    imports_ms = statistics.median(r["imports_ms"] for r in results)
+    wall_ms = statistics.median(r["wall_ms"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy"]})
+    print(f"Import app.py ({len(statements)} câu lệnh, {args.runs} lần): trung vị {imports_ms:.0f}ms "
+          f"(cả khởi động interpreter: {wall_ms:.0f}ms), ngưỡng {args.max_ms:.0f}ms")
+
+    if args.top:
+        print(f"{'tích luỹ ms':>12} {'riêng ms':>9}  module")
+        for cumulative_us, self_us, name in top_imports(statements, args.top):
+            print(f"{cumulative_us / 1000:>12.1f} {self_us / 1000:>9.1f}  {name}")
+
+    if args.warmup:
+        warm = run_once(statements, warmup=True)
+        print(f"Nạp agent graph (thread nền trong app): {warm['warmup_ms']:.0f}ms")
+
+    failed = False
+    if heavy:
+        print(f"❌ Thư viện nặng bị import trước lần render đầu tiên: {', '.join(heavy)}")
+        failed = True
+    if imports_ms > args.max_ms:
+        print(f"❌ Vượt ngưỡng: {imports_ms:.0f}ms > {args.max_ms:.0f}ms")
+        failed = True
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"imports_ms": round(imports_ms, 1), "python": sys.version.split()[0]}, f, indent=2)
+        print(f"Đã ghi baseline: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["imports_ms"]
+        limit = baseline * (1 + args.tolerance)
+        print(f"Baseline {baseline:.0f}ms, cho phép tới {limit:.0f}ms")
+        if imports_ms > limit:
+            print(f"❌ Hồi quy: chậm hơn baseline {imports_ms / baseline - 1:.0%}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Đạt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Đọc danh sách session và lịch sử tin nhắn cho giao diện (sidebar / khung chat).
+
+- Danh sách session được cache trong process (SESSION_LIST_TTL giây); session mới
+  do chính process này tạo được thêm thẳng vào cache nên không cần đọc lại CSDL.
+- Lịch sử tin nhắn đọc theo trang (keyset pagination trên (timestamp, id)):
+  trang đầu là các lượt mới nhất, "tải cũ hơn" dùng con trỏ của trang trước.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from connect_SQL.store import get_conversation_store
+
+SESSION_LIST_TTL = float(os.getenv("SESSION_LIST_TTL", "30"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+
+
+class SessionListCache:
+    """
+    Cache danh sách (SessionId, FirstMessageSummary) mới nhất. Thread-safe.
+    """
+    def __init__(self, ttl_seconds: float = SESSION_LIST_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._sessions: List[Tuple[str, str]] = []
+        self._limit = 0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, limit: int = 5) -> List[Tuple[str, str]]:
+        with self._lock:
+            if limit <= self._limit and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._sessions[:limit]
+        sessions = _fetch_sessions(limit)
+        if sessions is None:
+            # CSDL lỗi: dùng tạm danh sách cũ nếu có
+            with self._lock:
+                return self._sessions[:limit]
+        with self._lock:
+            self._sessions = sessions
+            self._limit = limit
+            self._loaded_at = time.monotonic()
+            return sessions[:limit]
+
+    def add_local(self, session_id: str, summary: str) -> None:
+        """
+        Session vừa được process này tạo: đưa lên đầu danh sách đã cache.
+        """
+        with self._lock:
+            self._sessions = [(session_id, summary)] + [s for s in self._sessions if s[0] != session_id]
+            if self._limit:
+                self._sessions = self._sessions[:self._limit]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+def _fetch_sessions(limit: int) -> Optional[List[Tuple[str, str]]]:
+    try:
+        return get_conversation_store().list_sessions(limit)
+    except Exception as e:
+        print(f"Lỗi khi lấy danh sách session: {e}")
+        return None
+
+
+SESSION_CACHE = SessionListCache()
+
+
+def get_chat_sessions(limit: int = 5) -> list:
+    return SESSION_CACHE.get(limit)
+
+
+def get_messages_page(session_id: str, cursor: Optional[Dict[str, Any]] = None, limit: int = HISTORY_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Một trang lịch sử của session, theo thứ tự cũ -> mới (phù hợp với st.session_state.messages).
+    cursor=None: trang mới nhất; ngược lại cursor của trang trước ({"timestamp", "id"}).
+    Trả về {"messages": [...], "cursor": con trỏ cho trang cũ hơn hoặc None nếu đã hết}.
+    """
+    messages: List[Dict[str, str]] = []
+    if not session_id:
+        return {"messages": messages, "cursor": None}
+
+    try:
+        rows = get_conversation_store().history_page(session_id, cursor, limit + 1)
+    except Exception as e:
+        print(f"Lỗi khi lấy tin nhắn của session {session_id}: {e}")
+        return {"messages": messages, "cursor": None}
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    for row in reversed(rows):
+        if row.user_message:
+            messages.append({"role": "user", "content": row.user_message})
+        if row.bot_response:
+            messages.append({"role": "assistant", "content": row.bot_response})
+
+    next_cursor = None
+    if has_more and rows:
+        oldest = rows[-1]
+        next_cursor = {"timestamp": oldest.timestamp, "id": oldest.id}
+    return {"messages": messages, "cursor": next_cursor}
@@ -1,11 +1,35 @@
-from sqlalchemy import create_engine
+"""
+Engine SQLAlchemy dùng chung cho toàn process.
+
+Trước đây mỗi lần gọi connect_sql() đều đọc lại config.json, tạo engine mới
+(kèm một pool ODBC mới) và mở thử một kết nối. Giờ engine được tạo một lần
+(lười, thread-safe) với pool có cấu hình, connect_sql() chỉ trả lại engine đó.
+
+Cấu hình pool qua biến môi trường:
+    SQL_POOL_SIZE (5), SQL_MAX_OVERFLOW (10), SQL_POOL_TIMEOUT (30 giây),
+    SQL_POOL_RECYCLE (1800 giây), SQL_POOL_PRE_PING (1), SQL_POOL_WARM (1 kết nối mở sẵn)
+"""
+
+from sqlalchemy import create_engine, text
 import json
 import os
+import time
+import threading
 
-def connect_sql():
+from utils.paths import resolve_path
+
+SQL_CONFIG_PATH = resolve_path("SQL_CONFIG_PATH", "connect_SQL", "config.json")
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "5"))
+SQL_MAX_OVERFLOW = int(os.getenv("SQL_MAX_OVERFLOW", "10"))
+SQL_POOL_TIMEOUT = float(os.getenv("SQL_POOL_TIMEOUT", "30"))
+SQL_POOL_RECYCLE = int(os.getenv("SQL_POOL_RECYCLE", "1800"))
+SQL_POOL_PRE_PING = os.getenv("SQL_POOL_PRE_PING", "1") == "1"
+SQL_POOL_WARM = int(os.getenv("SQL_POOL_WARM", "1"))
+# Sau khi tạo engine lỗi, chờ ít nhất chừng này giây mới thử lại
+SQL_RETRY_INTERVAL = float(os.getenv("SQL_RETRY_INTERVAL", "5"))
 
-    config_path = "D:/Chatbot_Data4Life/v1/connect_SQL/config.json"
 
+def _build_connection_string(config_path: str) -> str:
     with open(config_path, "r") as f:
         config = json.load(f)
 
@@ -15,19 +39,133 @@ def connect_sql():
     DB_PASSWORD = config["connection"]["password"]
     ODBC_DRIVER = "ODBC Driver 17 for SQL Server"
 
-    CONNECTION_STRING = (
+    return (
         f"mssql+pyodbc://{DB_USERNAME}:{DB_PASSWORD}@{DB_SERVER}/{DB_DATABASE}"
         f"?driver={ODBC_DRIVER.replace(' ', '+')}"
     )
 
 
-    try:
-        engine = create_engine(CONNECTION_STRING)
+class EngineManager:
+    """
+    Giữ một engine duy nhất. get_engine() tạo engine ở lần gọi đầu tiên,
+    warmup() cho phép tạo sẵn (và mở sẵn kết nối) ngoài đường xử lý request.
+    """
+    def __init__(self, config_path: str = SQL_CONFIG_PATH):
+        self.config_path = config_path
+        self._engine = None
+        self._lock = threading.Lock()
+        self._last_error = None
+        self._failed_at = 0.0
+        self._created_at = None
+
+    def _create(self):
+        engine = create_engine(
+            _build_connection_string(self.config_path),
+            pool_size=SQL_POOL_SIZE,
+            max_overflow=SQL_MAX_OVERFLOW,
+            pool_timeout=SQL_POOL_TIMEOUT,
+            pool_recycle=SQL_POOL_RECYCLE,
+            pool_pre_ping=SQL_POOL_PRE_PING,
+            # executemany theo lô của pyodbc (dùng cho ghi log theo lô)
+            fast_executemany=True,
+        )
         with engine.connect() as connection:
             print("Kết nối tới SQL Server thành công!")
         return engine
-    except Exception as e:
-        print(f"Lỗi kết nối CSDL: {e}")
-        print("Vui lòng kiểm tra lại thông tin trong CONNECTION_STRING.")
-        return None
 
+    def get_engine(self):
+        """
+        Engine dùng chung; None nếu không kết nối được (giống connect_sql() cũ).
+        """
+        if self._engine is not None:
+            return self._engine
+        with self._lock:
+            if self._engine is not None:
+                return self._engine
+            if self._last_error is not None and time.monotonic() - self._failed_at < SQL_RETRY_INTERVAL:
+                return None
+            try:
+                self._engine = self._create()
+                self._created_at = time.time()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                self._failed_at = time.monotonic()
+                print(f"Lỗi kết nối CSDL: {e}")
+                print("Vui lòng kiểm tra lại thông tin trong CONNECTION_STRING.")
+            return self._engine
+
+    def warmup(self, connections: int = SQL_POOL_WARM) -> bool:
+        """
+        Tạo engine và mở sẵn `connections` kết nối trong pool.
+        """
+        engine = self.get_engine()
+        if engine is None:
+            return False
+        opened = []
+        try:
+            for _ in range(max(0, min(connections, SQL_POOL_SIZE))):
+                opened.append(engine.connect())
+        except Exception as e:
+            print(f"Lỗi khi mở sẵn kết nối CSDL: {e}")
+        finally:
+            for conn in opened:
+                conn.close()
+        return True
+
+    def warmup_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warmup, name="sql-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def health(self, ping: bool = False) -> dict:
+        """
+        Trạng thái engine/pool; ping=True chạy thêm SELECT 1 để đo độ trễ.
+        """
+        engine = self._engine
+        report = {
+            "initialized": engine is not None,
+            "created_at": self._created_at,
+            "last_error": self._last_error,
+        }
+        if engine is None:
+            return report
+        pool = engine.pool
+        report.update({
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "status": pool.status(),
+        })
+        if ping:
+            t0 = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                report["ping_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                report["ok"] = True
+            except Exception as e:
+                report["ok"] = False
+                report["ping_error"] = str(e)
+        return report
+
+    def dispose(self) -> None:
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+
+
+SQL_ENGINE = EngineManager()
+
+
+def connect_sql():
+    """
+    Giữ nguyên giao diện cũ: trả về engine SQLAlchemy (dùng chung), None nếu lỗi.
+    """
+    return SQL_ENGINE.get_engine()
+
+
+def sql_health(ping: bool = False) -> dict:
+    return SQL_ENGINE.health(ping=ping)
@@ -0,0 +1,426 @@
+"""
+Ghi log hội thoại kiểu write-behind (ghi nền theo lô).
+
+app.py chỉ đưa bản ghi vào hàng đợi (giới hạn kích thước) rồi hiển thị câu trả lời
+ngay; một thread nền gom bản ghi thành lô và ghi ChatSessions / conversation_history /
+query_results trong một transaction cho mỗi lô. Lỗi tạm thời được thử lại với
+backoff; nếu CSDL vẫn không ghi được (hoặc hàng đợi đầy) bản ghi được ghi ra file
+JSONL cục bộ và được ghi bù khi CSDL hoạt động lại (kèm tên callback on_written
+để vẫn gọi được sau khi ghi bù). Bản ghi lỗi dữ liệu / ràng buộc, dòng JSON hỏng
+(vd. dòng cuối bị cắt khi process chết giữa lúc ghi) và bản ghi lỗi quá
+LOG_MAX_REPLAY_ATTEMPTS lần ghi bù được chuyển sang file reject để không chặn các
+bản ghi phía sau. Câu lệnh SQL nằm trong kho hội thoại
+(connect_SQL/store.py: write_batch).
+
+Cấu hình qua biến môi trường:
+    LOG_QUEUE_MAX (1000), LOG_BATCH_SIZE (50), LOG_FLUSH_INTERVAL (0.5 giây),
+    LOG_MAX_RETRIES (3), LOG_SPILL_PATH (logs/pending_conversation_logs.jsonl),
+    LOG_REJECT_PATH (logs/rejected_conversation_logs.jsonl), LOG_MAX_REPLAY_ATTEMPTS (5)
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import importlib
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from connect_SQL.store import get_conversation_store
+from utils.metrics import METRICS
+
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "1000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_MAX_RETRIES = int(os.getenv("LOG_MAX_RETRIES", "3"))
+LOG_SPILL_PATH = os.getenv("LOG_SPILL_PATH", os.path.join("logs", "pending_conversation_logs.jsonl"))
+LOG_REJECT_PATH = os.getenv("LOG_REJECT_PATH", os.path.join("logs", "rejected_conversation_logs.jsonl"))
+LOG_MAX_REPLAY_ATTEMPTS = int(os.getenv("LOG_MAX_REPLAY_ATTEMPTS", "5"))
+
+OnWritten = Callable[[str], Any]
+
+# Khoá phụ trong dòng của file spill (không phải cột CSDL)
+_CALLBACK_KEY = "_on_written"
+_ATTEMPTS_KEY = "_replay_attempts"
+_ERROR_KEY = "_error"
+_RAW_LINE_KEY = "_raw_line"
+
+# Lỗi nằm ở chính bản ghi (thiếu trường, sai kiểu, vi phạm ràng buộc): ghi lại cũng không được
+_DATA_ERRORS = (KeyError, TypeError, ValueError, DataError, IntegrityError)
+
+
+def _callback_name(func: Optional[OnWritten]) -> Optional[str]:
+    """
+    "module:tên" của hàm cấp module để lưu vào file spill; None với lambda/closure.
+    """
+    name = getattr(func, "__qualname__", "")
+    module = getattr(func, "__module__", None)
+    if not module or not name or "<" in name:
+        return None
+    return f"{module}:{name}"
+
+
+def _resolve_callback(name: Optional[str]) -> Optional[OnWritten]:
+    if not name:
+        return None
+    try:
+        module, _, attr = name.partition(":")
+        func: Any = importlib.import_module(module)
+        for part in attr.split("."):
+            func = getattr(func, part)
+        return func
+    except Exception as e:
+        print(f"⚠️ Không tìm thấy callback {name} để gọi sau khi ghi bù: {e}")
+        return None
+
+
+class ConversationLogWriter:
+    """
+    Hàng đợi + worker ghi log theo lô. Thread-safe; submit() không bao giờ chặn.
+    """
+    def __init__(
+        self,
+        store_getter: Callable[[], Any] = get_conversation_store,
+        max_queue: int = LOG_QUEUE_MAX,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        max_retries: int = LOG_MAX_RETRIES,
+        spill_path: str = LOG_SPILL_PATH,
+        reject_path: str = LOG_REJECT_PATH,
+        max_replay_attempts: int = LOG_MAX_REPLAY_ATTEMPTS,
+    ):
+        self.store_getter = store_getter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self.reject_path = reject_path
+        self.max_replay_attempts = max_replay_attempts
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Optional[OnWritten]]]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stats = {"written": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0, "rejected": 0}
+
+    # ------------------------------------------
+    # 📥 Nhận bản ghi
+    # ------------------------------------------
+    def submit(self, record: Dict[str, Any], on_written: Optional[OnWritten] = None) -> bool:
+        """
+        Đưa bản ghi vào hàng đợi. record gồm: session_id, is_new_session, summary,
+        user_query, ai_response, intermediate_steps, model_name, timestamp.
+        on_written(session_id) được gọi (trong worker) sau khi bản ghi đã commit.
+        Trả về False nếu hàng đợi đầy (bản ghi được ghi ra file spill).
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((record, on_written))
+            return True
+        except queue.Full:
+            print("⚠️ Hàng đợi log đầy, ghi tạm bản ghi ra file.")
+            self._spill([(record, on_written)])
+            return False
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="log-writer", daemon=True)
+                self._thread.start()
+
+    # ------------------------------------------
+    # 🔁 Worker
+    # ------------------------------------------
+    def _worker(self) -> None:
+        self._safe_replay_spill()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    self._queue.task_done()
+                    break
+                batch.append(nxt)
+            try:
+                self._process(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _process(self, batch: List[Tuple[Dict[str, Any], Optional[OnWritten]]]) -> None:
+        records = [record for record, _ in batch]
+        if self._write_with_retry(records):
+            self._after_write(batch)
+            self._safe_replay_spill()
+            return
+
+        # Lô lỗi: thử từng bản ghi để một bản ghi hỏng không kéo theo cả lô
+        failed = []
+        for item in batch:
+            try:
+                self._write_batch([item[0]])
+                self._after_write([item])
+            except Exception as e:
+                print(f"⚠️ Không ghi được log của session {item[0].get('session_id')}: {e}")
+                failed.append(item)
+        if failed:
+            self._spill(failed)
+
+    def _write_with_retry(self, records: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                t0 = time.perf_counter()
+                self._write_batch(records)
+                METRICS.observe("log_writer.batch", (time.perf_counter() - t0) * 1000)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"⚠️ Ghi log thất bại sau {attempt + 1} lần thử: {e}")
+                    return False
+                self._stats["retries"] += 1
+                METRICS.increment("log_writer.retries")
+                time.sleep(min(10.0, 0.5 * (2 ** attempt)))
+        return False
+
+    def _write_batch(self, records: List[Dict[str, Any]]) -> None:
+        self.store_getter().write_batch(records)
+
+    def _after_write(self, batch: List[Tuple[Dict[str, Any], Optional[OnWritten]]]) -> None:
+        self._stats["written"] += len(batch)
+        self._stats["batches"] += 1
+        METRICS.increment("log_writer.written", len(batch))
+        for record, on_written in batch:
+            if on_written is None:
+                continue
+            try:
+                on_written(record["session_id"])
+            except Exception as e:
+                print(f"⚠️ Lỗi callback sau khi ghi log: {e}")
+
+    # ------------------------------------------
+    # 💾 File spill
+    # ------------------------------------------
+    @staticmethod
+    def _end_partial_line(path: str) -> None:
+        """
+        Dòng cuối bị cắt (process chết giữa lúc ghi): xuống dòng trước khi ghi tiếp
+        để dòng mới không dính vào dòng hỏng.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _append_jsonl(self, path: str, rows: List[Dict[str, Any]]) -> None:
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._end_partial_line(path)
+            with open(path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    row = dict(row)
+                    if isinstance(row.get("timestamp"), datetime):
+                        row["timestamp"] = row["timestamp"].isoformat()
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def _spill(self, items: List[Tuple[Dict[str, Any], Optional[OnWritten]]]) -> None:
+        rows = []
+        for record, on_written in items:
+            row = dict(record)
+            name = _callback_name(on_written)
+            if name:
+                row[_CALLBACK_KEY] = name
+            rows.append(row)
+        self._append_jsonl(self.spill_path, rows)
+        self._stats["spilled"] += len(rows)
+        METRICS.increment("log_writer.spilled", len(rows))
+
+    def _reject(self, rows: List[Tuple[Dict[str, Any], str]]) -> None:
+        """
+        Bản ghi không bao giờ ghi được (dữ liệu hỏng...): chuyển sang file reject để xem tay.
+        """
+        self._append_jsonl(self.reject_path, [{**row, _ERROR_KEY: error} for row, error in rows])
+        self._stats["rejected"] += len(rows)
+        METRICS.increment("log_writer.rejected", len(rows))
+        print(f"⚠️ Chuyển {len(rows)} bản ghi log không ghi được sang {self.reject_path}")
+
+    def _safe_replay_spill(self) -> None:
+        """
+        Ghi bù không bao giờ được làm chết worker; file .replaying còn lại sẽ được ghi tiếp lần sau.
+        """
+        try:
+            self._replay_spill()
+        except Exception as e:
+            METRICS.increment("log_writer.replay_error")
+            print(f"⚠️ Lỗi khi ghi bù log từ {self.spill_path}: {e}")
+
+    def _take_spill(self) -> Optional[str]:
+        """
+        Chuyển file spill sang file .replaying để ghi bù. Nếu lần ghi bù trước bị ngắt
+        (còn file .replaying) thì ghi tiếp file đó, nối thêm spill mới vào cuối.
+        """
+        replay_path = self.spill_path + ".replaying"
+        with self._spill_lock:
+            if os.path.exists(self.spill_path):
+                if os.path.exists(replay_path):
+                    self._end_partial_line(replay_path)
+                    with open(self.spill_path, "rb") as src, open(replay_path, "ab") as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.spill_path)
+                else:
+                    os.replace(self.spill_path, replay_path)
+            elif not os.path.exists(replay_path):
+                return None
+        return replay_path
+
+    def _replay_spill(self) -> None:
+        """
+        Ghi bù các bản ghi trong file spill (gọi trong worker, khi CSDL vừa ghi thành công).
+        Lô lỗi thì thử từng bản ghi (giống _process): lỗi dữ liệu -> file reject, lỗi khác
+        -> spill lại (tối đa max_replay_attempts lần). Callback on_written của các bản ghi
+        đã ghi bù được gọi một lần cho mỗi session.
+        """
+        replay_path = self._take_spill()
+        if replay_path is None:
+            return
+
+        rows = []
+        rejected: List[Tuple[Dict[str, Any], str]] = []
+        with open(replay_path, "r", encoding="utf-8", errors="replace") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("dòng không phải object JSON")
+                    if isinstance(row.get("timestamp"), str):
+                        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                except ValueError as e:
+                    rejected.append(({_RAW_LINE_KEY: line.rstrip("\n")}, f"dòng {line_no}: {e}"))
+                    continue
+                rows.append(row)
+
+        def _record(row):
+            return {k: v for k, v in row.items() if k not in (_CALLBACK_KEY, _ATTEMPTS_KEY)}
+
+        written: List[Dict[str, Any]] = []
+        pending: List[Dict[str, Any]] = []
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            try:
+                self._write_batch([_record(row) for row in chunk])
+                written.extend(chunk)
+                continue
+            except Exception as e:
+                chunk_error = str(e)
+
+            chunk_written = 0
+            failed: List[Tuple[Dict[str, Any], str]] = []
+            for row in chunk:
+                try:
+                    self._write_batch([_record(row)])
+                    written.append(row)
+                    chunk_written += 1
+                except _DATA_ERRORS as e:
+                    rejected.append((row, str(e)))
+                except Exception as e:
+                    failed.append((row, str(e)))
+
+            # Lỗi tạm thời (mất kết nối...): spill lại, quá số lần thì chuyển sang reject
+            for row, error in failed:
+                row = {**row, _ATTEMPTS_KEY: row.get(_ATTEMPTS_KEY, 0) + 1}
+                if row[_ATTEMPTS_KEY] >= self.max_replay_attempts:
+                    rejected.append((row, error))
+                else:
+                    pending.append(row)
+            if failed and not chunk_written:
+                # Không bản ghi nào ghi được: CSDL có thể chưa sẵn sàng, để lần sau
+                print(f"⚠️ Chưa ghi bù được log từ file spill: {chunk_error}")
+                pending.extend(rows[start + len(chunk):])
+                break
+
+        if pending:
+            self._append_jsonl(self.spill_path, pending)
+        os.remove(replay_path)
+
+        if rejected:
+            self._reject(rejected)
+        if written:
+            self._stats["replayed"] += len(written)
+            METRICS.increment("log_writer.replayed", len(written))
+            print(f"Đã ghi bù {len(written)} bản ghi log từ {self.spill_path}")
+            self._after_replay(written)
+
+    def _after_replay(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Gọi callback (vd. schedule_summary_update) cho các session vừa được ghi bù.
+        """
+        sessions: Dict[str, set] = {}
+        for row in rows:
+            if row.get(_CALLBACK_KEY) and row.get("session_id"):
+                sessions.setdefault(row[_CALLBACK_KEY], set()).add(row["session_id"])
+        for name, session_ids in sessions.items():
+            callback = _resolve_callback(name)
+            if callback is None:
+                continue
+            for session_id in session_ids:
+                try:
+                    callback(session_id)
+                except Exception as e:
+                    print(f"⚠️ Lỗi callback sau khi ghi bù log: {e}")
+
+    # ------------------------------------------
+    # 🛑 Dừng / thống kê
+    # ------------------------------------------
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ hàng đợi được xử lý hết. Trả về False nếu quá timeout.
+        """
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queued": self._queue.qsize()}
+
+
+LOG_WRITER = ConversationLogWriter()
+atexit.register(LOG_WRITER.close)
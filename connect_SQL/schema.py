@@ -0,0 +1,188 @@
+"""
+Schema + migration cho kho hội thoại (ChatSessions, conversation_history, query_results).
+
+Mỗi migration có câu lệnh riêng cho từng dialect ("mssql", "sqlite") và được ghi lại
+trong bảng schema_migrations nên chạy lại nhiều lần không sao. Index đi kèm đúng
+các truy vấn đang dùng:
+
+- conversation_history(session_id, timestamp, id): lịch sử theo trang (keyset) và
+  memory gần nhất của một session.
+- ChatSessions(CreatedAt): danh sách session mới nhất ở sidebar.
+- query_results(conversation_id): tra log theo lượt hội thoại.
+
+Chạy tay cho SQL Server:
+    python -m connect_SQL.schema --backend mssql
+"""
+
+import argparse
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+MIGRATIONS: List[Tuple[int, str, Dict[str, List[str]]]] = [
+    (
+        1,
+        "bảng hội thoại",
+        {
+            "mssql": [
+                """
+                IF OBJECT_ID(N'dbo.ChatSessions', N'U') IS NULL
+                CREATE TABLE dbo.ChatSessions (
+                    SessionId NVARCHAR(100) NOT NULL PRIMARY KEY,
+                    FirstMessageSummary NVARCHAR(200) NULL,
+                    CreatedAt DATETIME2 NOT NULL
+                )
+                """,
+                """
+                IF OBJECT_ID(N'dbo.conversation_history', N'U') IS NULL
+                CREATE TABLE dbo.conversation_history (
+                    id INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+                    session_id NVARCHAR(100) NOT NULL,
+                    user_message NVARCHAR(MAX) NULL,
+                    bot_response NVARCHAR(MAX) NULL,
+                    timestamp DATETIME2 NOT NULL
+                )
+                """,
+                """
+                IF OBJECT_ID(N'dbo.query_results', N'U') IS NULL
+                CREATE TABLE dbo.query_results (
+                    id INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+                    conversation_id INT NOT NULL,
+                    query_text NVARCHAR(MAX) NULL,
+                    response_text NVARCHAR(MAX) NULL,
+                    retrieved_docs NVARCHAR(MAX) NULL,
+                    model_name NVARCHAR(100) NULL,
+                    timestamp DATETIME2 NOT NULL
+                )
+                """,
+            ],
+            "sqlite": [
+                """
+                CREATE TABLE IF NOT EXISTS ChatSessions (
+                    SessionId TEXT NOT NULL PRIMARY KEY,
+                    FirstMessageSummary TEXT,
+                    CreatedAt TIMESTAMP NOT NULL
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS conversation_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    user_message TEXT,
+                    bot_response TEXT,
+                    timestamp TIMESTAMP NOT NULL
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS query_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id INTEGER NOT NULL,
+                    query_text TEXT,
+                    response_text TEXT,
+                    retrieved_docs TEXT,
+                    model_name TEXT,
+                    timestamp TIMESTAMP NOT NULL
+                )
+                """,
+            ],
+        },
+    ),
+    (
+        2,
+        "index cho lịch sử, sidebar và query_results",
+        {
+            "mssql": [
+                """
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_conversation_history_session_ts'
+                               AND object_id = OBJECT_ID(N'dbo.conversation_history'))
+                CREATE INDEX IX_conversation_history_session_ts
+                    ON dbo.conversation_history (session_id, timestamp DESC, id DESC)
+                    INCLUDE (user_message, bot_response)
+                """,
+                """
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_ChatSessions_CreatedAt'
+                               AND object_id = OBJECT_ID(N'dbo.ChatSessions'))
+                CREATE INDEX IX_ChatSessions_CreatedAt
+                    ON dbo.ChatSessions (CreatedAt DESC)
+                    INCLUDE (FirstMessageSummary)
+                """,
+                """
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_query_results_conversation'
+                               AND object_id = OBJECT_ID(N'dbo.query_results'))
+                CREATE INDEX IX_query_results_conversation
+                    ON dbo.query_results (conversation_id)
+                """,
+            ],
+            "sqlite": [
+                """
+                CREATE INDEX IF NOT EXISTS IX_conversation_history_session_ts
+                    ON conversation_history (session_id, timestamp DESC, id DESC)
+                """,
+                """
+                CREATE INDEX IF NOT EXISTS IX_ChatSessions_CreatedAt
+                    ON ChatSessions (CreatedAt DESC)
+                """,
+                """
+                CREATE INDEX IF NOT EXISTS IX_query_results_conversation
+                    ON query_results (conversation_id)
+                """,
+            ],
+        },
+    ),
+]
+
+_VERSION_TABLE = {
+    "mssql": """
+        IF OBJECT_ID(N'dbo.schema_migrations', N'U') IS NULL
+        CREATE TABLE dbo.schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            description NVARCHAR(200) NULL,
+            applied_at DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER NOT NULL PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+
+def migrate(engine, dialect: str) -> List[int]:
+    """
+    Áp dụng các migration chưa chạy. Trả về danh sách version vừa áp dụng.
+    """
+    if dialect not in _VERSION_TABLE:
+        raise ValueError(f"❌ Dialect không được hỗ trợ: {dialect}")
+
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(_VERSION_TABLE[dialect]))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations")).fetchall()}
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            for statement in statements[dialect]:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                {"v": version, "d": description},
+            )
+        applied_now.append(version)
+        print(f"Đã áp dụng migration {version}: {description}")
+    return applied_now
+
+
+if __name__ == "__main__":
+    from connect_SQL.store import build_conversation_store
+
+    parser = argparse.ArgumentParser(description="Tạo/cập nhật schema kho hội thoại")
+    parser.add_argument("--backend", choices=["mssql", "sqlite"], default=None)
+    args = parser.parse_args()
+
+    store = build_conversation_store(args.backend)
+    print(f"Migration đã áp dụng: {store.ensure_schema() or 'không có (đã cập nhật)'}")
@@ -0,0 +1,301 @@
+"""
+Kho hội thoại: một giao diện cho mọi truy cập CSDL của chatbot
+(memory gần nhất, ghi log, danh sách session, lịch sử theo trang).
+
+- MSSQLConversationStore: SQL Server hiện tại (TOP, DATEADD, OUTPUT INSERTED.id),
+  dùng engine chung của connect_SQL.connect_SQL.
+- SQLiteConversationStore: SQLite nhúng, không cần SQL Server (chạy thử, benchmark).
+
+Chọn bằng CONVERSATION_STORE=mssql|sqlite (mặc định mssql);
+file SQLite đặt bằng CONVERSATION_SQLITE_PATH.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, text
+
+from connect_SQL.connect_SQL import connect_sql
+from connect_SQL.schema import migrate
+
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "mssql")
+CONVERSATION_SQLITE_PATH = os.getenv("CONVERSATION_SQLITE_PATH", "conversations.sqlite")
+
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def local_now() -> datetime:
+    """
+    Giờ Việt Nam, không kèm tzinfo — cùng quy ước với cột timestamp đang lưu.
+    """
+    return datetime.now(VN_TZ).replace(tzinfo=None)
+
+
+class ConversationStore(ABC):
+    """
+    Record ghi log: session_id, is_new_session, summary, user_query, ai_response,
+    intermediate_steps, model_name, timestamp.
+    Dòng lịch sử: {"id", "user_message", "bot_response", "timestamp"}.
+    """
+    dialect = ""
+
+    @abstractmethod
+    def engine(self):
+        ...
+
+    # ------------------------------------------
+    # 🧠 Memory
+    # ------------------------------------------
+    @abstractmethod
+    def recent_exchanges(self, session_id: str, after_id: int, limit: int, window_hours: int) -> List[Dict[str, Any]]:
+        """
+        Tối đa `limit` lượt mới nhất có id > after_id trong `window_hours` giờ gần đây,
+        theo thứ tự cũ -> mới: [{"id", "user", "chatbot"}].
+        """
+
+    # ------------------------------------------
+    # 📝 Ghi log
+    # ------------------------------------------
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Một transaction cho cả lô: ChatSessions (executemany) -> conversation_history
+        (từng dòng để lấy id) -> query_results (executemany).
+        """
+        engine = self.engine()
+        with engine.begin() as conn:
+            sessions = [
+                {"sid": r["session_id"], "summary": r["summary"], "timestamp": r["timestamp"]}
+                for r in records if r.get("is_new_session")
+            ]
+            if sessions:
+                conn.execute(self._insert_session, sessions)
+
+            query_rows = []
+            for r in records:
+                conversation_id = self._insert_conversation(conn, {
+                    "sid": r["session_id"],
+                    "user_msg": r["user_query"],
+                    "bot_res": r["ai_response"],
+                    "timestamp": r["timestamp"],
+                })
+                query_rows.append({
+                    "conv_id": conversation_id,
+                    "q_text": r["user_query"],
+                    "res_text": r["ai_response"],
+                    "r_docs": r["intermediate_steps"],
+                    "model": r["model_name"],
+                    "timestamp": r["timestamp"],
+                })
+            conn.execute(self._insert_query_result, query_rows)
+
+    _insert_session = None
+    _insert_query_result = None
+
+    @abstractmethod
+    def _insert_conversation(self, conn, params: Dict[str, Any]) -> int:
+        ...
+
+    # ------------------------------------------
+    # 🗂️ Sidebar / lịch sử
+    # ------------------------------------------
+    @abstractmethod
+    def list_sessions(self, limit: int) -> List[Tuple[str, str]]:
+        ...
+
+    @abstractmethod
+    def history_page(self, session_id: str, cursor: Optional[Dict[str, Any]], limit: int) -> List[Any]:
+        """
+        Tối đa `limit` dòng mới nhất (timestamp DESC, id DESC), cũ hơn cursor nếu có.
+        """
+
+    def ensure_schema(self) -> List[int]:
+        return migrate(self.engine(), self.dialect)
+
+
+class MSSQLConversationStore(ConversationStore):
+    dialect = "mssql"
+
+    _insert_session = text("""
+        INSERT INTO ChatSessions (SessionId, FirstMessageSummary, CreatedAt)
+        VALUES (:sid, :summary, :timestamp)
+    """)
+    _insert_conversation_sql = text("""
+        INSERT INTO dbo.conversation_history (session_id, user_message, bot_response, timestamp)
+        OUTPUT INSERTED.id
+        VALUES (:sid, :user_msg, :bot_res, :timestamp)
+    """)
+    _insert_query_result = text("""
+        INSERT INTO dbo.query_results (conversation_id, query_text, response_text, retrieved_docs, model_name, timestamp)
+        VALUES (:conv_id, :q_text, :res_text, :r_docs, :model, :timestamp)
+    """)
+    _sessions_sql = text("""
+        SELECT TOP (:limit) SessionId, FirstMessageSummary
+        FROM dbo.ChatSessions
+        ORDER BY CreatedAt DESC
+    """)
+    # Trang đầu / các trang sau: tách 2 câu truy vấn để SQL Server dùng được index
+    # (session_id, timestamp, id) thay vì điều kiện "hoặc NULL".
+    _history_first_sql = text("""
+        SELECT TOP (:limit) id, user_message, bot_response, timestamp
+        FROM [dbo].[conversation_history]
+        WHERE session_id = :session_id
+        ORDER BY timestamp DESC, id DESC
+    """)
+    _history_older_sql = text("""
+        SELECT TOP (:limit) id, user_message, bot_response, timestamp
+        FROM [dbo].[conversation_history]
+        WHERE session_id = :session_id
+          AND (timestamp < :before_ts OR (timestamp = :before_ts AND id < :before_id))
+        ORDER BY timestamp DESC, id DESC
+    """)
+
+    def __init__(self, engine_getter: Callable[[], Any] = connect_sql):
+        self.engine_getter = engine_getter
+
+    def engine(self):
+        engine = self.engine_getter()
+        if engine is None:
+            raise RuntimeError("Không kết nối được CSDL")
+        return engine
+
+    def recent_exchanges(self, session_id, after_id, limit, window_hours):
+        query = text(f"""
+            SELECT TOP (:limit) id, user_message, bot_response
+            FROM dbo.conversation_history
+            WHERE session_id = :session_id
+              AND id > :after_id
+              AND timestamp >= DATEADD(HOUR, -{int(window_hours)}, GETDATE())
+            ORDER BY timestamp DESC, id DESC;
+        """)
+        with self.engine().connect() as conn:
+            rows = conn.execute(
+                query,
+                {"session_id": session_id, "after_id": int(after_id), "limit": int(limit)},
+            ).fetchall()
+        return [{"id": row[0], "user": row[1] or "", "chatbot": row[2] or ""} for row in reversed(rows)]
+
+    def _insert_conversation(self, conn, params):
+        return conn.execute(self._insert_conversation_sql, params).scalar_one()
+
+    def list_sessions(self, limit):
+        with self.engine().connect() as conn:
+            rows = conn.execute(self._sessions_sql, {"limit": limit}).fetchall()
+        return [(row.SessionId, row.FirstMessageSummary) for row in rows]
+
+    def history_page(self, session_id, cursor, limit):
+        params = {"session_id": session_id, "limit": limit}
+        query = self._history_first_sql
+        if cursor:
+            query = self._history_older_sql
+            params.update(before_ts=cursor["timestamp"], before_id=cursor["id"])
+        with self.engine().connect() as conn:
+            return conn.execute(query, params).fetchall()
+
+
+class SQLiteConversationStore(ConversationStore):
+    dialect = "sqlite"
+
+    _insert_session = text("""
+        INSERT INTO ChatSessions (SessionId, FirstMessageSummary, CreatedAt)
+        VALUES (:sid, :summary, :timestamp)
+    """)
+    _insert_conversation_sql = text("""
+        INSERT INTO conversation_history (session_id, user_message, bot_response, timestamp)
+        VALUES (:sid, :user_msg, :bot_res, :timestamp)
+    """)
+    _insert_query_result = text("""
+        INSERT INTO query_results (conversation_id, query_text, response_text, retrieved_docs, model_name, timestamp)
+        VALUES (:conv_id, :q_text, :res_text, :r_docs, :model, :timestamp)
+    """)
+    _sessions_sql = text("""
+        SELECT SessionId, FirstMessageSummary
+        FROM ChatSessions
+        ORDER BY CreatedAt DESC
+        LIMIT :limit
+    """)
+    _history_first_sql = text("""
+        SELECT id, user_message, bot_response, timestamp
+        FROM conversation_history
+        WHERE session_id = :session_id
+        ORDER BY timestamp DESC, id DESC
+        LIMIT :limit
+    """)
+    _history_older_sql = text("""
+        SELECT id, user_message, bot_response, timestamp
+        FROM conversation_history
+        WHERE session_id = :session_id
+          AND (timestamp < :before_ts OR (timestamp = :before_ts AND id < :before_id))
+        ORDER BY timestamp DESC, id DESC
+        LIMIT :limit
+    """)
+    _recent_sql = text("""
+        SELECT id, user_message, bot_response
+        FROM conversation_history
+        WHERE session_id = :session_id
+          AND id > :after_id
+          AND timestamp >= :since
+        ORDER BY timestamp DESC, id DESC
+        LIMIT :limit
+    """)
+
+    def __init__(self, path: str = CONVERSATION_SQLITE_PATH):
+        self.path = path
+        self._engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        self.ensure_schema()
+
+    def engine(self):
+        return self._engine
+
+    def recent_exchanges(self, session_id, after_id, limit, window_hours):
+        # timestamp lưu theo giờ Việt Nam (xem local_now) nên mốc thời gian tính ở Python
+        since = local_now() - timedelta(hours=window_hours)
+        with self._engine.connect() as conn:
+            rows = conn.execute(self._recent_sql, {
+                "session_id": session_id, "after_id": int(after_id), "since": since, "limit": int(limit),
+            }).fetchall()
+        return [{"id": row[0], "user": row[1] or "", "chatbot": row[2] or ""} for row in reversed(rows)]
+
+    def _insert_conversation(self, conn, params):
+        return conn.execute(self._insert_conversation_sql, params).lastrowid
+
+    def list_sessions(self, limit):
+        with self._engine.connect() as conn:
+            rows = conn.execute(self._sessions_sql, {"limit": limit}).fetchall()
+        return [(row.SessionId, row.FirstMessageSummary) for row in rows]
+
+    def history_page(self, session_id, cursor, limit):
+        params = {"session_id": session_id, "limit": limit}
+        query = self._history_first_sql
+        if cursor:
+            query = self._history_older_sql
+            params.update(before_ts=cursor["timestamp"], before_id=cursor["id"])
+        with self._engine.connect() as conn:
+            return conn.execute(query, params).fetchall()
+
+
+def build_conversation_store(backend: Optional[str] = None) -> ConversationStore:
+    backend = (backend or CONVERSATION_STORE).strip().lower()
+    if backend == "mssql":
+        return MSSQLConversationStore()
+    if backend == "sqlite":
+        return SQLiteConversationStore()
+    raise ValueError(f"❌ CONVERSATION_STORE không hợp lệ: {backend}")
+
+
+_STORE: Optional[ConversationStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """
+    Kho dùng chung cho toàn process (khởi tạo lười, thread-safe).
+    """
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = build_conversation_store()
+    return _STORE
@@ -1,4 +1,5 @@
 import os
+import sys
 import shutil
 import logging
 from datetime import datetime
@@ -9,11 +10,20 @@ import chromadb
 import unicodedata
 import time
 
+# Cho phép import các module của dự án khi chạy trực tiếp script này
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.lexical_index import BM25Index, INDEX_FILE_NAME
+from tools import flat_index, quantized_index
+from tools.flat_index import FlatIndex
+from tools.embedding_service import EmbeddingBatcher
+from tools.quantized_index import QuantizedIndex
+from utils.paths import EMBEDDING_MODEL_PATH, FAQ_BUILD_CONFIG_PATH, FAQ_BUILD_LOG_DIR
+
 # ==============================================================================
 # PHẦN 1: CÁC HÀM TIỆN ÍCH (TƯƠNG TỰ CODE MẪU CỦA BẠN)
 # ==============================================================================
 
-def setup_logger(log_dir: str = r"D:/Chatbot_Data4Life/v1/create_vecto_db/logs/logs"):
+def setup_logger(log_dir: str = FAQ_BUILD_LOG_DIR):
     """Khởi tạo logger để ghi lại quá trình xử lý."""
     os.makedirs(log_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -37,7 +47,6 @@ def load_embedding_model(model_path: str) -> SentenceTransformer:
     """Tải mô hình embedding từ một đường dẫn local."""
     try:
         logging.info(f"Đang tải mô hình embedding từ: {model_path}...")
-        model_path = r"D:/Chatbot_Data4Life/v1/models/Vietnamese_Embedding"
         model = SentenceTransformer(model_path)
         logging.info("Tải mô hình embedding thành công.")
         return model
@@ -109,8 +118,19 @@ def create_faq_embeddings(model: SentenceTransformer, texts: list[str]) -> list[
     try:
         logging.info(f"Bắt đầu tạo embedding cho {len(texts)} tiêu đề...")
         t1 = time.time()
-        # Sử dụng batch processing để tăng tốc độ
-        embeddings = model.encode(texts, show_progress_bar=True)
+        # Đưa qua dịch vụ gom lô (cùng đường đi với lúc truy vấn); hàng đợi đầy thì chờ
+        service = EmbeddingBatcher(model.encode, name="faq-indexer")
+        next_log = [0]
+
+        def log_progress(done: int, total: int):
+            if done >= next_log[0] or done == total:
+                logging.info(f"  Đã embed {done}/{total} tiêu đề")
+                next_log[0] = done + max(1, total // 10)
+
+        try:
+            embeddings = service.encode_many(texts, on_progress=log_progress)
+        finally:
+            service.close()
         t2 = time.time()
         logging.info(f"Hoàn thành tạo embedding trong {t2 - t1:.2f} giây.")
         return embeddings.tolist()
@@ -153,9 +173,81 @@ def store_in_chromadb(
 
         logging.info(f"Đã thêm/cập nhật thành công {len(ids)} bản ghi vào collection.")
         logging.info(f"Tổng số bản ghi trong collection hiện tại: {collection.count()}")
+        return True
 
     except Exception as e:
         logging.error(f"Lỗi khi lưu trữ vào ChromaDB: {e}")
+        return False
+
+
+def build_lexical_index(db_path: str, db_folder: str, faq_df: pd.DataFrame):
+    """
+    Build chỉ mục BM25 (title + answer_text, token theo âm tiết) cạnh chroma.sqlite3,
+    dùng cho tìm kiếm lai trong tools/rag.py.
+    """
+    try:
+        t1 = time.time()
+        index = BM25Index.build(faq_df.to_dict(orient='records'))
+        index_path = os.path.join(db_path, db_folder, INDEX_FILE_NAME)
+        index.save(index_path)
+        logging.info(f"Đã build chỉ mục BM25 cho {len(index)} bản ghi ({len(index.postings)} token) trong {time.time() - t1:.2f} giây: {index_path}")
+        return True
+    except Exception as e:
+        logging.error(f"Lỗi khi build chỉ mục BM25: {e}")
+        return False
+
+
+def write_flat_snapshot(db_path: str, db_folder: str, faq_df: pd.DataFrame, embeddings: list[list[float]]):
+    """
+    Ghi snapshot chỉ mục phẳng (flat_index/<phiên bản>/embeddings.npy + meta.json) cạnh chroma.sqlite3,
+    để chatbot chạy với RETRIEVAL_ENGINE=flat nạp thẳng bằng memory-map thay vì đọc qua Chroma.
+    Ghi vào phiên bản mới rồi chuyển CURRENT, nên chạy được cả khi chatbot đang mở snapshot cũ.
+    """
+    try:
+        t1 = time.time()
+        index = FlatIndex.build(faq_df["id"].tolist(), embeddings, faq_df.to_dict(orient='records'))
+        directory = index.save_snapshot(flat_index.snapshot_dir(os.path.join(db_path, db_folder)))
+        logging.info(f"Đã ghi chỉ mục phẳng {len(index)} x {index.dim} trong {time.time() - t1:.2f} giây: {directory}")
+        return True
+    except Exception as e:
+        logging.error(f"Lỗi khi ghi chỉ mục phẳng: {e}")
+        return False
+
+
+def write_quantized_snapshot(db_path: str, db_folder: str, faq_df: pd.DataFrame, embeddings: list[list[float]],
+                             dtype: str = "int8"):
+    """
+    Ghi snapshot chỉ mục lượng tử hoá (quantized_index/<phiên bản>/: vector int8/float16 + scale,
+    văn bản trong faq_text.sqlite) cho RETRIEVAL_ENGINE=quantized.
+    """
+    try:
+        t1 = time.time()
+        directory = quantized_index.snapshot_dir(os.path.join(db_path, db_folder))
+        index = QuantizedIndex.build_snapshot(faq_df["id"].tolist(), embeddings, faq_df.to_dict(orient='records'), directory, dtype=dtype)
+        logging.info(f"Đã ghi chỉ mục {index.dtype} {len(index)} x {index.dim} ({index.nbytes / 1e6:.1f} MB) "
+                     f"trong {time.time() - t1:.2f} giây: {directory}")
+        index.close()
+        return True
+    except Exception as e:
+        logging.error(f"Lỗi khi ghi chỉ mục lượng tử hoá: {e}")
+        return False
+
+
+def write_index_version(db_path: str, db_folder: str, record_count: int):
+    """
+    Ghi file index_version.json cạnh chroma.sqlite3. Chatbot đọc file này
+    (tools/rag.py: faq_index_version) để biết collection đã được build lại
+    và xoá cache câu trả lời cũ.
+    """
+    full_db_path = os.path.join(db_path, db_folder)
+    version = {
+        "version": f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{time.time_ns()}",
+        "record_count": record_count,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(full_db_path, "index_version.json"), "w", encoding="utf-8") as f:
+        json.dump(version, f, ensure_ascii=False, indent=2)
+    logging.info(f"Đã ghi phiên bản index: {version['version']}")
 
 
 # ==============================================================================
@@ -168,7 +260,7 @@ if __name__ == "__main__":
 
     # Tải cấu hình
     try:
-        CONFIG_PATH = "D:/Chatbot_Data4Life/v1/create_vecto_db/config.json"
+        CONFIG_PATH = FAQ_BUILD_CONFIG_PATH
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
             config = json.load(f)
     except FileNotFoundError:
@@ -180,7 +272,11 @@ if __name__ == "__main__":
     DB_PATH = config["db_path"]
     DB_FOLDER = config["db_folder"]
     COLLECTION_NAME = config["collection_name"]
-    LOCAL_MODEL_PATH = config["local_model_path"]
+    # Cùng mô hình với tools/rag.py (EMBEDDING_MODEL_PATH), để vector index và câu hỏi cùng không gian
+    LOCAL_MODEL_PATH = EMBEDDING_MODEL_PATH
+    if config.get("local_model_path") and os.path.abspath(config["local_model_path"]) != os.path.abspath(LOCAL_MODEL_PATH):
+        logger.warning(f"Bỏ qua local_model_path trong config.json ({config['local_model_path']}); "
+                       f"dùng EMBEDDING_MODEL_PATH: {LOCAL_MODEL_PATH}")
 
     # --- Tùy chọn: Xóa DB cũ trước khi tạo mới ---
     # Bỏ comment dòng dưới nếu bạn muốn tạo lại DB từ đầu mỗi lần chạy
@@ -201,13 +297,23 @@ if __name__ == "__main__":
 
         if faq_embeddings:
             # 4. Lưu trữ vào ChromaDB
-            store_in_chromadb(
+            stored = store_in_chromadb(
                 db_path=DB_PATH,
                 db_folder=DB_FOLDER,
                 collection_name=COLLECTION_NAME,
                 faq_df=faq_dataframe,
                 embeddings=faq_embeddings
             )
+            if stored:
+                # 5. Build chỉ mục BM25 cho tìm kiếm lai
+                build_lexical_index(DB_PATH, DB_FOLDER, faq_dataframe)
+                # 6. Snapshot ma trận embedding cho chỉ mục phẳng (RETRIEVAL_ENGINE=flat)
+                write_flat_snapshot(DB_PATH, DB_FOLDER, faq_dataframe, faq_embeddings)
+                # 7. Snapshot lượng tử hoá + kho văn bản SQLite (RETRIEVAL_ENGINE=quantized)
+                write_quantized_snapshot(DB_PATH, DB_FOLDER, faq_dataframe, faq_embeddings,
+                                         dtype=config.get("quantized_dtype", "int8"))
+                # 8. Đánh dấu phiên bản mới để chatbot xoá cache câu trả lời
+                write_index_version(DB_PATH, DB_FOLDER, len(faq_dataframe))
             logger.info("=== QUÁ TRÌNH TẠO VECTOR DB HOÀN TẤT ===")
         else:
             logger.error("Không thể tạo embeddings. Dừng quá trình lưu vào DB.")
\ No newline at end of file
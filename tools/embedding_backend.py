@@ -0,0 +1,153 @@
+# tools/embedding_backend.py
+
+"""
+Backend suy luận cho mô hình embedding tiếng Việt.
+
+EMBEDDING_BACKEND:
+- "torch" (mặc định): SentenceTransformer gốc, fp32 PyTorch.
+- "torch_int8": SentenceTransformer với các lớp Linear được lượng tử hoá động int8
+  (torch.quantization.quantize_dynamic), không cần export.
+- "onnx": ONNX Runtime trên bản export bởi `python -m tools.embedding_export`
+  (EMBEDDING_ONNX_PATH: model.onnx hoặc model_quantized.onnx + tokenizer + embedding_backend.json).
+
+Mọi backend có cùng giao diện encode(texts) -> np.ndarray và
+get_sentence_embedding_dimension(), nên tools/rag.py dùng thay nhau được.
+EMBEDDING_THREADS (0 = mặc định của thư viện) đặt số thread tính toán.
+"""
+
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from utils.paths import EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_PATH
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Trong thư mục ONNX: "model_quantized.onnx" nếu có và EMBEDDING_ONNX_QUANTIZED=1
+EMBEDDING_ONNX_QUANTIZED = os.getenv("EMBEDDING_ONNX_QUANTIZED", "1") == "1"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+BACKEND_CONFIG_FILE = "embedding_backend.json"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+def _set_torch_threads() -> None:
+    if EMBEDDING_THREADS > 0:
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+
+
+def _pool(hidden: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "cls":
+        return hidden[:, 0]
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    if mode == "max":
+        return np.where(mask > 0, hidden, -1e9).max(axis=1)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class OnnxEmbedder:
+    """
+    Tokenizer (transformers) + ONNX Runtime + pooling/normalize giống SentenceTransformer gốc.
+    """
+    def __init__(self, model_dir: str, quantized: bool = EMBEDDING_ONNX_QUANTIZED, threads: int = EMBEDDING_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, BACKEND_CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        model_file = ONNX_QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            model_file = ONNX_MODEL_FILE
+        self.model_file = model_file
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), sess_options=options, providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = int(self.config.get("max_seq_length") or 256)
+        self.pooling = self.config.get("pooling", "mean")
+        self.normalize = bool(self.config.get("normalize", False))
+        self.dim = int(self.config["dim"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences, batch_size: int = EMBEDDING_BATCH_SIZE, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts: List[str] = [sentences] if single else list(sentences)
+        # Sắp theo độ dài để lô ít padding (giống SentenceTransformer), trả về đúng thứ tự gốc
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            pooled = _pool(hidden, encoded["attention_mask"], self.pooling)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out[idx] = pooled
+        return out[0] if single else out
+
+
+def load_embedding_model(backend: str = EMBEDDING_BACKEND):
+    """
+    Mô hình embedding theo backend (xem docstring module).
+    """
+    if backend == "onnx":
+        return OnnxEmbedder(EMBEDDING_ONNX_PATH)
+
+    from sentence_transformers import SentenceTransformer
+
+    _set_torch_threads()
+    model = SentenceTransformer(EMBEDDING_MODEL_PATH, device="cpu")
+    if backend == "torch_int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend != "torch":
+        raise ValueError(f"❌ EMBEDDING_BACKEND không hợp lệ: {backend} (torch | torch_int8 | onnx)")
+    return model
+
+
+def backend_identity(backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Phần định danh backend trong khoá cache embedding (vector của các backend hơi khác nhau).
+    """
+    if backend == "onnx":
+        return f"onnx:{os.path.abspath(EMBEDDING_ONNX_PATH)}:{'q' if EMBEDDING_ONNX_QUANTIZED else 'fp32'}"
+    return backend
+
+
+# Câu mẫu cho warmup / kiểm tra tương đương
+SAMPLE_SENTENCES = [
+    "Thủ tục cấp căn cước công dân gồm những giấy tờ gì?",
+    "Đăng ký thường trú cho con mới sinh ở đâu?",
+    "Lệ phí cấp hộ chiếu phổ thông là bao nhiêu?",
+    "Làm sao để tra cứu tình trạng hồ sơ trên cổng dịch vụ công?",
+    "Mẫu CT01 dùng để làm gì?",
+    "Thời hạn giải quyết thủ tục đăng ký kết hôn",
+    "xin chào",
+    "Tôi muốn đổi giấy phép lái xe quá hạn thì cần chuẩn bị hồ sơ như thế nào và nộp ở cơ quan nào?",
+]
+
+
+def warmup_model(model) -> None:
+    """
+    Chạy thử vài lô (câu ngắn + câu dài) để ONNX Runtime/PyTorch cấp phát bộ nhớ và
+    tối ưu đồ thị trước lượt hỏi đầu tiên.
+    """
+    model.encode(SAMPLE_SENTENCES[:1])
+    model.encode(SAMPLE_SENTENCES)
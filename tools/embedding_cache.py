@@ -0,0 +1,176 @@
+# tools/embedding_cache.py
+
+"""
+Cache embedding cho câu truy vấn.
+
+Khoá = văn bản đã chuẩn hoá (Unicode NFC, chữ thường, gộp khoảng trắng) + định danh
+mô hình, nên "Thủ tục  cấp CCCD" và "thủ tục cấp cccd" (kể cả khác kiểu dựng dấu
+tiếng Việt) dùng chung một vector. Chữ thường chỉ dùng cho khoá: văn bản đưa vào
+mô hình giữ nguyên hoa/thường (chỉ NFC + gộp khoảng trắng) như khi index tiêu đề FAQ. Giới hạn số mục trong RAM (LRU); có thể lưu
+xuống file SQLite (EMBEDDING_CACHE_PATH) để giữ qua các lần khởi động lại.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from utils.metrics import METRICS
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+# Để trống = chỉ cache trong RAM
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+_WHITESPACE = re.compile(r"\s+")
+# Đổi khi cách tạo văn bản đưa vào mô hình thay đổi -> bỏ qua vector cũ đã lưu trên đĩa
+# (v2: encode văn bản giữ nguyên hoa/thường thay vì chữ thường)
+CACHE_FORMAT = "v2"
+
+
+def clean_text(text: str) -> str:
+    """
+    NFC (dấu tiếng Việt dựng sẵn), gộp mọi khoảng trắng thành một dấu cách; giữ hoa/thường.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Khoá cache: clean_text + chữ thường.
+    """
+    return clean_text(text).lower()
+
+
+class EmbeddingCache:
+    """
+    LRU trong RAM + (tuỳ chọn) bảng SQLite trên đĩa. Thread-safe.
+    """
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, persist_path: str = EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.persist_path = persist_path or None
+        self._entries: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.persist_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            self._db = sqlite3.connect(self.persist_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model_id TEXT NOT NULL,
+                    text_key TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model_id, text_key)
+                )
+            """)
+            self._db.commit()
+
+    # ------------------------------------------
+    # 🔎 Tra cứu
+    # ------------------------------------------
+    def get_many(self, model_id: str, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> List[np.ndarray]:
+        """
+        Vector cho từng văn bản. Các mục chưa có trong RAM/đĩa được encode trong một
+        lần gọi `encode(list_of_texts)` — văn bản đã clean_text, giữ nguyên hoa/thường
+        (khoá trùng nhau thì lấy lần xuất hiện đầu tiên).
+        """
+        model_id = f"{model_id}#{CACHE_FORMAT}"
+        cleaned = [clean_text(t) for t in texts]
+        keys = [t.lower() for t in cleaned]
+        vectors: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing: "OrderedDict[str, List[int]]" = OrderedDict()
+        originals: dict = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get((model_id, key))
+                if vector is not None:
+                    self._entries.move_to_end((model_id, key))
+                    vectors[i] = vector
+                else:
+                    if key not in missing:
+                        originals[key] = cleaned[i]
+                    missing.setdefault(key, []).append(i)
+        hits = len(keys) - sum(len(v) for v in missing.values())
+        if hits:
+            METRICS.increment("embedding_cache.hit", hits)
+
+        if missing and self._db is not None:
+            for key, vector in self._load(model_id, list(missing)).items():
+                for i in missing.pop(key):
+                    vectors[i] = vector
+                self._remember(model_id, key, vector)
+                METRICS.increment("embedding_cache.disk_hit")
+
+        if missing:
+            METRICS.increment("embedding_cache.miss", len(missing))
+            encoded = np.asarray(encode([originals[key] for key in missing]), dtype=np.float32)
+            new_rows = []
+            for (key, positions), vector in zip(missing.items(), encoded):
+                for i in positions:
+                    vectors[i] = vector
+                self._remember(model_id, key, vector)
+                new_rows.append((key, vector))
+            if self._db is not None:
+                self._save(model_id, new_rows)
+        return vectors
+
+    def _remember(self, model_id: str, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[(model_id, key)] = vector
+            self._entries.move_to_end((model_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ------------------------------------------
+    # 💾 Đĩa
+    # ------------------------------------------
+    def _load(self, model_id: str, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT text_key, dim, vector FROM embeddings WHERE model_id = ? AND text_key IN ({','.join('?' * len(chunk))})",
+                    [model_id, *chunk],
+                ).fetchall()
+                for key, dim, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32, count=dim).copy()
+        return found
+
+    def _save(self, model_id: str, rows: list) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, text_key, dim, vector) VALUES (?, ?, ?, ?)",
+                [(model_id, key, int(vector.shape[0]), vector.astype(np.float32).tobytes()) for key, vector in rows],
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        counters = METRICS.snapshot()["counters"]
+        hits = counters.get("embedding_cache.hit", 0) + counters.get("embedding_cache.disk_hit", 0)
+        misses = counters.get("embedding_cache.miss", 0)
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "persist_path": self.persist_path,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            }
+
+
+EMBEDDING_CACHE = EmbeddingCache()
@@ -0,0 +1,159 @@
+# tools/embedding_export.py
+
+"""
+Export mô hình embedding (SentenceTransformer tại EMBEDDING_MODEL_PATH) sang ONNX
+cho EMBEDDING_BACKEND=onnx, và kiểm tra tương đương với mô hình gốc.
+
+    # Export fp32 + bản lượng tử hoá động int8, rồi kiểm tra cả hai
+    python -m tools.embedding_export --out D:/Chatbot_Data4Life/v1/models/Vietnamese_Embedding_onnx
+
+    # Chỉ kiểm tra lại bản đã export (thêm câu từ file, mỗi dòng một câu)
+    python -m tools.embedding_export --check-only --sentences prompt/sample_questions.txt
+
+Thư mục export: model.onnx, model_quantized.onnx, tokenizer, embedding_backend.json
+(pooling, normalize, max_seq_length, dim). Lệnh trả về mã lỗi 1 nếu cosine nhỏ nhất
+giữa vector ONNX và vector gốc thấp hơn ngưỡng.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from tools.embedding_backend import (
+    BACKEND_CONFIG_FILE,
+    ONNX_MODEL_FILE,
+    ONNX_QUANTIZED_MODEL_FILE,
+    SAMPLE_SENTENCES,
+    OnnxEmbedder,
+)
+from utils.paths import EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_PATH
+
+# Cosine nhỏ nhất chấp nhận được so với mô hình gốc
+MIN_COSINE_FP32 = 0.999
+MIN_COSINE_QUANTIZED = 0.98
+
+
+def _pooling_mode(model) -> str:
+    for module in model:
+        if type(module).__name__ == "Pooling":
+            if getattr(module, "pooling_mode_cls_token", False):
+                return "cls"
+            if getattr(module, "pooling_mode_max_tokens", False):
+                return "max"
+            return "mean"
+    return "mean"
+
+
+def export(out_dir: str = EMBEDDING_ONNX_PATH, opset: int = 17, quantize: bool = True) -> None:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(EMBEDDING_MODEL_PATH, device="cpu")
+    transformer = model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+
+    dummy = tokenizer(SAMPLE_SENTENCES[:2], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+
+    class _HiddenStates(torch.nn.Module):
+        # Chỉ xuất last_hidden_state; pooling/normalize làm bằng NumPy khi chạy
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    onnx_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(auto_model),
+            tuple(dummy[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    print(f"Đã export ONNX: {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(out_dir, ONNX_QUANTIZED_MODEL_FILE)
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Đã lượng tử hoá động int8: {quantized_path}")
+
+    tokenizer.save_pretrained(out_dir)
+    config = {
+        "source": os.path.abspath(EMBEDDING_MODEL_PATH),
+        "pooling": _pooling_mode(model),
+        "normalize": any(type(m).__name__ == "Normalize" for m in model),
+        "max_seq_length": model.max_seq_length,
+        "dim": model.get_sentence_embedding_dimension(),
+        "input_names": input_names,
+        "opset": opset,
+    }
+    with open(os.path.join(out_dir, BACKEND_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    print(f"Cấu hình backend: {config}")
+
+
+def check(out_dir: str = EMBEDDING_ONNX_PATH, sentences: Optional[List[str]] = None,
+          min_cosine_fp32: float = MIN_COSINE_FP32, min_cosine_quantized: float = MIN_COSINE_QUANTIZED) -> bool:
+    """
+    So vector của model.onnx / model_quantized.onnx với SentenceTransformer gốc.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    sentences = sentences or SAMPLE_SENTENCES
+    reference = np.asarray(SentenceTransformer(EMBEDDING_MODEL_PATH, device="cpu").encode(sentences), dtype=np.float32)
+    ok = True
+    for quantized, threshold in ((False, min_cosine_fp32), (True, min_cosine_quantized)):
+        if quantized and not os.path.exists(os.path.join(out_dir, ONNX_QUANTIZED_MODEL_FILE)):
+            continue
+        embedder = OnnxEmbedder(out_dir, quantized=quantized)
+        vectors = embedder.encode(sentences)
+        cosine = (vectors * reference).sum(axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+        )
+        passed = bool(cosine.min() >= threshold)
+        ok = ok and passed
+        print(f"[{embedder.model_file}] {len(sentences)} câu: cosine min={cosine.min():.6f} mean={cosine.mean():.6f} "
+              f"max|Δ|={np.abs(vectors - reference).max():.6f} -> {'✅ đạt' if passed else '❌ không đạt'} (ngưỡng {threshold})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export mô hình embedding sang ONNX và kiểm tra tương đương")
+    parser.add_argument("--out", default=EMBEDDING_ONNX_PATH, help="thư mục export (mặc định EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="không tạo model_quantized.onnx")
+    parser.add_argument("--check-only", action="store_true", help="chỉ kiểm tra bản đã export")
+    parser.add_argument("--sentences", help="file văn bản, mỗi dòng một câu dùng để kiểm tra")
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE_FP32)
+    parser.add_argument("--min-cosine-quantized", type=float, default=MIN_COSINE_QUANTIZED)
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.out, opset=args.opset, quantize=not args.no_quantize)
+
+    sentences = None
+    if args.sentences:
+        with open(args.sentences, "r", encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+    if not check(args.out, sentences, args.min_cosine, args.min_cosine_quantized):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# tools/embedding_service.py
+
+"""
+Dịch vụ embedding gom lô (micro-batching) dùng chung cho các request đồng thời.
+
+Mỗi lượt hỏi chỉ cần embed một vài câu, và nhiều lượt chạy song song trên các thread
+khác nhau. Thay vì mỗi thread tự gọi model.encode (tranh nhau GIL / thread của
+torch/ONNX Runtime), các câu được đưa vào hàng đợi; một worker nền gom những gì đến
+trong EMBEDDING_MAX_WAIT_MS (tối đa EMBEDDING_MAX_BATCH câu) và encode một lần.
+
+Hàng đợi có giới hạn (EMBEDDING_QUEUE_MAX yêu cầu): khi đầy, bên gọi chờ tối đa
+EMBEDDING_QUEUE_TIMEOUT giây rồi nhận EmbeddingServiceBusy (backpressure).
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from utils.metrics import METRICS
+
+EMBEDDING_SERVICE_ENABLED = os.getenv("EMBEDDING_SERVICE_ENABLED", "1") == "1"
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+EMBEDDING_QUEUE_MAX = int(os.getenv("EMBEDDING_QUEUE_MAX", "256"))
+EMBEDDING_QUEUE_TIMEOUT = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "2"))
+EMBEDDING_RESULT_TIMEOUT = float(os.getenv("EMBEDDING_RESULT_TIMEOUT", "30"))
+
+
+class EmbeddingServiceBusy(RuntimeError):
+    """
+    Hàng đợi embedding đầy quá EMBEDDING_QUEUE_TIMEOUT giây.
+    """
+
+
+class _Job:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Worker nền gom các yêu cầu encode thành lô. Thread-safe.
+    encode_fn(list_of_texts) -> ma trận (n, dim).
+    """
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = EMBEDDING_MAX_BATCH,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+        max_queue: int = EMBEDDING_QUEUE_MAX,
+        queue_timeout: float = EMBEDDING_QUEUE_TIMEOUT,
+        name: str = "embedding-batcher",
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=max_queue)
+        self._carry: Optional[_Job] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------
+    # 📥 Nhận yêu cầu
+    # ------------------------------------------
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Đưa một nhóm câu vào hàng đợi; Future trả về ma trận (len(texts), dim).
+        """
+        self._ensure_started()
+        job = _Job(list(texts))
+        if not job.texts:
+            job.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return job.future
+        try:
+            self._queue.put(job, timeout=self.queue_timeout)
+        except queue.Full:
+            METRICS.increment("embedding_service.rejected")
+            raise EmbeddingServiceBusy(f"hàng đợi embedding đầy ({self._queue.maxsize} yêu cầu)")
+        return job.future
+
+    def encode(self, texts: List[str], timeout: float = EMBEDDING_RESULT_TIMEOUT) -> np.ndarray:
+        return self.submit(texts).result(timeout=timeout)
+
+    def encode_many(self, texts: List[str], chunk_size: Optional[int] = None,
+                    on_progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """
+        Cho lượng lớn văn bản (vd. build index): chia thành các lô max_batch_size, đưa
+        dần vào hàng đợi (hàng đợi đầy thì chờ) và ghép kết quả theo đúng thứ tự.
+        """
+        chunk_size = chunk_size or self.max_batch_size
+        pending: List[Future] = []
+        parts: List[np.ndarray] = []
+        done = 0
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            while True:
+                try:
+                    pending.append(self.submit(chunk))
+                    break
+                except EmbeddingServiceBusy:
+                    # Backpressure: chờ lô cũ nhất xong rồi thử lại
+                    parts.append(pending.pop(0).result())
+                    done += len(parts[-1])
+                    if on_progress:
+                        on_progress(done, len(texts))
+        for future in pending:
+            parts.append(future.result())
+            done += len(parts[-1])
+            if on_progress:
+                on_progress(done, len(texts))
+        return np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    # ------------------------------------------
+    # 🔁 Worker
+    # ------------------------------------------
+    def _next_batch(self) -> Optional[List[_Job]]:
+        """
+        Chờ yêu cầu đầu tiên, rồi gom thêm trong max_wait (tới max_batch_size câu).
+        None = dừng worker.
+        """
+        first = self._carry
+        self._carry = None
+        if first is None:
+            first = self._queue.get()
+            if first is None:
+                return None
+        batch, size = [first], len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                # Xử lý nốt lô hiện tại rồi dừng
+                self._queue.put(None)
+                break
+            if size + len(job.texts) > self.max_batch_size:
+                self._carry = job
+                break
+            batch.append(job)
+            size += len(job.texts)
+        return batch
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch: List[_Job]) -> None:
+        # Câu trùng nhau giữa các yêu cầu chỉ encode một lần
+        unique = list(dict.fromkeys(text for job in batch for text in job.texts))
+        now = time.perf_counter()
+        for job in batch:
+            METRICS.observe("embedding_service.queue_wait", (now - job.enqueued_at) * 1000)
+        try:
+            t0 = time.perf_counter()
+            vectors = np.asarray(self.encode_fn(unique), dtype=np.float32)
+            METRICS.observe("embedding_service.encode", (time.perf_counter() - t0) * 1000)
+            # Histogram của METRICS là ms: kích thước lô lấy từ counter (texts / batches)
+            METRICS.increment("embedding_service.texts", len(unique))
+            METRICS.increment("embedding_service.batches")
+        except BaseException as e:
+            for job in batch:
+                job.future.set_exception(e)
+            return
+        position = {text: i for i, text in enumerate(unique)}
+        for job in batch:
+            job.future.set_result(vectors[[position[text] for text in job.texts]])
+
+    # ------------------------------------------
+    # 🛑 Dừng
+    # ------------------------------------------
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000, "running": bool(self._thread and self._thread.is_alive())}
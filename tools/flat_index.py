@@ -0,0 +1,208 @@
+# tools/flat_index.py
+
+"""
+Chỉ mục vector phẳng trong RAM cho FAQ (thay cho truy vấn qua Chroma).
+
+Bộ FAQ đủ nhỏ để nằm gọn trong RAM: mọi embedding được chuẩn hoá và xếp thành một
+ma trận float32 liền mạch, top-k của cả lô câu hỏi là một phép nhân ma trận NumPy
+(cosine chính xác, không xấp xỉ như HNSW). Ma trận được:
+
+- đọc từ snapshot create_vecto_db/create_faq_db.py ghi cạnh chroma.sqlite3
+  (thư mục flat_index/<phiên bản>/: embeddings.npy nạp bằng memory-map + meta.json), hoặc
+- xuất một lần từ collection Chroma lúc khởi động nếu chưa có snapshot.
+
+Kết quả trả về cùng dạng collection.query của Chroma ({"ids", "metadatas",
+"distances"}, distance = 1 - cosine) để tools/rag.py đổi engine mà không đổi gì khác.
+
+Mỗi lần build ghi vào một thư mục phiên bản mới rồi mới trỏ file CURRENT sang nó
+(đổi tên nguyên tử). Không ghi đè file mà app đang mở (memory-map / SQLite — trên
+Windows sẽ lỗi PermissionError), và process nạp giữa chừng không bao giờ ghép vector
+mới với meta.json cũ.
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+FLAT_INDEX_DIR_NAME = "flat_index"
+FLAT_INDEX_FORMAT_VERSION = 1
+EMBEDDINGS_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+# Số phiên bản snapshot giữ lại (phiên bản hiện tại + bản trước cho process chưa nạp lại)
+SNAPSHOT_KEEP_VERSIONS = 2
+# Chỉ giữ các trường cần cho câu trả lời (answer_html... không nạp vào RAM)
+KEEP_FIELDS = ("title", "answer_text", "source_url")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class FlatIndex:
+    """
+    Ma trận (n, dim) float32 đã chuẩn hoá + id và metadata cùng thứ tự.
+    """
+    def __init__(self, ids: List[str], matrix: np.ndarray, metadatas: List[Dict[str, Any]]):
+        if len(ids) != len(matrix) or len(ids) != len(metadatas):
+            raise ValueError("❌ FlatIndex: số id, vector và metadata không khớp")
+        self.ids = ids
+        self.matrix = matrix
+        self.metadatas = metadatas
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+
+    # ------------------------------------------
+    # 🔎 Tìm kiếm
+    # ------------------------------------------
+    def query(self, query_embeddings, n_results: int = 5) -> Dict[str, List[List[Any]]]:
+        """
+        Top-k cosine cho cả lô câu hỏi bằng một phép nhân ma trận.
+        Trả về {"ids", "metadatas", "distances"} giống collection.query của Chroma.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        results = {"ids": [], "metadatas": [], "distances": []}
+        if not len(self) or not len(queries):
+            for _ in range(len(queries)):
+                results["ids"].append([])
+                results["metadatas"].append([])
+                results["distances"].append([])
+            return results
+
+        k = min(n_results, len(self))
+        scores = queries @ self.matrix.T  # (n_queries, n_docs)
+        if k < len(self):
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(len(self)), (len(queries), 1))
+        for row, candidates in zip(scores, top):
+            # Sắp theo điểm giảm dần, hoà điểm thì theo thứ tự trong chỉ mục
+            order = candidates[np.lexsort((candidates, -row[candidates]))]
+            results["ids"].append([self.ids[i] for i in order])
+            results["metadatas"].append([self.metadatas[i] for i in order])
+            results["distances"].append([float(1.0 - row[i]) for i in order])
+        return results
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Metadata theo id (cho tài liệu chỉ có ở phía BM25).
+        """
+        if self._positions is None:
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        return {doc_id: self.metadatas[self._positions[doc_id]] for doc_id in ids if doc_id in self._positions}
+
+    # ------------------------------------------
+    # 🏗️ Xây dựng / lưu / nạp
+    # ------------------------------------------
+    @classmethod
+    def build(cls, ids: List[str], embeddings, metadatas: List[Dict[str, Any]]) -> "FlatIndex":
+        matrix = np.ascontiguousarray(_normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+        metas = [{f: (m or {}).get(f) for f in KEEP_FIELDS} for m in metadatas]
+        return cls([str(i) for i in ids], matrix, metas)
+
+    @classmethod
+    def from_collection(cls, collection, page_size: int = 5000) -> "FlatIndex":
+        """
+        Xuất toàn bộ embedding + metadata của collection Chroma (theo trang).
+        """
+        ids, embeddings, metadatas = [], [], []
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+            ids.extend(page["ids"])
+            embeddings.extend(page["embeddings"])
+            metadatas.extend(page["metadatas"])
+        if not ids:
+            return cls([], np.zeros((0, 0), dtype=np.float32), [])
+        return cls.build(ids, embeddings, metadatas)
+
+    def save(self, directory: str) -> None:
+        """
+        Ghi embeddings.npy + meta.json vào directory (thư mục mới, chưa ai đọc).
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), np.ascontiguousarray(self.matrix, dtype=np.float32))
+        with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": FLAT_INDEX_FORMAT_VERSION,
+                "dim": self.dim,
+                "ids": self.ids,
+                "metadatas": self.metadatas,
+            }, f, ensure_ascii=False)
+
+    def save_snapshot(self, root: str) -> str:
+        """
+        Ghi vào một phiên bản mới dưới root rồi chuyển CURRENT sang; trả về thư mục phiên bản.
+        """
+        directory = new_snapshot_version(root)
+        self.save(directory)
+        publish_snapshot(root, directory)
+        return directory
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "FlatIndex":
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FLAT_INDEX_FORMAT_VERSION:
+            raise ValueError(f"❌ {directory}: định dạng chỉ mục phẳng không được hỗ trợ ({meta.get('format')})")
+        matrix = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        return cls(meta["ids"], matrix, meta["metadatas"])
+
+
+def snapshot_dir(db_dir: str) -> str:
+    return os.path.join(db_dir, FLAT_INDEX_DIR_NAME)
+
+
+def new_snapshot_version(root: str) -> str:
+    """
+    Tạo thư mục phiên bản mới (rỗng) dưới root.
+    """
+    os.makedirs(root, exist_ok=True)
+    directory = os.path.join(root, f"v{time.time_ns()}")
+    os.makedirs(directory)
+    return directory
+
+
+def publish_snapshot(root: str, directory: str, keep: int = SNAPSHOT_KEEP_VERSIONS) -> None:
+    """
+    Trỏ CURRENT sang directory (ghi file tạm rồi os.replace — CURRENT không được giữ mở
+    nên đổi tên được cả trên Windows), rồi xoá các phiên bản cũ ngoài `keep` bản mới nhất.
+    Bản cũ mà process khác còn mở thì không xoá được trên Windows: bỏ qua, lần build sau xoá.
+    """
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(directory))
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+    versions = sorted(
+        (name for name in os.listdir(root) if name.startswith("v") and os.path.isdir(os.path.join(root, name))),
+        key=lambda name: int(name[1:]) if name[1:].isdigit() else 0,
+    )
+    for name in versions[:-keep] if keep > 0 else versions:
+        if name != os.path.basename(directory):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current_snapshot(root: str) -> Optional[str]:
+    """
+    Thư mục phiên bản mà CURRENT đang trỏ tới; snapshot kiểu cũ (file nằm thẳng trong
+    root) vẫn được nhận. None nếu chưa có snapshot.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            directory = os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        directory = root
+    return directory if os.path.exists(os.path.join(directory, META_FILE)) else None
@@ -0,0 +1,168 @@
+# tools/lexical_index.py
+
+"""
+Chỉ mục từ vựng BM25 cho FAQ tiếng Việt (bổ sung cho tìm kiếm vector của Chroma).
+
+Tiếng Việt viết tách âm tiết bằng dấu cách nên token = âm tiết (sau khi chuẩn hoá
+NFC + chữ thường); mã thủ tục, số hiệu biểu mẫu như "CT01", "TK1-TS" cũng được giữ
+nguyên dạng ghép ngoài các phần tách rời. Chỉ mục được build cùng Chroma bởi
+create_vecto_db/create_faq_db.py, lưu thành bm25_index.json cạnh chroma.sqlite3,
+và nạp vào RAM khi chạy: trọng số BM25 của từng posting được tính sẵn nên một
+truy vấn chỉ là cộng dồn trên vài posting list.
+
+Để mỗi worker giữ ít RAM: file chỉ lưu posting (token -> vị trí tài liệu, tần suất)
+và độ dài tài liệu, không lưu lại văn bản đã tách token; posting nằm trong array
+(int32 / float32) thay vì list tuple; mỗi tài liệu chỉ giữ id + title, còn
+answer_text / source_url của kết quả cuối được lấy từ chỉ mục vector (tools/rag.py).
+
+Module này chỉ dùng thư viện chuẩn để script build có thể import mà không cần
+nạp mô hình hay Chroma.
+"""
+
+import heapq
+import json
+from array import array
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Tuple
+
+INDEX_FILE_NAME = "bm25_index.json"
+INDEX_FORMAT_VERSION = 2
+# Trường giữ trong RAM cho mỗi tài liệu (văn bản dài lấy từ chỉ mục vector khi cần)
+KEEP_FIELDS = ("title",)
+
+_TOKEN = re.compile(r"\w+")
+# Mã có dấu nối/gạch chéo (CT01, 01/2023/TT-BCA): giữ thêm dạng ghép
+_CODE = re.compile(r"\w+(?:[-/.]\w+)+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFC", text or "").lower()
+    tokens = _TOKEN.findall(text)
+    tokens.extend(_CODE.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index: token -> (array vị trí tài liệu, array trọng số BM25 đã tính sẵn).
+    """
+    def __init__(self, doc_ids: List[str], docs: List[Dict[str, Any]], term_postings: Dict[str, Tuple[array, array]],
+                 lengths: array, k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = doc_ids
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.lengths = lengths
+        # token -> (vị trí tài liệu, tần suất trong tài liệu); giữ lại để save()
+        self._term_postings = term_postings
+        self.positions = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self._build_postings()
+
+    def _build_postings(self) -> None:
+        n_docs = len(self.doc_ids)
+        avg_len = (sum(self.lengths) / n_docs) if n_docs else 0.0
+        norms = [
+            self.k1 * (1 - self.b + self.b * (length / avg_len if avg_len else 0.0))
+            for length in self.lengths
+        ]
+        postings: Dict[str, Tuple[array, array]] = {}
+        for token, (doc_idxs, freqs) in self._term_postings.items():
+            doc_freq = len(doc_idxs)
+            idf = math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            postings[token] = (doc_idxs, array("f", (
+                idf * freq * (self.k1 + 1) / (freq + norms[doc_idx])
+                for doc_idx, freq in zip(doc_idxs, freqs)
+            )))
+        self.postings = postings
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # ------------------------------------------
+    # 🔎 Tìm kiếm
+    # ------------------------------------------
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[int, float]]:
+        """
+        [(vị trí tài liệu, điểm BM25)] giảm dần, tối đa top_k.
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            for doc_idx, weight in zip(*posting):
+                scores[doc_idx] += weight
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    # ------------------------------------------
+    # 💾 Lưu / nạp
+    # ------------------------------------------
+    @classmethod
+    def from_tokens(cls, doc_ids: List[str], doc_tokens: List[List[str]], docs: List[Dict[str, Any]],
+                    **kwargs) -> "BM25Index":
+        term_postings: Dict[str, Tuple[array, array]] = {}
+        lengths = array("i")
+        for doc_idx, tokens in enumerate(doc_tokens):
+            lengths.append(len(tokens))
+            for token, freq in Counter(tokens).items():
+                if token not in term_postings:
+                    term_postings[token] = (array("i"), array("i"))
+                term_postings[token][0].append(doc_idx)
+                term_postings[token][1].append(freq)
+        return cls(doc_ids, docs, term_postings, lengths, **kwargs)
+
+    @classmethod
+    def build(cls, records: List[Dict[str, Any]], text_fields=("title", "answer_text"),
+              keep_fields=KEEP_FIELDS, **kwargs) -> "BM25Index":
+        doc_ids = [str(r["id"]) for r in records]
+        doc_tokens = (tokenize(" ".join(str(r.get(f) or "") for f in text_fields)) for r in records)
+        docs = [{f: r.get(f) for f in keep_fields} for r in records]
+        return cls.from_tokens(doc_ids, doc_tokens, docs, **kwargs)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "format": INDEX_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "doc_ids": self.doc_ids,
+                "docs": self.docs,
+                "lengths": self.lengths.tolist(),
+                "postings": {token: [idxs.tolist(), freqs.tolist()] for token, (idxs, freqs) in self._term_postings.items()},
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        fmt = data.get("format")
+        if fmt not in (1, INDEX_FORMAT_VERSION):
+            raise ValueError(f"❌ {path}: định dạng chỉ mục BM25 không được hỗ trợ ({fmt})")
+        # Chỉ giữ các trường KEEP_FIELDS (file build trước đây còn chứa answer_text/source_url)
+        docs = [{f: d.get(f) for f in KEEP_FIELDS} for d in data.pop("docs")]
+        if fmt == 1:
+            # Định dạng cũ lưu văn bản đã tách token: dựng lại posting khi nạp
+            return cls.from_tokens(data["doc_ids"], data.pop("doc_tokens"), docs, k1=data["k1"], b=data["b"])
+        term_postings = {
+            token: (array("i", idxs), array("i", freqs))
+            for token, (idxs, freqs) in data.pop("postings").items()
+        }
+        return cls(data["doc_ids"], docs, term_postings, array("i", data["lengths"]), k1=data["k1"], b=data["b"])
+
+
+def reciprocal_rank_fusion(rankings: List[Tuple[List[str], float]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Gộp nhiều bảng xếp hạng (list id theo thứ tự, trọng số):
+    score(d) = sum(weight / (k + rank)), rank bắt đầu từ 1.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranked_ids, weight in rankings:
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranked_ids, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
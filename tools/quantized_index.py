@@ -0,0 +1,269 @@
+# tools/quantized_index.py
+
+"""
+Chỉ mục vector lượng tử hoá + kho văn bản tách riêng cho FAQ.
+
+So với chỉ mục phẳng float32 (tools/flat_index.py):
+- Vector lưu dạng int8 (kèm hệ số scale float32 cho từng vector, lượng tử hoá đối
+  xứng: v ≈ q * scale) hoặc float16 — nhỏ hơn 4 / 2 lần.
+- Process phục vụ chỉ giữ id + vector; title / answer_text / source_url nằm trong
+  file SQLite (faq_text.sqlite) và chỉ được đọc cho top-k cuối cùng.
+
+Tính điểm theo từng khối hàng (giải lượng tử khối đó sang float32 rồi nhân ma trận)
+để bộ nhớ tạm không vượt quá QUANTIZED_SCORE_CHUNK hàng (khối nhỏ vừa cache CPU).
+
+Snapshot do create_vecto_db/create_faq_db.py ghi cạnh chroma.sqlite3, thư mục
+quantized_index/<phiên bản>/: vectors.npy, scales.npy (int8), meta.json, faq_text.sqlite;
+file CURRENT trỏ tới phiên bản đang dùng (cùng cơ chế với tools/flat_index.py).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from tools.flat_index import KEEP_FIELDS, FlatIndex, new_snapshot_version, publish_snapshot
+
+QUANTIZED_INDEX_DIR_NAME = "quantized_index"
+QUANTIZED_INDEX_FORMAT_VERSION = 1
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "meta.json"
+TEXT_STORE_FILE = "faq_text.sqlite"
+QUANTIZED_SCORE_CHUNK = int(os.getenv("QUANTIZED_SCORE_CHUNK", "1024"))
+SUPPORTED_DTYPES = ("int8", "float16")
+
+
+def quantize(matrix: np.ndarray, dtype: str):
+    """
+    (vectors, scales): int8 đối xứng theo từng vector, hoặc float16 (scales=None).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype != "int8":
+        raise ValueError(f"❌ Kiểu lượng tử hoá không được hỗ trợ: {dtype} (chọn {SUPPORTED_DTYPES})")
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = scales.astype(np.float32)
+    safe = np.where(scales == 0, 1.0, scales)
+    vectors = np.clip(np.rint(matrix / safe[:, None]), -127, 127).astype(np.int8)
+    return vectors, scales
+
+
+class TextSideStore:
+    """
+    Bảng SQLite id -> (title, answer_text, source_url); đọc theo lô id.
+    """
+    def __init__(self, path: str, read_only: bool = True):
+        self.path = path
+        self.read_only = read_only and path != ":memory:"
+        self._lock = threading.Lock()
+        self._closed = False
+        if self.read_only:
+            self._db = self._connect_read_only()
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS faq_text (
+                    id TEXT PRIMARY KEY,
+                    {", ".join(f"{f} TEXT" for f in KEEP_FIELDS)}
+                )
+            """)
+            self._db.commit()
+
+    def _connect_read_only(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def write(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        rows = [(doc_id, *[(m or {}).get(f) for f in KEEP_FIELDS]) for doc_id, m in zip(ids, metadatas)]
+        with self._lock:
+            self._db.execute("DELETE FROM faq_text")
+            self._db.executemany(
+                f"INSERT INTO faq_text (id, {', '.join(KEEP_FIELDS)}) VALUES ({', '.join('?' * (len(KEEP_FIELDS) + 1))})",
+                rows,
+            )
+            self._db.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            # Đã đóng (chỉ mục vừa được thay) nhưng còn truy vấn đang dở: mở kết nối tạm
+            db = self._connect_read_only() if self._closed and self.read_only else self._db
+            try:
+                for start in range(0, len(unique), 500):
+                    chunk = unique[start:start + 500]
+                    rows = db.execute(
+                        f"SELECT id, {', '.join(KEEP_FIELDS)} FROM faq_text WHERE id IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for row in rows:
+                        found[row[0]] = dict(zip(KEEP_FIELDS, row[1:]))
+            finally:
+                if db is not self._db:
+                    db.close()
+        return found
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._closed:
+                self._db.close()
+                self._closed = True
+
+
+class QuantizedIndex:
+    """
+    Vector int8/float16 (+ scale) và id trong RAM (memory-map), văn bản trong TextSideStore.
+    query() trả về cùng dạng collection.query của Chroma.
+    """
+    def __init__(self, ids: List[str], vectors: np.ndarray, scales: Optional[np.ndarray], text_store: TextSideStore):
+        if len(ids) != len(vectors) or (scales is not None and len(scales) != len(ids)):
+            raise ValueError("❌ QuantizedIndex: số id, vector và scale không khớp")
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.text_store = text_store
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    @property
+    def dtype(self) -> str:
+        return str(self.vectors.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    # ------------------------------------------
+    # 🔎 Tìm kiếm
+    # ------------------------------------------
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine xấp xỉ (n_queries, n_docs), tính theo từng khối hàng.
+        """
+        out = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), QUANTIZED_SCORE_CHUNK):
+            end = min(start + QUANTIZED_SCORE_CHUNK, len(self))
+            block = np.asarray(self.vectors[start:end], dtype=np.float32)
+            out[:, start:end] = queries @ block.T
+        if self.scales is not None:
+            out *= self.scales[None, :]
+        return out
+
+    def query(self, query_embeddings, n_results: int = 5, include_text: bool = True) -> Dict[str, List[List[Any]]]:
+        """
+        include_text=False: metadata để trống ({}), bên gọi tự lấy văn bản bằng get_many
+        cho những id thực sự cần (vd. top-k cuối cùng sau khi gộp/rerank).
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        results = {"ids": [], "metadatas": [], "distances": []}
+        if not len(self) or not len(queries):
+            for _ in range(len(queries)):
+                results["ids"].append([])
+                results["metadatas"].append([])
+                results["distances"].append([])
+            return results
+
+        k = min(n_results, len(self))
+        scores = self.scores(queries)
+        if k < len(self):
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(len(self)), (len(queries), 1))
+        orders = [candidates[np.lexsort((candidates, -row[candidates]))] for row, candidates in zip(scores, top)]
+
+        # Chỉ đọc văn bản của top-k (một truy vấn SQLite cho cả lô)
+        texts = self.get_many([self.ids[i] for order in orders for i in order]) if include_text else {}
+        for row, order in zip(scores, orders):
+            ids = [self.ids[i] for i in order]
+            results["ids"].append(ids)
+            results["metadatas"].append([texts.get(doc_id, {}) for doc_id in ids])
+            results["distances"].append([float(1.0 - row[i]) for i in order])
+        return results
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self.text_store.get_many(ids)
+
+    def close(self) -> None:
+        """
+        Đóng kết nối kho văn bản (khi chỉ mục này bị thay bằng snapshot mới).
+        """
+        self.text_store.close()
+
+    # ------------------------------------------
+    # 🏗️ Xây dựng / lưu / nạp
+    # ------------------------------------------
+    @classmethod
+    def from_flat(cls, flat: FlatIndex, dtype: str = "int8", text_store_path: str = ":memory:") -> "QuantizedIndex":
+        vectors, scales = quantize(flat.matrix, dtype)
+        store = TextSideStore(text_store_path, read_only=False)
+        store.write(flat.ids, flat.metadatas)
+        return cls(list(flat.ids), vectors, scales, store)
+
+    @classmethod
+    def build(cls, ids: List[str], embeddings, metadatas: List[Dict[str, Any]], directory: str,
+              dtype: str = "int8") -> "QuantizedIndex":
+        """
+        Lượng tử hoá và ghi snapshot vào directory (thư mục mới, chưa ai đọc).
+        """
+        os.makedirs(directory, exist_ok=True)
+        flat = FlatIndex.build(ids, embeddings, metadatas)
+        vectors, scales = quantize(flat.matrix, dtype)
+
+        store = TextSideStore(os.path.join(directory, TEXT_STORE_FILE), read_only=False)
+        store.write(flat.ids, flat.metadatas)
+        store.close()
+
+        np.save(os.path.join(directory, VECTORS_FILE), vectors)
+        if scales is not None:
+            np.save(os.path.join(directory, SCALES_FILE), scales)
+        # meta.json ghi sau cùng: thư mục chỉ được coi là snapshot hợp lệ khi có file này
+        with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": QUANTIZED_INDEX_FORMAT_VERSION,
+                "dtype": dtype,
+                "dim": flat.dim,
+                "ids": flat.ids,
+            }, f, ensure_ascii=False)
+        return cls.load(directory)
+
+    @classmethod
+    def build_snapshot(cls, ids: List[str], embeddings, metadatas: List[Dict[str, Any]], root: str,
+                       dtype: str = "int8") -> "QuantizedIndex":
+        """
+        Ghi vào một phiên bản mới dưới root rồi chuyển CURRENT sang (app đang chạy không bị ảnh hưởng).
+        """
+        directory = new_snapshot_version(root)
+        index = cls.build(ids, embeddings, metadatas, directory, dtype=dtype)
+        publish_snapshot(root, directory)
+        return index
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "QuantizedIndex":
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != QUANTIZED_INDEX_FORMAT_VERSION:
+            raise ValueError(f"❌ {directory}: định dạng chỉ mục lượng tử hoá không được hỗ trợ ({meta.get('format')})")
+        mode = "r" if mmap else None
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode=mode)
+        scales = None
+        if meta["dtype"] == "int8":
+            scales = np.load(os.path.join(directory, SCALES_FILE))
+        store = TextSideStore(os.path.join(directory, TEXT_STORE_FILE), read_only=True)
+        return cls(meta["ids"], vectors, scales, store)
+
+
+def snapshot_dir(db_dir: str) -> str:
+    return os.path.join(db_dir, QUANTIZED_INDEX_DIR_NAME)
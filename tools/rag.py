@@ -1,51 +1,356 @@
 import os
+import json
+import time
+import threading
 from pathlib import Path
-import chromadb
-from sentence_transformers import SentenceTransformer
+from typing import Optional
 from functools import lru_cache
+from utils.paths import EMBEDDING_MODEL_PATH, FAQ_DB_PATH, FAQ_COLLECTION_NAME
+from tools.embedding_backend import EMBEDDING_BACKEND, backend_identity, load_embedding_model, warmup_model
+from tools.embedding_cache import EMBEDDING_CACHE, normalize_text
+from tools.embedding_service import EMBEDDING_SERVICE_ENABLED, EmbeddingBatcher
+from tools.lexical_index import BM25Index, INDEX_FILE_NAME, reciprocal_rank_fusion
+from tools import flat_index, quantized_index
+from tools.flat_index import FlatIndex
+from tools.quantized_index import QuantizedIndex
+from tools.reranker import RERANK_CANDIDATES, RERANK_TOP_K, rerank_batch, rerank_enabled
+from tools.reranker import warmup as warmup_reranker
+from utils.metrics import METRICS
 
-# Load mo hinh embedding
+# File đánh dấu phiên bản index, create_vecto_db/create_faq_db.py ghi lại mỗi lần build
+FAQ_INDEX_VERSION_FILE = "index_version.json"
+
+# Tìm kiếm lai (vector + BM25), gộp bằng reciprocal rank fusion
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# "chroma": truy vấn qua collection Chroma; "flat": ma trận NumPy trong RAM (tools/flat_index.py);
+# "quantized": vector int8/float16 + kho văn bản SQLite (tools/quantized_index.py)
+RETRIEVAL_ENGINE = os.getenv("RETRIEVAL_ENGINE", "chroma").strip().lower()
+# Kiểu lượng tử hoá khi engine "quantized" phải tự build từ Chroma (chưa có snapshot)
+QUANTIZED_INDEX_DTYPE = os.getenv("QUANTIZED_INDEX_DTYPE", "int8")
+
+# Số kết quả mặc định khi không bật rerank
+DEFAULT_N_RESULTS = 5
+
+# Load mo hinh embedding (torch | torch_int8 | onnx, xem tools/embedding_backend.py)
 @lru_cache(maxsize=1)
 def load_model():
-    local_model_path = r"D:/Chatbot_Data4Life/v1/models/Vietnamese_Embedding"
-    model = SentenceTransformer(local_model_path)
+    model = load_embedding_model(EMBEDDING_BACKEND)
     return model
 
 @lru_cache(maxsize=1)
 def connect_chroma_db():
+    # Import tại chỗ: engine flat/quantized không cần nạp chromadb
+    import chromadb
+
     # 📂 Đường dẫn tới thư mục chứa chroma.sqlite3
-    persist_dir = r"D:/Chatbot_Data4Life/v1/chroma_db/chroma_db_faqs"  
+    persist_dir = FAQ_DB_PATH
 
     # Kết nối ChromaDB
     client = chromadb.PersistentClient(path=persist_dir)
-    collection = client.get_collection("faqs_collection")
+    collection = client.get_collection(FAQ_COLLECTION_NAME)
     return collection
 
 
+_LEXICAL = {"mtime": None, "index": None}
+_LEXICAL_LOCK = threading.Lock()
+
+def load_lexical_index() -> Optional[BM25Index]:
+    """
+    Chỉ mục BM25 build cùng Chroma (bm25_index.json); nạp lại khi file đổi.
+    None nếu tắt tìm kiếm lai hoặc chưa có file (chỉ dùng vector).
+    """
+    if not HYBRID_SEARCH_ENABLED:
+        return None
+    path = Path(FAQ_DB_PATH) / INDEX_FILE_NAME
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _LEXICAL["mtime"]:
+        with _LEXICAL_LOCK:
+            if mtime != _LEXICAL["mtime"]:
+                _LEXICAL["index"] = BM25Index.load(str(path))
+                _LEXICAL["mtime"] = mtime
+                print(f"Đã nạp chỉ mục BM25: {len(_LEXICAL['index'])} tài liệu")
+    return _LEXICAL["index"]
+
+
+_VECTOR_INDEX = {"key": None, "index": None}
+_VECTOR_INDEX_LOCK = threading.Lock()
+
+def load_vector_index():
+    """
+    Chỉ mục trong RAM của RETRIEVAL_ENGINE ("flat" -> FlatIndex, "quantized" -> QuantizedIndex):
+    từ snapshot cạnh chroma.sqlite3 (memory-map) nếu có, ngược lại xuất từ collection
+    Chroma. Nạp lại khi CURRENT trỏ sang phiên bản snapshot khác hoặc phiên bản FAQ index thay đổi.
+    """
+    module = quantized_index if RETRIEVAL_ENGINE == "quantized" else flat_index
+    snapshot = flat_index.current_snapshot(module.snapshot_dir(FAQ_DB_PATH))
+    key = f"{RETRIEVAL_ENGINE}:snapshot:{snapshot}" if snapshot is not None else f"{RETRIEVAL_ENGINE}:chroma:{faq_index_version()}"
+    if key != _VECTOR_INDEX["key"]:
+        with _VECTOR_INDEX_LOCK:
+            if key != _VECTOR_INDEX["key"]:
+                t0 = time.perf_counter()
+                if snapshot is not None:
+                    cls = QuantizedIndex if RETRIEVAL_ENGINE == "quantized" else FlatIndex
+                    index, source = cls.load(snapshot), f"snapshot {os.path.basename(snapshot)}"
+                else:
+                    index, source = FlatIndex.from_collection(connect_chroma_db()), "Chroma"
+                    if RETRIEVAL_ENGINE == "quantized":
+                        index = QuantizedIndex.from_flat(index, QUANTIZED_INDEX_DTYPE)
+                previous = _VECTOR_INDEX["index"]
+                _VECTOR_INDEX["index"] = index
+                _VECTOR_INDEX["key"] = key
+                # Đóng kết nối SQLite của chỉ mục cũ (không để rò rỉ qua mỗi lần build lại)
+                if isinstance(previous, QuantizedIndex):
+                    previous.close()
+                print(f"Đã nạp chỉ mục {RETRIEVAL_ENGINE} từ {source}: {len(index)} vector x {index.dim} chiều "
+                      f"({(time.perf_counter() - t0) * 1000:.0f}ms)")
+    return _VECTOR_INDEX["index"]
+
+def vector_query(query_embeddings: list, n_results: int) -> dict:
+    """
+    Top-k vector cho cả lô theo RETRIEVAL_ENGINE; kết quả dạng collection.query của Chroma.
+    Engine "quantized" không đọc văn bản ở bước này (metadata rỗng, xem fill_documents).
+    """
+    t0 = time.perf_counter()
+    try:
+        if RETRIEVAL_ENGINE == "quantized":
+            return load_vector_index().query(query_embeddings, n_results, include_text=False)
+        if RETRIEVAL_ENGINE == "flat":
+            return load_vector_index().query(query_embeddings, n_results)
+        return connect_chroma_db().query(
+            query_embeddings=query_embeddings,  # danh sách các vector query
+            n_results=n_results,  # số kết quả muốn lấy cho mỗi query
+            include=["metadatas", "distances"],
+        )
+    finally:
+        METRICS.observe(f"retrieval.vector_query.{RETRIEVAL_ENGINE}", (time.perf_counter() - t0) * 1000)
+
+
+def faq_index_version() -> str:
+    """
+    Phiên bản hiện tại của FAQ index: giá trị trong index_version.json nếu có,
+    ngược lại mtime của chroma.sqlite3. Đổi giá trị = collection đã được build lại.
+    """
+    marker = Path(FAQ_DB_PATH) / FAQ_INDEX_VERSION_FILE
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            return str(json.load(f).get("version", ""))
+    except (FileNotFoundError, ValueError):
+        pass
+    try:
+        return f"mtime:{os.stat(Path(FAQ_DB_PATH) / 'chroma.sqlite3').st_mtime_ns}"
+    except FileNotFoundError:
+        return ""
+
+
+@lru_cache(maxsize=1)
+def model_identity() -> str:
+    """
+    Định danh mô hình cho khoá cache embedding (đổi mô hình -> không dùng lại vector cũ).
+    """
+    model = load_model()
+    return f"{os.path.abspath(EMBEDDING_MODEL_PATH)}:{backend_identity(EMBEDDING_BACKEND)}:{model.get_sentence_embedding_dimension()}"
+
+@lru_cache(maxsize=1)
+def get_embedding_service() -> EmbeddingBatcher:
+    """
+    Worker gom lô dùng chung: các lượt hỏi đồng thời được encode chung một lần.
+    """
+    return EmbeddingBatcher(lambda texts: load_model().encode(texts), name="embedding-service")
+
+def _encode(texts: list[str]):
+    if EMBEDDING_SERVICE_ENABLED:
+        return get_embedding_service().encode(texts)
+    return load_model().encode(texts)
+
 def get_embedding(text: str) -> list[float]:
-    if not text.strip():
+    if not normalize_text(text):
         print("Attempted to get embedding for empty text.")
         return []
 
-    model = load_model()
-    embedding = model.encode(text)
+    embedding = EMBEDDING_CACHE.get_many(model_identity(), [text], _encode)[0]
 
     return embedding.tolist()
 
-def search_project_documents(query: str):
-    query_embed = get_embedding(query)
-    answer = []
-    collection = connect_chroma_db()
-    results = collection.query(
-        query_embeddings=[query_embed],  # danh sách các vector query
-        n_results=5  # số kết quả muốn lấy
+def get_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Embed nhiều câu trong một lần encode (batch); câu đã có trong cache không encode lại.
+    """
+    if not texts:
+        return []
+    embeddings = EMBEDDING_CACHE.get_many(model_identity(), texts, _encode)
+    return [e.tolist() for e in embeddings]
+
+@lru_cache(maxsize=1)
+def distance_space() -> str:
+    """
+    Không gian khoảng cách của collection (create_faq_db.py tạo với "cosine").
+    Chỉ mục phẳng/lượng tử hoá luôn trả distance cosine.
+    """
+    if RETRIEVAL_ENGINE in ("flat", "quantized"):
+        return "cosine"
+    return (connect_chroma_db().metadata or {}).get("hnsw:space", "l2")
+
+def similarity_from_distance(distance: Optional[float]) -> Optional[float]:
+    """
+    Đổi distance của Chroma thành độ tương đồng cosine (embedding đã chuẩn hoá):
+    cosine: 1 - d, l2 (bình phương): 1 - d/2, ip: 1 - d.
+    """
+    if distance is None:
+        return None
+    if distance_space() == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+def _candidate(doc_id: str, fields: dict, distance=None) -> dict:
+    return {
+        "id": doc_id,
+        "answer_text": fields.get("answer_text"),
+        "title": fields.get("title"),
+        "source_url": fields.get("source_url"),
+        "distance": distance,
+        "similarity": None if distance is None else round(similarity_from_distance(distance), 6),
+    }
+
+def fetch_documents(ids: list[str]) -> dict:
+    """
+    title / answer_text / source_url theo id từ chỉ mục vector đang dùng
+    (kho văn bản SQLite, metadata của chỉ mục phẳng, hoặc collection Chroma).
+    """
+    if not ids:
+        return {}
+    if RETRIEVAL_ENGINE in ("flat", "quantized"):
+        return load_vector_index().get_many(ids)
+    found = connect_chroma_db().get(ids=list(ids), include=["metadatas"])
+    return {doc_id: meta or {} for doc_id, meta in zip(found["ids"], found["metadatas"])}
+
+def fill_documents(candidate_lists: list[list[dict]]) -> None:
+    """
+    Điền nội dung cho các ứng viên chưa có (vector lượng tử hoá, hoặc chỉ có ở phía
+    BM25 — chỉ mục BM25 chỉ giữ title), một lần tra cứu cho cả lô.
+    """
+    pending = [c for found in candidate_lists for c in found if c["answer_text"] is None and c["source_url"] is None]
+    if not pending:
+        return
+    t0 = time.perf_counter()
+    documents = fetch_documents(list(dict.fromkeys(c["id"] for c in pending)))
+    for candidate in pending:
+        fields = documents.get(candidate["id"]) or {}
+        for field in ("title", "answer_text", "source_url"):
+            if candidate[field] is None:
+                candidate[field] = fields.get(field)
+    METRICS.observe("retrieval.fetch_documents", (time.perf_counter() - t0) * 1000)
+
+def _fuse(query: str, vector_candidates: list[dict], lexical: BM25Index, n_results: int) -> list[dict]:
+    """
+    Gộp thứ hạng vector và BM25 bằng RRF; tài liệu chỉ có ở phía BM25 chỉ có title
+    (nội dung điền sau bằng fill_documents).
+    """
+    t0 = time.perf_counter()
+    lexical_hits = lexical.search(query, HYBRID_CANDIDATES)
+    fused = reciprocal_rank_fusion(
+        [
+            ([c["id"] for c in vector_candidates], HYBRID_VECTOR_WEIGHT),
+            ([lexical.doc_ids[i] for i, _ in lexical_hits], HYBRID_LEXICAL_WEIGHT),
+        ],
+        k=HYBRID_RRF_K,
     )
-    for doc in results["metadatas"][0]:
-        answer.append(doc.get("answer_text"))
-    return answer
+    by_id = {c["id"]: c for c in vector_candidates}
+    candidates = []
+    for doc_id, score in fused[:n_results]:
+        candidate = by_id.get(doc_id)
+        if candidate is None:
+            candidate = _candidate(doc_id, lexical.docs[lexical.positions[doc_id]])
+        candidate["fusion_score"] = round(score, 6)
+        candidates.append(candidate)
+    METRICS.observe("retrieval.lexical_fusion", (time.perf_counter() - t0) * 1000)
+    return candidates
+
+def retrieve_candidates_batch(queries: list[str], n_results: Optional[int] = None) -> list[list[dict]]:
+    """
+    Ứng viên cho nhiều câu truy vấn: một lần encode + một lần truy vấn vector cho cả lô,
+    sau đó (nếu có chỉ mục BM25) gộp với kết quả BM25 của từng câu, rồi (nếu bật)
+    rerank RERANK_CANDIDATES ứng viên và giữ n_results.
+    Mỗi ứng viên: {"id", "answer_text", "title", "source_url", "distance", "similarity"
+    [, "fusion_score", "rerank_score"]}; tài liệu chỉ có ở phía BM25 có distance/similarity = None.
+    """
+    if n_results is None:
+        n_results = RERANK_TOP_K if rerank_enabled() else DEFAULT_N_RESULTS
+    candidates: list[list[dict]] = [[] for _ in queries]
+    positions = [i for i, q in enumerate(queries) if q and q.strip()]
+    if not positions:
+        return candidates
 
+    lexical = load_lexical_index()
+    # Số ứng viên giữ lại trước bước rerank
+    n_pool = max(n_results, RERANK_CANDIDATES) if rerank_enabled() else n_results
+    n_vector = max(n_pool, HYBRID_CANDIDATES) if lexical is not None else n_pool
 
+    query_embeds = get_embeddings([queries[i] for i in positions])
+    results = vector_query(query_embeds, n_vector)
+    for position, ids, metadatas, distances in zip(positions, results["ids"], results["metadatas"], results["distances"]):
+        vector_candidates = [
+            _candidate(doc_id, meta or {}, distance)
+            for doc_id, meta, distance in zip(ids, metadatas, distances)
+        ]
+        if lexical is None:
+            candidates[position] = vector_candidates[:n_pool]
+        else:
+            candidates[position] = _fuse(queries[position], vector_candidates, lexical, n_pool)
 
+    if rerank_enabled():
+        # Reranker chấm điểm trên title/answer_text nên cần nội dung của cả nhóm ứng viên
+        fill_documents(candidates)
+        reranked = rerank_batch([queries[i] for i in positions], [candidates[i] for i in positions], top_k=n_results)
+        for position, found in zip(positions, reranked):
+            candidates[position] = found
+    # Văn bản dài chỉ được đọc cho kết quả cuối cùng
+    fill_documents(candidates)
+    return candidates
 
+def _hit(candidate: dict) -> dict:
+    return {
+        "answer_text": candidate["answer_text"],
+        "title": candidate["title"],
+        "source_url": candidate["source_url"],
+        "distance": candidate["distance"],
+        "similarity": candidate["similarity"],
+    }
+
+def search_project_documents(query: str):
+    return search_project_documents_batch([query])[0]
 
+def search_project_documents_batch(queries: list[str], n_results: Optional[int] = None) -> list[list[dict]]:
+    """
+    Tìm nhiều câu truy vấn cùng lúc (xem retrieve_candidates_batch). Mỗi câu trả về
+    danh sách {"answer_text", "title", "source_url", "distance", "similarity"} theo
+    thứ tự liên quan giảm dần. Câu truy vấn rỗng trả về [].
+    """
+    return [
+        [_hit(c) for c in found]
+        for found in retrieve_candidates_batch(queries, n_results)
+    ]
 
+def warmup() -> None:
+    """
+    Nạp sẵn mô hình embedding, Chroma (hoặc chỉ mục trong RAM), chỉ mục BM25 và reranker khi khởi động.
+    """
+    t0 = time.perf_counter()
+    warmup_model(load_model())
+    print(f"Đã nạp và chạy thử mô hình embedding ({EMBEDDING_BACKEND}): {(time.perf_counter() - t0) * 1000:.0f}ms")
+    if EMBEDDING_SERVICE_ENABLED:
+        get_embedding_service().encode(["khởi động"])
+    if RETRIEVAL_ENGINE in ("flat", "quantized"):
+        load_vector_index()
+    else:
+        connect_chroma_db()
+    distance_space()
+    load_lexical_index()
+    warmup_reranker()
@@ -0,0 +1,141 @@
+# tools/reranker.py
+
+"""
+Bước xếp hạng lại (rerank) cho kết quả truy xuất FAQ.
+
+Truy xuất lấy dư RERANK_CANDIDATES ứng viên, reranker chấm điểm lại từng cặp
+(câu hỏi, ứng viên) và giữ top-k. Hai loại reranker:
+
+- "cross_encoder": sentence_transformers.CrossEncoder cục bộ (RERANKER_MODEL_PATH),
+  chính xác nhất nhưng tốn thời gian nhất.
+- "embedding": cosine giữa embedding câu hỏi và embedding tiêu đề ứng viên,
+  dùng lại mô hình embedding + cache embedding sẵn có (rẻ).
+- "none" (mặc định): giữ nguyên thứ tự truy xuất.
+
+Có ngân sách thời gian cứng (RERANK_BUDGET_MS): quá hạn thì dùng lại thứ tự
+vector/fusion ban đầu. Thời gian rerank được ghi vào METRICS (retrieval.rerank).
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+
+from utils.metrics import METRICS
+from utils.paths import RERANKER_MODEL_PATH
+
+RERANKER = os.getenv("RERANKER", "none").strip().lower()
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "5"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+# Độ dài tối đa (ký tự) của answer_text đưa vào cross-encoder
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "512"))
+
+# Chấm điểm chạy trong thread riêng để có thể bỏ chờ khi quá ngân sách
+# (lần chấm bị bỏ vẫn chạy nốt trong nền, kết quả bị bỏ qua)
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rerank")
+
+
+@lru_cache(maxsize=1)
+def load_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANKER_MODEL_PATH, max_length=256)
+
+
+def _candidate_text(candidate: Dict[str, Any]) -> str:
+    title = candidate.get("title") or ""
+    answer = (candidate.get("answer_text") or "")[:RERANK_MAX_CHARS]
+    return f"{title}. {answer}" if title else answer
+
+
+def _cross_encoder_scores(queries: List[str], candidate_lists: List[List[Dict[str, Any]]]) -> List[List[float]]:
+    """
+    Một lần predict cho mọi cặp (câu hỏi, ứng viên) của cả lô.
+    """
+    pairs = [(q, _candidate_text(c)) for q, cands in zip(queries, candidate_lists) for c in cands]
+    if not pairs:
+        return [[] for _ in queries]
+    flat = np.asarray(load_cross_encoder().predict(pairs), dtype=np.float32).reshape(-1)
+    scores, start = [], 0
+    for cands in candidate_lists:
+        scores.append(flat[start:start + len(cands)].tolist())
+        start += len(cands)
+    return scores
+
+
+def _embedding_scores(queries: List[str], candidate_lists: List[List[Dict[str, Any]]]) -> List[List[float]]:
+    from tools.rag import get_embeddings
+
+    texts = [c.get("title") or c.get("answer_text") or "" for cands in candidate_lists for c in cands]
+    vectors = np.asarray(get_embeddings(list(queries) + texts), dtype=np.float32)
+    if vectors.size == 0:
+        return [[] for _ in queries]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+    query_vecs, doc_vecs = vectors[:len(queries)], vectors[len(queries):]
+    scores, start = [], 0
+    for q_vec, cands in zip(query_vecs, candidate_lists):
+        scores.append((doc_vecs[start:start + len(cands)] @ q_vec).tolist())
+        start += len(cands)
+    return scores
+
+
+_SCORERS = {
+    "cross_encoder": _cross_encoder_scores,
+    "embedding": _embedding_scores,
+}
+
+
+def rerank_enabled() -> bool:
+    return RERANKER in _SCORERS
+
+
+def rerank_batch(
+    queries: List[str],
+    candidate_lists: List[List[Dict[str, Any]]],
+    top_k: int = RERANK_TOP_K,
+    budget_ms: float = RERANK_BUDGET_MS,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Xếp hạng lại ứng viên của từng câu hỏi, giữ top_k. Quá ngân sách thời gian
+    hoặc lỗi -> giữ thứ tự ban đầu (cắt top_k). Ứng viên được thêm "rerank_score".
+    """
+    if not rerank_enabled() or not any(candidate_lists):
+        return [cands[:top_k] for cands in candidate_lists]
+
+    t0 = time.perf_counter()
+    future = _EXECUTOR.submit(_SCORERS[RERANKER], queries, candidate_lists)
+    try:
+        scores = future.result(timeout=budget_ms / 1000 if budget_ms > 0 else None)
+    except FutureTimeoutError:
+        future.cancel()
+        METRICS.increment("retrieval.rerank_fallback")
+        print(f"⚠️ Rerank quá ngân sách {budget_ms:.0f}ms, dùng thứ tự truy xuất.")
+        return [cands[:top_k] for cands in candidate_lists]
+    except Exception as e:
+        METRICS.increment("retrieval.rerank_errors")
+        print(f"⚠️ Lỗi rerank, dùng thứ tự truy xuất: {e}")
+        return [cands[:top_k] for cands in candidate_lists]
+    finally:
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        METRICS.observe("retrieval.rerank", elapsed_ms)
+        # Thời gian chia đều cho từng câu hỏi của lô
+        per_query = elapsed_ms / max(1, len(queries))
+        for _ in queries:
+            METRICS.observe("retrieval.rerank_per_query", per_query)
+
+    reranked = []
+    for cands, cand_scores in zip(candidate_lists, scores):
+        for candidate, score in zip(cands, cand_scores):
+            candidate["rerank_score"] = round(float(score), 6)
+        reranked.append(sorted(cands, key=lambda c: c.get("rerank_score", float("-inf")), reverse=True)[:top_k])
+    return reranked
+
+
+def warmup() -> None:
+    if RERANKER == "cross_encoder":
+        load_cross_encoder()
@@ -5,8 +5,14 @@ Bản đồ ánh xạ tên tool (dưới dạng string) với hàm Python thực
 Các node như tool_executor sẽ sử dụng nó để gọi hàm tương ứng.
 """
 
-from tools.rag import search_project_documents
+from tools.rag import search_project_documents, search_project_documents_batch
 
 TOOL_REGISTRY = {
     "search_project_documents": search_project_documents
 }
+
+# Bản chạy theo lô của tool: tên tool -> (hàm nhận list giá trị, tên tham số duy nhất).
+# tool_executor gộp các lời gọi cùng tool (chỉ có đúng tham số đó) thành một lần gọi.
+BATCH_TOOL_REGISTRY = {
+    "search_project_documents": (search_project_documents_batch, "query")
+}
@@ -0,0 +1,293 @@
+# utils/gemini_pool.py
+
+"""
+Pool client Gemini dùng chung cho toàn process.
+
+- Mỗi API key (GOOGLE_API_KEY_1, GOOGLE_API_KEY_2, ...) có một google.genai.Client
+  riêng, tạo một lần — không còn gọi genai.configure toàn cục nên các request
+  đồng thời không tranh nhau key đang active.
+- Mỗi lời gọi chọn key theo độ trễ quan sát được (EWMA) và số request đang chạy.
+- Key trả về 429 (hết quota) bị tạm ngưng với backoff luỹ thừa, lời gọi được
+  thử lại bằng key khác.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.metrics import METRICS
+
+load_dotenv()
+
+BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "2"))
+BACKOFF_MAX_SECONDS = float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", "60"))
+# Quota ước lượng mỗi key (request/phút), dùng để dàn tải trước khi chạm 429
+RPM_PER_KEY = float(os.getenv("GEMINI_RPM_PER_KEY", "15"))
+_EWMA_ALPHA = 0.2
+
+
+class _KeyState:
+    def __init__(self, env_name: str, api_key: str):
+        self.env_name = env_name
+        self.api_key = api_key
+        self._client = None
+        self.inflight = 0
+        # None = chưa có quan sát -> ưu tiên thử key này trước
+        self.latency_ms: Optional[float] = None
+        self.recent_calls: deque = deque()
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def score(self, preferred: Optional[str], now: float) -> float:
+        """
+        Càng thấp càng tốt: độ trễ EWMA x số request đang chạy x mức dùng quota trong 60s gần nhất.
+        Key "ưu tiên" của wrapper được giảm nhẹ điểm để giữ phân tách tải cũ khi các key ngang nhau.
+        """
+        while self.recent_calls and now - self.recent_calls[0] > 60:
+            self.recent_calls.popleft()
+        if self.latency_ms is None:
+            return 0.0
+        value = self.latency_ms * (1 + self.inflight) * (1 + len(self.recent_calls) / RPM_PER_KEY)
+        if preferred and self.env_name == preferred:
+            value *= 0.8
+        return value
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    return bool(re.search(r"\b429\b|RESOURCE_EXHAUSTED", str(error)))
+
+
+class GeminiClientPool:
+    """
+    Chọn key, theo dõi quota/độ trễ, thread-safe.
+    """
+    def __init__(self, api_keys: Dict[str, str]):
+        if not api_keys:
+            raise ValueError("❌ Missing API key: cần ít nhất một GOOGLE_API_KEY_<n> hoặc GOOGLE_API_KEY")
+        self._keys = [_KeyState(name, key) for name, key in api_keys.items()]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "GeminiClientPool":
+        keys: Dict[str, str] = {}
+        for name, value in sorted(os.environ.items()):
+            if value and re.fullmatch(r"GOOGLE_API_KEY(_\d+)?", name):
+                # Bỏ key trùng giá trị (cùng quota)
+                if value not in keys.values():
+                    keys[name] = value
+        return cls(keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # ------------------------------------------
+    # 🔑 Chọn / trả key
+    # ------------------------------------------
+    def _try_acquire(self, preferred: Optional[str], exclude: set) -> Tuple[Optional[_KeyState], float]:
+        """
+        Trả về (key, 0) nếu có key dùng được, ngược lại (None, số giây cần chờ).
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [k for k in self._keys if k.env_name not in exclude] or list(self._keys)
+            ready = [k for k in candidates if k.cooldown_until <= now]
+            if not ready:
+                return None, max(0.0, min(k.cooldown_until for k in candidates) - now)
+            best = min(ready, key=lambda k: k.score(preferred, now))
+            best.inflight += 1
+            best.calls += 1
+            best.recent_calls.append(now)
+            return best, 0.0
+
+    def acquire(self, preferred: Optional[str] = None, exclude: Optional[set] = None) -> _KeyState:
+        while True:
+            key, wait = self._try_acquire(preferred, exclude or set())
+            if key is not None:
+                return key
+            time.sleep(wait)
+
+    async def aacquire(self, preferred: Optional[str] = None, exclude: Optional[set] = None) -> _KeyState:
+        while True:
+            key, wait = self._try_acquire(preferred, exclude or set())
+            if key is not None:
+                return key
+            await asyncio.sleep(wait)
+
+    def release(self, key: _KeyState, latency_ms: Optional[float] = None, error: Optional[Exception] = None) -> bool:
+        """
+        Cập nhật thống kê của key. Trả về True nếu lỗi là 429 (nên thử key khác).
+        """
+        rate_limited = error is not None and _is_rate_limited(error)
+        with self._lock:
+            key.inflight = max(0, key.inflight - 1)
+            if rate_limited:
+                key.rate_limited += 1
+                key.consecutive_429 += 1
+                backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (key.consecutive_429 - 1)))
+                key.cooldown_until = time.monotonic() + backoff * (1 + random.random() * 0.1)
+            elif error is not None:
+                key.errors += 1
+            else:
+                key.consecutive_429 = 0
+                if latency_ms is not None:
+                    if key.latency_ms is None:
+                        key.latency_ms = latency_ms
+                    else:
+                        key.latency_ms = (1 - _EWMA_ALPHA) * key.latency_ms + _EWMA_ALPHA * latency_ms
+        if rate_limited:
+            METRICS.increment(f"gemini.{key.env_name}.429")
+            print(f"⚠️ {key.env_name} bị giới hạn quota (429), tạm ngưng key này.")
+        return rate_limited
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": k.env_name,
+                    "inflight": k.inflight,
+                    "latency_ms": round(k.latency_ms, 1) if k.latency_ms is not None else None,
+                    "calls_last_minute": len(k.recent_calls),
+                    "cooldown_s": round(max(0.0, k.cooldown_until - now), 1),
+                    "calls": k.calls,
+                    "rate_limited": k.rate_limited,
+                    "errors": k.errors,
+                }
+                for k in self._keys
+            ]
+
+    def model(self, model_name: str, preferred_key: Optional[str] = None) -> "PooledModel":
+        return PooledModel(self, model_name, preferred_key)
+
+
+class PooledModel:
+    """
+    Thay thế genai.GenerativeModel: cùng giao diện generate_content /
+    generate_content_async (kể cả stream=True), nhưng mỗi lời gọi lấy key từ pool.
+    """
+    def __init__(self, pool: GeminiClientPool, model_name: str, preferred_key: Optional[str] = None):
+        self.pool = pool
+        self.model_name = model_name
+        self.preferred_key = preferred_key
+
+    # ------------------------------------------
+    # 🔁 Sync
+    # ------------------------------------------
+    def generate_content(self, prompt: str, stream: bool = False):
+        if stream:
+            return self._stream(prompt)
+        tried: set = set()
+        while True:
+            key = self.pool.acquire(self.preferred_key, tried)
+            t0 = time.perf_counter()
+            try:
+                response = key.client.models.generate_content(model=self.model_name, contents=prompt)
+            except Exception as e:
+                if self.pool.release(key, error=e) and len(tried) + 1 < len(self.pool):
+                    tried.add(key.env_name)
+                    continue
+                raise
+            self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+            return response
+
+    def _stream(self, prompt: str):
+        tried: set = set()
+        while True:
+            key = self.pool.acquire(self.preferred_key, tried)
+            t0 = time.perf_counter()
+            started = False
+            try:
+                for chunk in key.client.models.generate_content_stream(model=self.model_name, contents=prompt):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                # Người gọi dừng stream giữa chừng
+                self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+                raise
+            except Exception as e:
+                # Chỉ thử key khác khi chưa trả đoạn nào cho người gọi
+                if self.pool.release(key, error=e) and not started and len(tried) + 1 < len(self.pool):
+                    tried.add(key.env_name)
+                    continue
+                raise
+            self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+            return
+
+    # ------------------------------------------
+    # ⚡ Async
+    # ------------------------------------------
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        if stream:
+            return self._astream(prompt)
+        tried: set = set()
+        while True:
+            key = await self.pool.aacquire(self.preferred_key, tried)
+            t0 = time.perf_counter()
+            try:
+                response = await key.client.aio.models.generate_content(model=self.model_name, contents=prompt)
+            except Exception as e:
+                if self.pool.release(key, error=e) and len(tried) + 1 < len(self.pool):
+                    tried.add(key.env_name)
+                    continue
+                raise
+            self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+            return response
+
+    async def _astream(self, prompt: str):
+        tried: set = set()
+        while True:
+            key = await self.pool.aacquire(self.preferred_key, tried)
+            t0 = time.perf_counter()
+            started = False
+            try:
+                async for chunk in await key.client.aio.models.generate_content_stream(model=self.model_name, contents=prompt):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+                raise
+            except Exception as e:
+                if self.pool.release(key, error=e) and not started and len(tried) + 1 < len(self.pool):
+                    tried.add(key.env_name)
+                    continue
+                raise
+            self.pool.release(key, latency_ms=(time.perf_counter() - t0) * 1000)
+            return
+
+
+_POOL: Optional[GeminiClientPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_client_pool() -> GeminiClientPool:
+    """
+    Pool dùng chung cho toàn process (khởi tạo lười, thread-safe).
+    """
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = GeminiClientPool.from_env()
+    return _POOL
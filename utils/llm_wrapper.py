@@ -1,28 +1,92 @@
-import os
 import json
-from typing import List, Dict, Any
-import google.generativeai as genai
-from google.genai import types
+import time
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
 from dotenv import load_dotenv
+from utils.metrics import METRICS
+from utils.gemini_pool import get_client_pool
 
 load_dotenv()
 
+
+def _safe_text(response) -> str:
+    # response.text có thể raise nếu câu trả lời bị chặn (safety) hoặc rỗng
+    if response is None:
+        return ""
+    try:
+        return response.text or ""
+    except Exception:
+        return ""
+
+
+def _timed_generate(model, prompt: str, model_name: str = ""):
+    """
+    Gọi generate_content và ghi lại thời gian, kích thước prompt/response vào METRICS.
+    """
+    t0 = time.perf_counter()
+    response = None
+    try:
+        response = model.generate_content(prompt)
+        return response
+    finally:
+        METRICS.record_llm_call(
+            prompt=prompt,
+            response=_safe_text(response),
+            duration_ms=(time.perf_counter() - t0) * 1000,
+            model=model_name,
+        )
+
+
+async def _atimed_generate(model, prompt: str, model_name: str = ""):
+    """
+    Bản async của _timed_generate: dùng generate_content_async để không chặn event loop.
+    """
+    t0 = time.perf_counter()
+    response = None
+    try:
+        response = await model.generate_content_async(prompt)
+        return response
+    finally:
+        METRICS.record_llm_call(
+            prompt=prompt,
+            response=_safe_text(response),
+            duration_ms=(time.perf_counter() - t0) * 1000,
+            model=model_name,
+        )
+
+
+def _response_text(response) -> str:
+    # Lấy text an toàn
+    raw_text = getattr(response, "text", None)
+    if raw_text is None:
+        # try other representations
+        raw_text = str(response)
+    return raw_text.strip()
+
+
+def render_tool_descriptions(role_tools: List[Dict[str, Any]]) -> str:
+    """
+    Khối mô tả tool chèn vào prompt của GeminiAnalyzerLLM.
+    """
+    return "\n".join([
+        f"- {t['name']}: {t.get('description', '')}\n  Parameters: {t.get('parameters', {})}\n  Returns: {t.get('returns', '')}"
+        for t in role_tools
+    ])
+
+
 class GeminiAnalyzerLLM:
     """
     LLM dùng trong agent_executor_node
     → nhiệm vụ: phân tích câu hỏi, chọn tool, suy luận logic
     """
     def __init__(self, model_name: str = "gemini-2.0-flash", api_key_env: str = "GOOGLE_API_KEY_1"):
-        api_key = os.getenv(api_key_env)
-        if not api_key:
-            raise ValueError(f"❌ Missing API key: {api_key_env}")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
+        # Client dùng chung từ pool; api_key_env chỉ là key được ưu tiên khi các key ngang nhau
+        self.model_name = model_name
+        self.model = get_client_pool().model(model_name, preferred_key=api_key_env)
 
 
-    def analyze_task(self, base_prompt: str, user_question: str, role_tools: List[Dict[str, Any]]) -> str:
+    def _build_prompt(self, base_prompt: str, user_question: str, role_tools: List[Dict[str, Any]], tool_descriptions: Optional[str] = None) -> str:
         """
-        Gọi Gemini để phân tích nhiệm vụ.
+        Dựng prompt phân tích nhiệm vụ (tool_descriptions: khối mô tả tool đã render sẵn, nếu có).
         -> Trả về CHUỖI chứa JSON (thô) theo schema:
         {
           "analysis": "...",
@@ -33,10 +97,8 @@ class GeminiAnalyzerLLM:
         }
         """
 
-        tool_descriptions = "\n".join([
-            f"- {t['name']}: {t.get('description', '')}\n  Parameters: {t.get('parameters', {})}\n  Returns: {t.get('returns', '')}"
-            for t in role_tools
-        ])
+        if tool_descriptions is None:
+            tool_descriptions = render_tool_descriptions(role_tools)
         system_instruction = (
             "Bạn là một AI chuyên phân tích nhiệm vụ cho hệ thống Multi-Role Agent.\n"
             "Dựa trên prompt của vai trò và danh sách tool có sẵn dưới đây, "
@@ -73,17 +135,33 @@ class GeminiAnalyzerLLM:
             f"{example}\n"
             "TRẢ LẠI CHỈ JSON, KHÔNG THÊM BẤT KỲ VĂN BẢN NÀO KHÁC."
         )
+        return prompt
 
-        # Gọi Gemini (implementation may vary — dùng generate_content như ví dụ trước)
-        response = self.model.generate_content(prompt)
+    def analyze_task(self, base_prompt: str, user_question: str, role_tools: List[Dict[str, Any]], tool_descriptions: Optional[str] = None) -> str:
+        """
+        Gọi Gemini để phân tích nhiệm vụ.
+        -> Trả về CHUỖI chứa JSON (thô) theo schema:
+        {
+          "analysis": "...",
+          "required_tools": [
+            {"tool_name": "...", "params": {...}},
+            ...
+          ]
+        }
+        """
+        prompt = self._build_prompt(base_prompt, user_question, role_tools, tool_descriptions)
 
-        # Lấy text an toàn
-        raw_text = getattr(response, "text", None)
-        if raw_text is None:
-            # try other representations
-            raw_text = str(response)
+        # Gọi Gemini (implementation may vary — dùng generate_content như ví dụ trước)
+        response = _timed_generate(self.model, prompt, self.model_name)
+        return _response_text(response)
 
-        return raw_text.strip()
+    async def analyze_task_async(self, base_prompt: str, user_question: str, role_tools: List[Dict[str, Any]], tool_descriptions: Optional[str] = None) -> str:
+        """
+        Bản async của analyze_task.
+        """
+        prompt = self._build_prompt(base_prompt, user_question, role_tools, tool_descriptions)
+        response = await _atimed_generate(self.model, prompt, self.model_name)
+        return _response_text(response)
 
 class GeminiSynthesizerLLM:
     """
@@ -91,18 +169,74 @@ class GeminiSynthesizerLLM:
     → nhiệm vụ: tổng hợp kết quả từ tool và sinh câu trả lời cuối cùng
     """
     def __init__(self, model_name: str = "gemini-2.0-flash", api_key_env: str = "GOOGLE_API_KEY_2"):
-        api_key = os.getenv(api_key_env)
-        if not api_key:
-            raise ValueError(f"❌ Missing API key: {api_key_env}")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
+        # Client dùng chung từ pool; api_key_env chỉ là key được ưu tiên khi các key ngang nhau
+        self.model_name = model_name
+        self.model = get_client_pool().model(model_name, preferred_key=api_key_env)
 
     def run(self, prompt: str) -> str:
         try:
-            response = self.model.generate_content(prompt)
+            response = _timed_generate(self.model, prompt, self.model_name)
+            return response.text
+        except Exception as e:
+            return f"[GeminiSynthesizerLLM Error] {str(e)}"
+
+    async def run_async(self, prompt: str) -> str:
+        try:
+            response = await _atimed_generate(self.model, prompt, self.model_name)
             return response.text
         except Exception as e:
             return f"[GeminiSynthesizerLLM Error] {str(e)}"
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Sinh câu trả lời theo từng đoạn (token streaming).
+        Metrics của lời gọi được ghi một lần khi stream kết thúc.
+        """
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        try:
+            response = self.model.generate_content(prompt, stream=True)
+            for chunk in response:
+                text = _safe_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            error_text = f"[GeminiSynthesizerLLM Error] {str(e)}"
+            parts.append(error_text)
+            yield error_text
+        finally:
+            METRICS.record_llm_call(
+                prompt=prompt,
+                response="".join(parts),
+                duration_ms=(time.perf_counter() - t0) * 1000,
+                model=self.model_name,
+            )
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Bản async của stream.
+        """
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = _safe_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            error_text = f"[GeminiSynthesizerLLM Error] {str(e)}"
+            parts.append(error_text)
+            yield error_text
+        finally:
+            METRICS.record_llm_call(
+                prompt=prompt,
+                response="".join(parts),
+                duration_ms=(time.perf_counter() - t0) * 1000,
+                model=self.model_name,
+            )
         
         
 class GeminiChatParagraphSummarizer:
@@ -111,17 +245,11 @@ class GeminiChatParagraphSummarizer:
     """
 
     def __init__(self, model_name: str = "gemini-2.0-flash", api_key_env: str = "GOOGLE_API_KEY_3"):
-        api_key = os.getenv(api_key_env)
-        if not api_key:
-            raise ValueError(f"❌ Missing API key: {api_key_env}")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
+        # Client dùng chung từ pool; api_key_env chỉ là key được ưu tiên khi các key ngang nhau
+        self.model_name = model_name
+        self.model = get_client_pool().model(model_name, preferred_key=api_key_env)
 
-    def summarize_each_exchange(self, chat_json: list) -> str:
-        """
-        Nhận đầu vào: danh sách hội thoại [{user, chatbot}]
-        → Trả về: mỗi phần tử được viết thành 1 đoạn riêng, có xuống dòng.
-        """
+    def _build_prompt(self, chat_json: list) -> str:
         chat_data = json.dumps(chat_json, ensure_ascii=False, indent=2)
         system_prompt = f"""
         Bạn là một chuyên gia ngôn ngữ có nhiệm vụ viết lại từng cặp hội thoại giữa người dùng và chatbot
@@ -136,8 +264,21 @@ class GeminiChatParagraphSummarizer:
         - Không thêm số thứ tự, không dùng gạch đầu dòng.
         - Đầu ra chỉ là các đoạn văn, không kèm ký hiệu hay chú thích khác.
         """
-        response = self.model.generate_content(system_prompt)
-        raw_text = getattr(response, "text", None)
-        if raw_text is None:
-            raw_text = str(response)
-        return raw_text.strip()
\ No newline at end of file
+        return system_prompt
+
+    def summarize_each_exchange(self, chat_json: list) -> str:
+        """
+        Nhận đầu vào: danh sách hội thoại [{user, chatbot}]
+        → Trả về: mỗi phần tử được viết thành 1 đoạn riêng, có xuống dòng.
+        """
+        system_prompt = self._build_prompt(chat_json)
+        response = _timed_generate(self.model, system_prompt, self.model_name)
+        return _response_text(response)
+
+    async def summarize_each_exchange_async(self, chat_json: list) -> str:
+        """
+        Bản async của summarize_each_exchange.
+        """
+        system_prompt = self._build_prompt(chat_json)
+        response = await _atimed_generate(self.model, system_prompt, self.model_name)
+        return _response_text(response)
\ No newline at end of file
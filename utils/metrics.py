@@ -0,0 +1,251 @@
+# utils/metrics.py
+
+"""
+Lớp đo đạc (instrumentation) cho MultiRoleAgentGraph.
+
+- Mỗi lần chạy graph là một span "run", mỗi node là một span "node".
+- Mỗi span ghi lại: thời gian thực thi, số lần gọi LLM, kích thước prompt/response
+  (tính theo ký tự) và lỗi nếu có.
+- Span được ghi ra file JSONL (mỗi dòng 1 span) và đưa vào histogram trong bộ nhớ
+  để tính p50/p95/p99 cho từng node.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_DEFAULT_SINK = Path(__file__).resolve().parents[1] / "logs" / "agent_metrics.jsonl"
+
+# Span đang mở trong luồng/tác vụ hiện tại (để các wrapper LLM biết ghi vào đâu)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    Một khoảng đo: run (cả graph) hoặc node (1 bước trong graph).
+    """
+    def __init__(self, name: str, kind: str, run_id: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.kind = kind
+        self.run_id = run_id
+        self.parent = parent
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.llm_calls = 0
+        self.llm_ms = 0.0
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.error: Optional[str] = None
+
+    def add_llm_call(self, prompt_chars: int, response_chars: int, duration_ms: float) -> None:
+        self.llm_calls += 1
+        self.llm_ms += duration_ms
+        self.prompt_chars += prompt_chars
+        self.response_chars += response_chars
+
+    def finish(self) -> None:
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "llm_calls": self.llm_calls,
+            "llm_ms": round(self.llm_ms, 3),
+            "prompt_chars": self.prompt_chars,
+            "response_chars": self.response_chars,
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+class MetricsRecorder:
+    """
+    Thu thập span + counter, thread-safe.
+
+    - window: số mẫu gần nhất giữ lại cho mỗi histogram (giữ bộ nhớ cố định).
+    - sink_path: file JSONL để ghi span; None để tắt.
+    """
+    def __init__(self, sink_path: Optional[str] = None, window: int = 2000):
+        self.sink_path = Path(sink_path) if sink_path else None
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._open_runs: Dict[str, Span] = {}
+
+    # ------------------------------------------
+    # ⏱️ Span
+    # ------------------------------------------
+    def start_span(self, name: str, kind: str = "node", run_id: Optional[str] = None, **attrs) -> Span:
+        """
+        Mở span thủ công (không gắn vào context hiện tại), kết thúc bằng finish_span.
+        Dùng khi span kéo dài qua nhiều lần yield (ví dụ stream câu trả lời).
+        Span node được gắn vào span run cùng run_id (nếu đang mở)
+        để cộng dồn số lần gọi LLM và kích thước prompt/response.
+        """
+        parent = _current_span.get()
+        if run_id is None:
+            run_id = parent.run_id if parent else str(uuid.uuid4())
+        if kind != "run":
+            with self._lock:
+                parent = self._open_runs.get(run_id, parent)
+
+        span = Span(name, kind, run_id, parent=parent, **attrs)
+        if kind == "run":
+            with self._lock:
+                self._open_runs[run_id] = span
+        return span
+
+    def finish_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        if error is not None and span.error is None:
+            span.error = f"{type(error).__name__}: {error}"
+        span.finish()
+        if span.kind == "run":
+            with self._lock:
+                self._open_runs.pop(span.run_id, None)
+        self._record(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "node", run_id: Optional[str] = None, **attrs):
+        """
+        Mở một span trong context hiện tại (các lời gọi LLM bên trong được tính vào span này).
+        """
+        span = self.start_span(name, kind=kind, run_id=run_id, **attrs)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Generator bị đóng ở context khác (ví dụ stream bị bỏ dở)
+                pass
+            self.finish_span(span, error)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def record_llm_call(self, prompt: str, response: Optional[str], duration_ms: float, model: str = "") -> None:
+        """
+        Gọi từ các wrapper LLM sau mỗi lần generate_content.
+        Ghi vào span hiện tại và các span cha (node -> run).
+        """
+        prompt_chars = len(prompt or "")
+        response_chars = len(response or "")
+        span = _current_span.get()
+        with self._lock:
+            while span is not None:
+                span.add_llm_call(prompt_chars, response_chars, duration_ms)
+                span = span.parent
+        self.observe(f"llm.{model}" if model else "llm", duration_ms)
+
+    # ------------------------------------------
+    # 📊 Counter & histogram
+    # ------------------------------------------
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value_ms: float) -> None:
+        with self._lock:
+            self._samples[name].append(value_ms)
+
+    def percentiles(self, name: str) -> Dict[str, float]:
+        with self._lock:
+            values = sorted(self._samples.get(name, ()))
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 3),
+            "p50": round(_percentile(values, 50), 3),
+            "p95": round(_percentile(values, 95), 3),
+            "p99": round(_percentile(values, 99), 3),
+            "max": round(values[-1], 3),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Trả về toàn bộ histogram + counter hiện tại (dùng cho log/dashboard).
+        """
+        with self._lock:
+            names = list(self._samples.keys())
+            counters = dict(self._counters)
+        return {
+            "histograms": {name: self.percentiles(name) for name in names},
+            "counters": counters,
+        }
+
+    def format_summary(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, stats in sorted(snapshot["histograms"].items()):
+            if not stats.get("count"):
+                continue
+            lines.append(
+                f"{name:<28} n={stats['count']:<5} p50={stats['p50']:.0f}ms "
+                f"p95={stats['p95']:.0f}ms p99={stats['p99']:.0f}ms"
+            )
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<28} {value}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+
+    # ------------------------------------------
+    # 📝 Ghi span
+    # ------------------------------------------
+    def _record(self, span: Span) -> None:
+        self.observe(f"{span.kind}.{span.name}", span.duration_ms or 0.0)
+        if span.error:
+            self.increment(f"{span.kind}.{span.name}.errors")
+        if self.sink_path is None:
+            return
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                self.sink_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.sink_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            print(f"⚠️ Không ghi được metrics ra {self.sink_path}: {e}")
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    """Nội suy tuyến tính giữa 2 điểm gần nhất (giống numpy.percentile mặc định)."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _sink_from_env() -> Optional[str]:
+    value = os.getenv("AGENT_METRICS_JSONL", str(_DEFAULT_SINK))
+    if value.strip().lower() in ("", "0", "off", "none"):
+        return None
+    return value
+
+
+METRICS = MetricsRecorder(sink_path=_sink_from_env())
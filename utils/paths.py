@@ -0,0 +1,40 @@
+# utils/paths.py
+
+"""
+Đường dẫn dữ liệu của dự án.
+
+Mặc định mọi thứ nằm dưới CHATBOT_BASE_DIR (giữ giá trị cũ D:/Chatbot_Data4Life/v1);
+từng file có thể ghi đè riêng bằng biến môi trường tương ứng.
+"""
+
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = Path(os.getenv("CHATBOT_BASE_DIR", "D:/Chatbot_Data4Life/v1"))
+
+
+def resolve_path(env_name: str, *default_parts: str) -> str:
+    """
+    Trả về giá trị biến môi trường `env_name` nếu có, ngược lại BASE_DIR/<default_parts>.
+    """
+    value = os.getenv(env_name)
+    if value:
+        return value
+    return str(BASE_DIR.joinpath(*default_parts))
+
+
+BASE_PROMPT_PATH = resolve_path("BASE_PROMPT_PATH", "prompt", "General_Prompt.docx")
+TOOL_MANIFEST_PATH = resolve_path("TOOL_MANIFEST_PATH", "prompt", "tool.yaml")
+INTENTS_PATH = resolve_path("ROUTER_INTENTS_PATH", "prompt", "intents.yaml")
+EMBEDDING_MODEL_PATH = resolve_path("EMBEDDING_MODEL_PATH", "models", "Vietnamese_Embedding")
+EMBEDDING_ONNX_PATH = resolve_path("EMBEDDING_ONNX_PATH", "models", "Vietnamese_Embedding_onnx")
+RERANKER_MODEL_PATH = resolve_path("RERANKER_MODEL_PATH", "models", "Vietnamese_Reranker")
+FAQ_DB_PATH = resolve_path("FAQ_DB_PATH", "chroma_db", "chroma_db_faqs")
+FAQ_COLLECTION_NAME = os.getenv("FAQ_COLLECTION_NAME", "faqs_collection")
+STYLE_CSS_PATH = resolve_path("STYLE_CSS_PATH", "style.css")
+FAQ_BUILD_CONFIG_PATH = resolve_path("FAQ_BUILD_CONFIG_PATH", "create_vecto_db", "config.json")
+FAQ_BUILD_LOG_DIR = resolve_path("FAQ_BUILD_LOG_DIR", "create_vecto_db", "logs", "logs")